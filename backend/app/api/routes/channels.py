@@ -14,6 +14,7 @@ import app.crud.channel as crud_channel
 
 import app.schemas.channel as schemas_channel
 import app.crud.message as crud_message
+import app.crud.widget as crud_widget
 import app.crud.user as crud_user
 import app.crud.bot as crud_bot
 from app.models import BotModel, UserModel
@@ -33,8 +34,7 @@ from app.utils.dict import recursive_search_keys
 from app.schemas.user import UserCreate
 import app.utils.message as message_utils
 from app.managers.data_manager import DataManager
-from redis.asyncio import Redis
-from app.config import settings
+from app.redis_pool import cache_redis
 
 from app.database import sessionmanager
 import logging
@@ -364,8 +364,7 @@ async def update_channel(
     await session.commit()
     await session.refresh(channel, attribute_names=["variables"])
 
-    redis = Redis.from_url(settings.CACHE_REDIS_URL)
-    data_manager = DataManager(redis, sessionmanager.engine)
+    data_manager = DataManager(cache_redis(), sessionmanager.engine)
     await data_manager.update_bot_variables(channel_id, channel_in.variables.data)
     return channel
 
@@ -383,6 +382,7 @@ async def delete_channel(session: SessionDep, channel_id: UUID | str, current_us
             status_code=status.HTTP_403_FORBIDDEN,
             detail="The user doesn't have enough privileges.",
         )
-    await crud_channel.delete_channel(session, channel_id)
+    content_hashes = await crud_channel.delete_channel(session, channel_id)
     await session.commit()
+    await crud_widget.forget_widgets(*content_hashes)
     return Message(message="Channel deleted successfully.")
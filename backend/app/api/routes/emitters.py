@@ -13,7 +13,7 @@ from app.schemas.message import Message
 from app.api.dependencies.auth import get_current_user, CurrentUser, CurrentDeveloper, BotAccessChecker
 from app.models.access import AccessType
 from uuid import UUID
-from app.scheduler import scheduler, publish_emitter_event
+from app.engine.emitter_jobs import publish_emitter_event
 router = APIRouter()
 
 
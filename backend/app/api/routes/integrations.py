@@ -1,6 +1,7 @@
 """API endpoints для работы с интеграциями."""
+import asyncio
 from typing import Annotated, Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 
 # Импортируем интеграции для автоматической регистрации
@@ -11,11 +12,20 @@ except ImportError:
 
 from app.integrations.registry import registry
 from app.services.icon_service import icon_service
+from app.utils.etag import EtagCache, etag_response
+from app.config import settings
+from app.redis_pool import cache_redis
 from app.api.dependencies.auth import CurrentUser
 from app.api.dependencies.db import SessionDep
 
 router = APIRouter()
 
+if settings.ICON_URL_CACHE_REDIS:
+    icon_service.set_redis(cache_redis())
+
+# Каталог одинаков для всех пользователей; живет меньше запаса обновления presigned URL иконок
+catalog_cache = EtagCache(ttl=settings.ICON_CATALOG_CACHE_TTL)
+
 
 class IntegrationMetadataResponse(BaseModel):
     """Метаданные интеграции для API."""
@@ -45,6 +55,7 @@ class IntegrationCatalogResponse(BaseModel):
     description="Получить каталог всех доступных интеграций с метаданными"
 )
 async def get_integrations_catalog(
+    request: Request,
     current_user: CurrentUser,
     category: Annotated[Optional[str], Query(description="Filter by category")] = None,
     latest_only: Annotated[bool, Query(description="Return only latest versions")] = True
@@ -59,18 +70,25 @@ async def get_integrations_catalog(
     Returns:
         Каталог интеграций с метаданными и URL иконок
     """
+    body, etag = await catalog_cache.get((category, latest_only),
+                                         lambda: build_integrations_catalog(category, latest_only))
+    return etag_response(request, body, etag)
+
+
+async def build_integrations_catalog(category: Optional[str], latest_only: bool) -> IntegrationCatalogResponse:
     # Получаем список интеграций
     if category:
         metadata_list = registry.list_by_category(category, latest_only=latest_only)
     else:
         metadata_list = registry.list_all(latest_only=latest_only)
-    
+
+    # URL иконок получаем параллельно
+    icon_urls = await asyncio.gather(*(icon_service.get_icon_url(metadata.icon_s3_key)
+                                       for metadata in metadata_list))
+
     # Преобразуем в формат ответа с URL иконок
     items = []
-    for metadata in metadata_list:
-        # Получаем URL иконки из S3
-        icon_url = await icon_service.get_icon_url(metadata.icon_s3_key)
-        
+    for metadata, icon_url in zip(metadata_list, icon_urls):
         items.append(IntegrationMetadataResponse(
             id=metadata.id,
             version=metadata.version,
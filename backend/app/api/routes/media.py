@@ -1,52 +1,85 @@
-from uuid import UUID
+import logging
 from pathlib import Path
-from typing import Annotated, Any
+from urllib.parse import quote, unquote
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response, StreamingResponse
 
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from fastapi.responses import FileResponse, StreamingResponse
-from datetime import datetime, timedelta
 from app.config import settings
+from app.redis_pool import cache_redis
+from app.services.media_service import is_not_modified, media_resolver, parse_range
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 source_path = "/attachment/{file_name}"
 
+if settings.MEDIA_KEY_CACHE_REDIS:
+    media_resolver.set_redis(cache_redis())
+
+
+def _content_disposition(file_name: str) -> str:
+    return f"attachment; filename=\"{file_name}\"; filename*=UTF-8''{quote(file_name)}"
+
+
+async def serve_object(request: Request, meta: dict, file_name: str) -> Response:
+    """
+    Отдает объект S3 с поддержкой условного GET (ETag/Last-Modified) и Range.
+    С MEDIA_PRESIGNED_REDIRECT клиент перенаправляется за телом прямо в S3.
+    """
+    common = {
+        "ETag": meta.get("etag"),
+        "Last-Modified": meta.get("last_modified"),
+        "Cache-Control": f"private, max-age={settings.MEDIA_CACHE_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    common = {name: value for name, value in common.items() if value}
+
+    if is_not_modified(meta, request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=common)
+
+    if settings.MEDIA_PRESIGNED_REDIRECT:
+        from app.services.s3_service import generate_presigned_get_url
+        url = await generate_presigned_get_url(meta["key"], settings.MEDIA_PRESIGNED_TTL)
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
+
+    size = meta["size"]
+    range_header = request.headers.get("range")
+    # If-Range: диапазон только для той же версии объекта, иначе отдаем целиком
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range not in (meta.get("etag"), meta.get("last_modified")):
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**common, "Content-Range": f"bytes */{size}"})
+
+    headers = {**common, "Content-Disposition": _content_disposition(file_name)}
+    media_type = meta.get("content_type") or "application/octet-stream"
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(media_resolver.storage.iter_object(meta["key"]), media_type=media_type,
+                                 headers=headers)
+
+    first, last = byte_range
+    headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(media_resolver.storage.iter_object(meta["key"], byte_range), status_code=206,
+                             media_type=media_type, headers=headers)
+
 
 @router.get(
     f"{source_path}"
 )
-async def get_media_file(file_name: str):
-    # Try S3 by key first
+async def get_media_file(file_name: str, request: Request):
+    # Ключ берем из таблицы вложений (с кешем), без перебора датированных папок в S3
     try:
-        from app.services.s3_service import object_exists, stream_object
-        # Try flat key first (legacy)
-        key = f"attachment/{file_name}"
-        if await object_exists(key):
-            iterator, headers = await stream_object(key)
-            disposition = f"attachment; filename=\"{file_name}\""
-            try:
-                disposition += f"; filename*=UTF-8''{file_name}"
-            except Exception:
-                pass
-            headers["Content-Disposition"] = disposition
-            return StreamingResponse(iterator, media_type=headers.get("Content-Type", "application/octet-stream"), headers=headers)
-
-        # Also try dated folders for recent 31 days
-        today = datetime.utcnow().date()
-        for days_ago in range(0, 31):
-            d = today - timedelta(days=days_ago)
-            dated_key = f"attachment/{d.strftime('%Y/%m/%d')}/{file_name}"
-            if await object_exists(dated_key):
-                iterator, headers = await stream_object(dated_key)
-                disposition = f"attachment; filename=\"{file_name}\""
-                try:
-                    disposition += f"; filename*=UTF-8''{file_name}"
-                except Exception:
-                    pass
-                headers["Content-Disposition"] = disposition
-                return StreamingResponse(iterator, media_type=headers.get("Content-Type", "application/octet-stream"), headers=headers)
-    except Exception:
-        pass
+        meta = await media_resolver.by_name(file_name)
+        if meta is not None:
+            return await serve_object(request, meta, file_name)
+    except Exception as e:
+        logger.warning(f"Media lookup failed for {file_name}: {e}")
 
     # Fallback to local filesystem for legacy
     file_path = Path("".join([str(settings.MEDIA_ROOT), source_path.format(file_name=file_name)]))
@@ -61,22 +94,14 @@ async def get_media_file(file_name: str):
 # New: stream by full S3 key path, e.g.
 # GET /media/attachment/2025/09/17/<random>.xlsx
 @router.get("/{path:path}")
-async def get_media_by_path(path: str):
-    from app.services.s3_service import object_exists, stream_object
+async def get_media_by_path(path: str, request: Request):
     # Normalize: allow missing 'attachment/' prefix
     normalized = path if path.startswith("attachment/") else f"attachment/{path}"
 
     # First try S3 by exact key
-    if await object_exists(normalized):
-        file_name = normalized.split('/')[-1]
-        iterator, headers = await stream_object(normalized)
-        disposition = f"attachment; filename=\"{file_name}\""
-        try:
-            disposition += f"; filename*=UTF-8''{file_name}"
-        except Exception:
-            pass
-        headers["Content-Disposition"] = disposition
-        return StreamingResponse(iterator, media_type=headers.get("Content-Type", "application/octet-stream"), headers=headers)
+    meta = await media_resolver.by_key(normalized)
+    if meta is not None:
+        return await serve_object(request, meta, normalized.split('/')[-1])
 
     # Fallback to local filesystem for legacy
     file_path = Path(str(settings.MEDIA_ROOT / normalized))
@@ -87,19 +112,10 @@ async def get_media_by_path(path: str):
 
 # Alternate access via query param for Swagger (slashes may be %-encoded)
 @router.get("/")
-async def get_media_by_key(key: str):
-    from urllib.parse import unquote
-    from app.services.s3_service import object_exists, stream_object
+async def get_media_by_key(key: str, request: Request):
     raw_key = unquote(key)
     normalized = raw_key if raw_key.startswith("attachment/") else f"attachment/{raw_key}"
-    if await object_exists(normalized):
-        file_name = normalized.split('/')[-1]
-        iterator, headers = await stream_object(normalized)
-        disposition = f"attachment; filename=\"{file_name}\""
-        try:
-            disposition += f"; filename*=UTF-8''{file_name}"
-        except Exception:
-            pass
-        headers["Content-Disposition"] = disposition
-        return StreamingResponse(iterator, media_type=headers.get("Content-Type", "application/octet-stream"), headers=headers)
-    raise HTTPException(status_code=404, detail="File not found.")
\ No newline at end of file
+    meta = await media_resolver.by_key(normalized)
+    if meta is not None:
+        return await serve_object(request, meta, normalized.split('/')[-1])
+    raise HTTPException(status_code=404, detail="File not found.")
@@ -157,6 +157,7 @@ async def update_message(
     await check_message_permissions(session, message_id, current_user)
     message = await crud_message.update_message(session, message_id, message_in)
     await session.commit()
+    await crud_message.forget_message(message.id)
     await session.refresh(message, attribute_names=["sender", "recipient", "widget", "attachments"])
     return message
 
@@ -170,4 +171,5 @@ async def delete_message(session: SessionDep, message_id: Union[UUID, str], curr
     await check_message_permissions(session, message_id, current_user)
     await crud_message.delete_message(session, message_id)
     await session.commit()
+    await crud_message.forget_message(message_id)
     return Message(message="Message deleted successfully.")
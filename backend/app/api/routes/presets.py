@@ -1,11 +1,14 @@
 """API endpoints для работы с presets."""
+import asyncio
 from typing import Annotated, Optional, List, Union
 from uuid import UUID
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel
 
 from app.presets import registry as preset_registry
 from app.services.icon_service import icon_service
+from app.utils.etag import EtagCache, etag_response
+from app.config import settings
 from app.api.dependencies.auth import CurrentUser
 from app.api.dependencies.db import SessionDep
 from app.api.dependencies.auth import BotAccessChecker
@@ -19,6 +22,8 @@ import app.schemas.connection as schemas_connection
 
 router = APIRouter()
 
+catalog_cache = EtagCache(ttl=settings.ICON_CATALOG_CACHE_TTL)
+
 
 class PresetMetadataResponse(BaseModel):
     """Метаданные preset для API."""
@@ -60,6 +65,7 @@ class PresetCreateStepResponse(BaseModel):
     description="Получить каталог всех доступных presets с метаданными"
 )
 async def get_presets_catalog(
+    request: Request,
     current_user: CurrentUser,
     category: Annotated[Optional[str], Query(description="Filter by category")] = None
 ) -> PresetCatalogResponse:
@@ -72,18 +78,24 @@ async def get_presets_catalog(
     Returns:
         Каталог presets с метаданными и URL иконок
     """
+    body, etag = await catalog_cache.get(category, lambda: build_presets_catalog(category))
+    return etag_response(request, body, etag)
+
+
+async def build_presets_catalog(category: Optional[str]) -> PresetCatalogResponse:
     # Получаем список presets
     if category:
         metadata_list = preset_registry.list_by_category(category)
     else:
         metadata_list = preset_registry.list_all()
-    
+
+    # URL иконок получаем параллельно
+    icon_urls = await asyncio.gather(*(icon_service.get_icon_url(metadata.icon_s3_key)
+                                       for metadata in metadata_list))
+
     # Преобразуем в формат ответа с URL иконок
     items = []
-    for metadata in metadata_list:
-        # Получаем URL иконки из S3
-        icon_url = await icon_service.get_icon_url(metadata.icon_s3_key)
-        
+    for metadata, icon_url in zip(metadata_list, icon_urls):
         items.append(PresetMetadataResponse(
             id=metadata.id,
             name=metadata.name,
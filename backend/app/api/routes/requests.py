@@ -2,7 +2,7 @@ from typing import Annotated, Any, Union
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from redis.asyncio import Redis
+from app.redis_pool import cache_redis
 from sqlalchemy import select
 from app.models.bot import BotModel
 from app.models.connection import ConnectionGroupModel
@@ -14,7 +14,6 @@ import app.schemas.request as schemas_request
 from app.api.dependencies.db import SessionDep
 from app.auth.credentials_resolver import CredentialsResolver
 from app.auth.service import AuthService
-from app.config import settings
 from app.engine.bot_processor import ConnectionResponseHandler
 from app.engine.variables import variable_substitution_pydantic
 from app.managers.data_manager import DataManager
@@ -191,7 +190,7 @@ async def execute_request(
             prepared_request=prepared.model_dump(),
         )
 
-    dm = DataManager(Redis.from_url(settings.REDIS_URL), session.bind)
+    dm = DataManager(cache_redis(), session.bind)
     bot = BotProcessor(**(await dm.get_bot(request_in.bot_id)))
     resolver = CredentialsResolver(dm)
     auth_service = AuthService(resolver)
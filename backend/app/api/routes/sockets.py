@@ -1,10 +1,16 @@
 import asyncio
+import json
 import logging
+import time
 from uuid import UUID
 
-from fastapi import (APIRouter, Depends, WebSocket, WebSocketDisconnect)
+from fastapi import (APIRouter, Depends, WebSocket, WebSocketDisconnect, WebSocketException, status)
 
+from app.config import settings
+from app.database import sessionmanager
 from app.managers.websocket import ChannelWebSocketManager, BotWebSocketManager
+from app.api.dependencies.auth import get_token_data
+from app.api.dependencies.strategies.factory import AuthStrategyFactory
 from app.api.dependencies.websocket import AuthWebsocketDataChannelDep, AuthWebsocketDataBotDep
 from app.managers.websocket import WebSocketManagerBase
 
@@ -15,6 +21,12 @@ logger = logging.getLogger(__name__)
 channel_websocket_manager = ChannelWebSocketManager()
 bot_websocket_manager = BotWebSocketManager()
 
+# Менеджеры, на сущности которых можно подписаться кадром subscribe
+websocket_managers: dict[str, WebSocketManagerBase] = {
+    "channel": channel_websocket_manager,
+    "bot": bot_websocket_manager,
+}
+
 
 async def notify_channel(channel_id: UUID | str, message) -> None:
     await channel_websocket_manager.notify_channel(channel_id, message)
@@ -24,6 +36,128 @@ async def notify_bot(bot_id: UUID | str, message) -> None:
     await bot_websocket_manager.notify_bot(bot_id, message)
 
 
+async def authorize_subscription(entity_type: str, entity_id: str, token: str) -> dict:
+    """Проверяет доступ к сущности так же, как при подключении к ее эндпоинту."""
+    token_data = get_token_data(token)
+    strategy = AuthStrategyFactory.get_strategy(entity_type)
+    async with sessionmanager.session() as session:
+        return await strategy.authorize(session, entity_id, token_data)
+
+
+class WebSocketSession:
+    """
+    Одно клиентское соединение. Сервер шлет сообщения сущностей, на которые подписан сокет;
+    клиент может (но не обязан) слать JSON-кадры:
+      {"type": "subscribe" | "unsubscribe", "entity_type": "channel" | "bot", "entity_id": ...}
+          -> {"type": "subscribed" | "unsubscribed", "entity_type": ..., "entity_id": ...}
+      {"type": "ping"} -> {"type": "pong"}
+      {"type": "pong"} — ответ на ping сервера
+    Ошибки приходят кадром {"type": "error", "reason": ...}.
+
+    Heartbeat на уровне кадров включается только у клиентов, которые знают этот протокол:
+    подключились с ?heartbeat=1 или прислали хотя бы один кадр. Им раз в WS_PING_INTERVAL
+    молчания приходит {"type": "ping"}, а соединение без кадров дольше WS_IDLE_TIMEOUT
+    закрывается с кодом 1001. Клиенты, которые только слушают, не получают ping и не
+    закрываются по простою; мертвые соединения у них отсекает ping/pong протокола WebSocket.
+    """
+
+    def __init__(self, websocket: WebSocket, connection_uuid, token: str | None):
+        self.websocket = websocket
+        self.connection_uuid = connection_uuid
+        self.token = token
+        self.connection = None
+        self.subscriptions: set[tuple[str, str]] = set()
+        self.last_seen = time.monotonic()
+        self.heartbeat = websocket.query_params.get("heartbeat") in ("1", "true")
+
+    def send(self, frame: dict) -> None:
+        self.connection.send(json.dumps(frame, default=str))
+
+    async def subscribe(self, entity_type: str, entity_id) -> None:
+        key = (entity_type, str(entity_id))
+        if key in self.subscriptions:
+            return
+        await websocket_managers[entity_type].add_connection(entity_id, self.connection_uuid, self.connection)
+        self.subscriptions.add(key)
+
+    async def unsubscribe(self, entity_type: str, entity_id) -> None:
+        key = (entity_type, str(entity_id))
+        if key not in self.subscriptions:
+            return
+        self.subscriptions.discard(key)
+        await websocket_managers[entity_type].remove_connection(entity_id, self.connection_uuid)
+
+    async def handle_frame(self, raw: str) -> None:
+        try:
+            frame = json.loads(raw)
+        except ValueError:
+            self.send({"type": "error", "reason": "Invalid JSON"})
+            return
+        if not isinstance(frame, dict):
+            self.send({"type": "error", "reason": "Invalid frame"})
+            return
+
+        frame_type = frame.get("type")
+        if frame_type == "ping":
+            self.send({"type": "pong"})
+            return
+        if frame_type == "pong":
+            return
+        if frame_type not in ("subscribe", "unsubscribe"):
+            self.send({"type": "error", "reason": f"Unknown frame type: {frame_type}"})
+            return
+
+        entity_type, entity_id = frame.get("entity_type"), frame.get("entity_id")
+        if entity_type not in websocket_managers or not entity_id:
+            self.send({"type": "error", "reason": "entity_type and entity_id are required"})
+            return
+
+        if frame_type == "unsubscribe":
+            await self.unsubscribe(entity_type, entity_id)
+            self.send({"type": "unsubscribed", "entity_type": entity_type, "entity_id": entity_id})
+            return
+
+        if len(self.subscriptions) >= settings.WS_MAX_SUBSCRIPTIONS:
+            self.send({"type": "error", "reason": "Too many subscriptions"})
+            return
+        try:
+            auth_data = await authorize_subscription(entity_type, entity_id, self.token)
+        except WebSocketException as e:
+            self.send({"type": "error", "reason": e.reason, "entity_type": entity_type, "entity_id": entity_id})
+            return
+        except Exception as e:
+            logger.warning(f"Ошибка авторизации подписки {entity_type} {entity_id}: {e}")
+            self.send({"type": "error", "reason": "Ошибка авторизации", "entity_type": entity_type,
+                       "entity_id": entity_id})
+            return
+        await self.subscribe(entity_type, auth_data["entity"]["id"])
+        self.send({"type": "subscribed", "entity_type": entity_type, "entity_id": entity_id})
+
+    async def receive_loop(self) -> None:
+        """Ждет кадры клиента; с heartbeat по таймауту чтения шлет ping или закрывает простаивающее соединение."""
+        while not self.connection.closed:
+            try:
+                raw = await asyncio.wait_for(self.websocket.receive_text(), timeout=settings.WS_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                if not self.heartbeat:
+                    continue
+                if time.monotonic() - self.last_seen >= settings.WS_IDLE_TIMEOUT:
+                    logger.info(f"Соединение {self.connection_uuid} закрыто по простою")
+                    await self.connection.close(code=status.WS_1001_GOING_AWAY)
+                    return
+                self.send({"type": "ping"})
+                continue
+            self.last_seen = time.monotonic()
+            self.heartbeat = True
+            await self.handle_frame(raw)
+
+    async def close(self) -> None:
+        for entity_type, entity_id in list(self.subscriptions):
+            await self.unsubscribe(entity_type, entity_id)
+        if self.connection is not None:
+            await self.connection.close()
+
+
 async def websocket_handler(websocket: WebSocket, auth_data: dict, websocket_manager: WebSocketManagerBase):
     user = auth_data["user"]
     entity = auth_data["entity"]
@@ -32,17 +166,19 @@ async def websocket_handler(websocket: WebSocket, auth_data: dict, websocket_man
 
     # Принимаем WebSocket-соединение
     await websocket.accept()
-    await websocket_manager.add_connection(entity['id'], connection_uuid, websocket)
+    ws_session = WebSocketSession(websocket, connection_uuid, websocket.query_params.get("token"))
+    ws_session.connection = websocket_manager.open_connection(websocket)
+    entity_type = next(name for name, manager in websocket_managers.items() if manager is websocket_manager)
+    await ws_session.subscribe(entity_type, entity['id'])
 
     try:
-        while True:
-            await asyncio.sleep(0.5)
+        await ws_session.receive_loop()
     except WebSocketDisconnect:
         logger.info(f"Соединение с сущностью {entity['id']} закрыто пользователем {user['id']}.")
     except Exception as e:
         logger.error(f"Непредвиденная ошибка в WebSocket-соединении с сущностью {entity['id']}: {e}")
     finally:
-        await websocket_manager.remove_connection(entity['id'], connection_uuid)
+        await ws_session.close()
         logger.info(f"Соединение с сущностью {entity['id']} закрыто.")
 
 
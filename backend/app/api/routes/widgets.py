@@ -141,8 +141,10 @@ async def update_widget(
     """
     Update a widget.
     """
+    content_hash = (await crud_widget.get_widget(session, widget_id)).content_hash
     widget = await crud_widget.update_widget(session, widget_id, widget_in)
     await session.commit()
+    await crud_widget.forget_widgets(content_hash)
     await session.refresh(widget, ["owner"])
     return widget
 
@@ -154,6 +156,8 @@ async def delete_widget(session: SessionDep, widget_id: Union[UUID, str]) -> Mes
     """
     Delete a widget.
     """
+    content_hash = (await crud_widget.get_widget(session, widget_id)).content_hash
     await crud_widget.delete_widget(session, widget_id)
     await session.commit()
+    await crud_widget.forget_widgets(content_hash)
     return Message(message="Widget deleted successfully.")
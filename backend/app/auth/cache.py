@@ -1,17 +1,44 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import logging
 import time
-from typing import Optional, Tuple, Dict
+from typing import Awaitable, Callable, Optional, Tuple, Dict
+
 from app.auth.types import AccessToken
+from app.config import settings
+from app.managers.local_cache import local_cache
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, str, str, str, str]
 
 
 class TokenCache:
     """
-    Простой in-memory кеш access-токенов.
-    Ключ строю из (bot_id, provider, profile, strategy, scopes_fingerprint).
+    Кеш access-токенов процесса.
+    Ключ строю из (bot_id, provider, profile, strategy, scopes_fingerprint, credentials_id).
+    L1 — словарь в памяти, L2 (опционально) — Redis, общий для всех реплик консьюмера.
+    Параллельные промахи по одному ключу ждут один обмен токена (singleflight),
+    а токен, которому осталось жить меньше refresh_before секунд, обновляется в фоне.
+    Токены без срока жизни живут в обоих уровнях не дольше static_ttl секунд.
+    При изменении кредов ключ auth:token:{bot_id}:{provider}:{strategy} рассылается
+    через INVALIDATION_CHANNEL, и каждая реплика сбрасывает свои записи (invalidate).
     """
 
-    def __init__(self):
-        self._store: Dict[Tuple[str, str, str, str, str], AccessToken] = {}
+    EXPIRY_MARGIN = 30  # сек запас до истечения
+    REDIS_PREFIX = "auth:token:"
+
+    def __init__(self, redis=None, refresh_before: float = 300, static_ttl: float = 3600):
+        # Значение — (срок хранения в L1, токен); у токенов со сроком жизни срок хранения не ограничен
+        self._store: Dict[CacheKey, Tuple[float, AccessToken]] = {}
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self._redis = redis
+        self.refresh_before = refresh_before
+        self.static_ttl = static_ttl
+
+    def set_redis(self, redis) -> None:
+        self._redis = redis
 
     @staticmethod
     def _fingerprint_scopes(scopes: Optional[list[str]]) -> str:
@@ -23,6 +50,52 @@ class TokenCache:
     def _now() -> float:
         return time.time()
 
+    def _key(self, bot_id: str, provider: str, profile: str, strategy: str,
+             scopes: Optional[list[str]], credentials_id: Optional[str]) -> CacheKey:
+        return (str(bot_id), provider, profile, strategy, self._fingerprint_scopes(scopes), str(credentials_id or ""))
+
+    def _is_expired(self, token: AccessToken) -> bool:
+        return bool(token.expires_at) and token.expires_at <= (self._now() + self.EXPIRY_MARGIN)
+
+    def _needs_refresh(self, token: AccessToken) -> bool:
+        return bool(token.expires_at) and token.expires_at <= (self._now() + self.refresh_before)
+
+    def _get_valid(self, key: CacheKey) -> Optional[AccessToken]:
+        entry = self._store.get(key)
+        if not entry:
+            return None
+        keep_until, token = entry
+        if self._is_expired(token) or keep_until <= self._now():
+            # протух — удаляю
+            self._store.pop(key, None)
+            return None
+        return token
+
+    def _remember(self, key: CacheKey, token: AccessToken) -> None:
+        keep_until = float("inf") if token.expires_at else self._now() + self.static_ttl
+        self._store[key] = (keep_until, token)
+
+    def invalidate(self, bot_id: str, provider: str, strategy: Optional[str] = None) -> None:
+        """Сбрасывает токены кредов бота в L1; начатые обмены по ним результат не сохранят."""
+        for key in [*self._store, *self._inflight]:
+            if key[0] == str(bot_id) and key[1] == provider and strategy in (None, key[3]):
+                self._store.pop(key, None)
+                self._inflight.pop(key, None)
+
+    def _on_invalidate(self, message: str) -> None:
+        parts = message[len(self.REDIS_PREFIX):].split(":", 2)
+        if len(parts) < 2:
+            return
+        self.invalidate(parts[0], parts[1], parts[2] if len(parts) == 3 else None)
+
+    @classmethod
+    def invalidation_key(cls, bot_id: str, provider: str, strategy: str) -> str:
+        return f"{cls.REDIS_PREFIX}{bot_id}:{provider}:{strategy}"
+
+    @classmethod
+    def redis_pattern(cls, bot_id: str, provider: str) -> str:
+        return f"{cls.REDIS_PREFIX}{bot_id}:{provider}:*"
+
     def get(
         self,
         *,
@@ -31,16 +104,9 @@ class TokenCache:
         profile: str,
         strategy: str,
         scopes: Optional[list[str]] = None,
+        credentials_id: Optional[str] = None,
     ) -> Optional[AccessToken]:
-        key = (bot_id, provider, profile, strategy, self._fingerprint_scopes(scopes))
-        token = self._store.get(key)
-        if not token:
-            return None
-        if token.expires_at and token.expires_at <= (self._now() + 30):  # 30 сек запас
-            # протух — удаляю
-            self._store.pop(key, None)
-            return None
-        return token
+        return self._get_valid(self._key(bot_id, provider, profile, strategy, scopes, credentials_id))
 
     def put(
         self,
@@ -51,6 +117,106 @@ class TokenCache:
         strategy: str,
         scopes: Optional[list[str]],
         token: AccessToken,
+        credentials_id: Optional[str] = None,
     ) -> None:
-        key = (bot_id, provider, profile, strategy, self._fingerprint_scopes(scopes))
-        self._store[key] = token
+        self._remember(self._key(bot_id, provider, profile, strategy, scopes, credentials_id), token)
+
+    async def get_or_fetch(
+        self,
+        *,
+        bot_id: str,
+        provider: str,
+        profile: str,
+        strategy: str,
+        scopes: Optional[list[str]] = None,
+        credentials_id: Optional[str] = None,
+        fetch: Callable[[], Awaitable[AccessToken]],
+    ) -> AccessToken:
+        """
+        Возвращает токен из кеша или получает его через fetch.
+        Если токен скоро истечет — отдаю текущий и обновляю его в фоне.
+        """
+        if self._redis is not None:
+            # Сбросы токенов от других реплик приходят через подписку LocalCache
+            local_cache.ensure_listener(self._redis)
+        key = self._key(bot_id, provider, profile, strategy, scopes, credentials_id)
+        token = self._get_valid(key)
+        if token:
+            if self._needs_refresh(token) and key not in self._inflight:
+                self._start_load(key, fetch, background=True)
+            return token
+
+        task = self._inflight.get(key) or self._start_load(key, fetch, background=False)
+        # shield: отмена одного ожидающего не должна отменять обмен для остальных
+        return await asyncio.shield(task)
+
+    def _start_load(self, key: CacheKey, fetch: Callable[[], Awaitable[AccessToken]], background: bool) -> asyncio.Task:
+        task = asyncio.create_task(self._load(key, fetch))
+        self._inflight[key] = task
+
+        def _done(t: asyncio.Task) -> None:
+            if self._inflight.get(key) is t:
+                self._inflight.pop(key, None)
+            if t.cancelled():
+                return
+            error = t.exception()
+            if error and background:
+                logger.warning(f"Background token refresh failed for {key[1]}: {error}")
+
+        task.add_done_callback(_done)
+        return task
+
+    async def _load(self, key: CacheKey, fetch: Callable[[], Awaitable[AccessToken]]) -> AccessToken:
+        token = await self._redis_get(key)
+        if token and not self._needs_refresh(token):
+            self._remember(key, token)
+            return token
+
+        token = await fetch()
+        # Пока шел обмен, креды изменились (invalidate) — токен отдаю ожидающим, но не кеширую
+        if self._inflight.get(key) is asyncio.current_task():
+            self._remember(key, token)
+            await self._redis_set(key, token)
+        return token
+
+    def _redis_key(self, key: CacheKey) -> str:
+        # bot_id и provider в открытом виде, чтобы удалять токены кредов по шаблону
+        digest = hashlib.sha256("|".join(key).encode("utf-8")).hexdigest()
+        return f"{self.REDIS_PREFIX}{key[0]}:{key[1]}:{digest}"
+
+    async def _redis_get(self, key: CacheKey) -> Optional[AccessToken]:
+        if self._redis is None:
+            return None
+        try:
+            from app.utils.secret_box import decrypt_blob_to_dict
+            blob = await self._redis.get(self._redis_key(key))
+            if not blob:
+                return None
+            if isinstance(blob, bytes):
+                blob = blob.decode("utf-8")
+            token = AccessToken(**decrypt_blob_to_dict(blob))
+        except Exception as e:
+            logger.warning(f"Token cache redis read failed: {e}")
+            return None
+        return None if self._is_expired(token) else token
+
+    async def _redis_set(self, key: CacheKey, token: AccessToken) -> None:
+        if self._redis is None:
+            return
+        if token.expires_at:
+            ttl = int(token.expires_at - self._now() - self.EXPIRY_MARGIN)
+        else:
+            ttl = int(self.static_ttl)
+        if ttl <= 0:
+            return
+        try:
+            # Токены в Redis храню зашифрованными, как и креды в БД
+            from app.utils.secret_box import encrypt_dict_to_blob
+            await self._redis.set(self._redis_key(key), encrypt_dict_to_blob(token.model_dump()), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Token cache redis write failed: {e}")
+
+
+token_cache = TokenCache(refresh_before=settings.AUTH_TOKEN_REFRESH_BEFORE,
+                         static_ttl=settings.AUTH_TOKEN_STATIC_TTL)
+local_cache.on_invalidate(TokenCache.REDIS_PREFIX, token_cache._on_invalidate)
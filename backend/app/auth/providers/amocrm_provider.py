@@ -31,10 +31,6 @@ class AmoCrmProvider:
         strategy = str(creds_cfg.get("strategy", "oauth"))
         scopes = None  # у AmoCRM скоупы не участвуют в Bearer
 
-        cached = cache.get(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes)
-        if cached:
-            return cached
-
         payload = creds_cfg["payload"]
         base_domain = payload.get("base_domain")
         client_id = payload.get("client_id")
@@ -45,9 +41,11 @@ class AmoCrmProvider:
         if not (base_domain and client_id and client_secret and redirect_uri and refresh_token):
             raise RuntimeError("amocrm: missing base_domain/client_id/client_secret/redirect_uri/refresh_token")
 
-        token = await self._refresh(base_domain, client_id, client_secret, redirect_uri, refresh_token)
-        cache.put(bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes, token=token)
-        return token
+        return await cache.get_or_fetch(
+            bot_id=bot_id, provider=provider, profile=profile, strategy=strategy, scopes=scopes,
+            credentials_id=creds_cfg.get("id"),
+            fetch=lambda: self._refresh(base_domain, client_id, client_secret, redirect_uri, refresh_token),
+        )
 
     def apply_headers(self, headers: dict, token: AccessToken, hints: Mapping[str, Any]) -> None:
         headers["Authorization"] = f"{token.token_type} {token.access_token}"
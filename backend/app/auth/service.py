@@ -2,22 +2,32 @@ import uuid
 from urllib.parse import urlparse
 from typing import Mapping, Any, Optional
 
-from app.auth.cache import TokenCache
+from app.auth.cache import TokenCache, token_cache
 from app.auth.providers.google_provider import GoogleProvider
 from app.auth.providers.amocrm_provider import AmoCrmProvider
 from app.auth.providers.yandex_provider import YandexCloudProvider, YandexIdOAuthProvider
 
 
+# Провайдеры не хранят состояния — один набор на процесс
+_PROVIDERS = {
+    "google": GoogleProvider(),
+    "amocrm": AmoCrmProvider(),
+    "yandex_cloud": YandexCloudProvider(),
+    "yandex_id": YandexIdOAuthProvider(),
+}
+
+
 class AuthService:
-    def __init__(self, resolver):
+    """
+    Подставляет авторизацию во внешние запросы бота.
+    Токены берутся из общего кеша процесса, поэтому сервис дешево создавать
+    на каждое сообщение: обмен токена происходит только при промахе.
+    """
+
+    def __init__(self, resolver, cache: Optional[TokenCache] = None):
         self._resolver = resolver
-        self._cache = TokenCache()
-        self._providers = {
-            "google": GoogleProvider(),
-            "amocrm": AmoCrmProvider(),
-            "yandex_cloud": YandexCloudProvider(),
-            "yandex_id": YandexIdOAuthProvider(),
-        }
+        self._cache = cache or token_cache
+        self._providers = _PROVIDERS
 
     async def apply(
         self,
@@ -60,6 +60,13 @@ class Settings(BaseSettings):
     STATIC_ROOT: Path = BASE_DIR / STATIC_URL
     TEMPLATES_ROOT: Path = BASE_DIR / "templates"
     TIME_ZONE: str = "Europe/Moscow"
+    # Планировщик эмиттеров: задачи в Redis, выполняет их только реплика-лидер
+    SCHEDULER_LEADER_TTL: float = float(os.getenv("SCHEDULER_LEADER_TTL") or 15)
+    SCHEDULER_LEADER_RENEW_INTERVAL: float = float(os.getenv("SCHEDULER_LEADER_RENEW_INTERVAL") or 5)
+    SCHEDULER_STORE_POLL_INTERVAL: float = float(os.getenv("SCHEDULER_STORE_POLL_INTERVAL") or 5)
+    SCHEDULER_MISFIRE_GRACE_TIME: int = int(os.getenv("SCHEDULER_MISFIRE_GRACE_TIME") or 60)
+    # Массовая отправка эмиттеров: кеш исходных сообщений и каналов ботов между запусками
+    EMITTER_CACHE_TTL: float = float(os.getenv("EMITTER_CACHE_TTL") or 60)
 
     MAX_LOG_SIZE: int = 4096
 
@@ -70,6 +77,21 @@ class Settings(BaseSettings):
     S3_ACCESS_KEY: str | None = os.getenv("S3_ACCESS_KEY")
     S3_SECRET_KEY: str | None = os.getenv("S3_SECRET_KEY")
     S3_BUCKET: str = os.getenv("S3_BUCKET", "dbcv-media")
+    S3_MAX_POOL_CONNECTIONS: int = int(os.getenv("S3_MAX_POOL_CONNECTIONS") or 50)
+    S3_MULTIPART_PART_SIZE: int = int(os.getenv("S3_MULTIPART_PART_SIZE") or 8 * 1024 * 1024)
+    # Отдача /media: кеш ключей и метаданных объектов, редирект на presigned URL вместо проксирования
+    MEDIA_KEY_CACHE_TTL: int = int(os.getenv("MEDIA_KEY_CACHE_TTL") or 3600)
+    MEDIA_KEY_CACHE_REDIS: bool = os.getenv("MEDIA_KEY_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+    MEDIA_PRESIGNED_REDIRECT: bool = os.getenv("MEDIA_PRESIGNED_REDIRECT", "false").lower() in ("1", "true", "yes")
+    MEDIA_PRESIGNED_TTL: int = int(os.getenv("MEDIA_PRESIGNED_TTL") or 3600)
+    MEDIA_CACHE_MAX_AGE: int = int(os.getenv("MEDIA_CACHE_MAX_AGE") or 3600)
+    # Иконки каталога: presigned URL обновляются заранее, каталог отдается с ETag
+    ICON_URL_REFRESH_BEFORE: int = int(os.getenv("ICON_URL_REFRESH_BEFORE") or 300)
+    ICON_URL_CACHE_REDIS: bool = os.getenv("ICON_URL_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+    ICON_CATALOG_CACHE_TTL: int = int(os.getenv("ICON_CATALOG_CACHE_TTL") or 60)
+    # Вложения запросов: параллельные загрузки и порог, после которого файл уходит из памяти на диск
+    ATTACHMENT_DOWNLOAD_CONCURRENCY: int = int(os.getenv("ATTACHMENT_DOWNLOAD_CONCURRENCY") or 8)
+    ATTACHMENT_SPOOL_MAX_MEMORY: int = int(os.getenv("ATTACHMENT_SPOOL_MAX_MEMORY") or 1024 * 1024)
 
     # broker streams
     USER_STREAM_NAME: str = "user_messages"
@@ -78,12 +100,61 @@ class Settings(BaseSettings):
     BOT_STREAM_GROUP: str = "bot_group"
     EMITTER_STREAM_NAME: str = "emitters"
     EMITTER_STREAM_GROUP: str = "emitters_group"
+    # Повторная доставка зависших записей и dead-letter стрим ({stream}:dead)
+    STREAM_RECLAIM_IDLE_MS: int = int(os.getenv("STREAM_RECLAIM_IDLE_MS") or 60_000)
+    STREAM_RECLAIM_INTERVAL: float = float(os.getenv("STREAM_RECLAIM_INTERVAL") or 30)
+    STREAM_RECLAIM_COUNT: int = int(os.getenv("STREAM_RECLAIM_COUNT") or 100)
+    STREAM_MAX_DELIVERIES: int = int(os.getenv("STREAM_MAX_DELIVERIES") or 5)
 
     DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE") or 10)
     DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW") or 10)
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
     CACHE_REDIS_URL: str = os.getenv("CACHE_REDIS_URL", "redis://cache-redis:6389/0")
+    # Общие пулы соединений Redis процесса (отдельно для REDIS_URL и CACHE_REDIS_URL)
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS") or 50)
+    REDIS_POOL_TIMEOUT: float = float(os.getenv("REDIS_POOL_TIMEOUT") or 5)
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL") or 30)
     PROXIES: str = os.getenv("PROXIES", "")
+    # Общие HTTP-клиенты запросов и интеграций
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT") or 30)
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT") or 10)
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS") or 100)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS") or 20)
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST") or 20)
+    HTTP_RETRIES: int = int(os.getenv("HTTP_RETRIES") or 2)
+    HTTP_RETRY_BACKOFF: float = float(os.getenv("HTTP_RETRY_BACKOFF") or 0.5)
+    HTTP_RETRY_AFTER_MAX: float = float(os.getenv("HTTP_RETRY_AFTER_MAX") or 30)
+    HTTP_MAX_RESPONSE_BYTES: int = int(os.getenv("HTTP_MAX_RESPONSE_BYTES") or 10 * 1024 * 1024)
+    # Кеш ответов GET-запросов с включенным cache_ttl: в памяти процесса и в Redis
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES") or 1000)
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES") or 1024 * 1024)
+    RESPONSE_CACHE_REDIS: bool = os.getenv("RESPONSE_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+    # Параллельная обработка сообщения ботами-подписчиками канала
+    BOT_FANOUT_CONCURRENCY: int = int(os.getenv("BOT_FANOUT_CONCURRENCY") or 8)
+    BOT_RUN_TIMEOUT: float = float(os.getenv("BOT_RUN_TIMEOUT") or 60)
+    # Исполнение кода шагов: "inline" — в event loop консьюмера, "process" — в пуле процессов с лимитами
+    CODE_EXECUTOR_BACKEND: str = os.getenv("CODE_EXECUTOR_BACKEND", "inline")
+    CODE_EXECUTOR_WORKERS: int = int(os.getenv("CODE_EXECUTOR_WORKERS") or 2)
+    CODE_EXECUTOR_CPU_LIMIT: float = float(os.getenv("CODE_EXECUTOR_CPU_LIMIT") or 5)
+    # Память, которую код шага может занять сверх размера воркера на старте
+    CODE_EXECUTOR_MEMORY_LIMIT_MB: int = int(os.getenv("CODE_EXECUTOR_MEMORY_LIMIT_MB") or 512)
+    CODE_EXECUTOR_TIMEOUT: float = float(os.getenv("CODE_EXECUTOR_TIMEOUT") or 10)
+    # Блокировка сессии между репликами консьюмера на время обработки сообщения
+    SESSION_LOCK_TTL: float = float(os.getenv("SESSION_LOCK_TTL") or 120)
+    # Кеш access-токенов внешних API: второй уровень в Redis и фоновое обновление
+    AUTH_TOKEN_REDIS_CACHE: bool = os.getenv("AUTH_TOKEN_REDIS_CACHE", "true").lower() in ("1", "true", "yes")
+    AUTH_TOKEN_REFRESH_BEFORE: int = int(os.getenv("AUTH_TOKEN_REFRESH_BEFORE") or 300)
+    AUTH_TOKEN_STATIC_TTL: int = int(os.getenv("AUTH_TOKEN_STATIC_TTL") or 3600)
+    # Исходящие очереди WebSocket-соединений; политика медленного клиента: drop_oldest или disconnect
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE") or 100)
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT") or 5)
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+    # Heartbeat WebSocket для клиентов протокола кадров: ping при молчании, закрытие после WS_IDLE_TIMEOUT без кадров
+    WS_PING_INTERVAL: float = float(os.getenv("WS_PING_INTERVAL") or 25)
+    WS_IDLE_TIMEOUT: float = float(os.getenv("WS_IDLE_TIMEOUT") or 60)
+    WS_MAX_SUBSCRIPTIONS: int = int(os.getenv("WS_MAX_SUBSCRIPTIONS") or 50)
+    # Порт /metrics воркеров FastStream (у API метрики на /metrics основного порта), 0 — выключено
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT") or 9100)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 
     MCP_SERVICE_URL: str = os.getenv("MCP_SERVICE_URL", "http://mcp-dbcv:8005")
@@ -2,7 +2,7 @@ from typing import Type, Optional, Dict, Any
 from uuid import UUID
 
 from fastapi import HTTPException
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, exists
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.message import MessageModel
 from app.models.widget import WidgetModel
@@ -72,7 +72,12 @@ async def update_channel(
     return channel
 
 
-async def delete_channel(session: AsyncSession, channel_id: UUID | str) -> None:
+async def delete_channel(session: AsyncSession, channel_id: UUID | str) -> list[str]:
+    """
+    Удаляет канал с его сообщениями и виджетами этих сообщений.
+    Возвращает content_hash удаленных готовых виджетов: после commit их нужно сбросить
+    из кешей процессов (crud.widget.forget_widgets).
+    """
     messages_to_delete = await session.execute(
         select(MessageModel).where(
             MessageModel.channel_id == channel_id,
@@ -101,9 +106,17 @@ async def delete_channel(session: AsyncSession, channel_id: UUID | str) -> None:
         if message.widget_id:
             widget_ids_to_delete.add(message.widget_id)
     
+    content_hashes = []
     if widget_ids_to_delete:
+        # Готовый виджет общий для одинаковых рендеров: строку, на которую ссылаются
+        # сообщения других каналов, оставляем
         result = await session.execute(
-            delete(WidgetModel).where(WidgetModel.id.in_(widget_ids_to_delete))
+            delete(WidgetModel).where(
+                WidgetModel.id.in_(widget_ids_to_delete),
+                ~exists().where(MessageModel.widget_id == WidgetModel.id),
+            ).returning(WidgetModel.content_hash)
         )
+        content_hashes = [content_hash for content_hash in result.scalars() if content_hash]
     
     await session.delete(await get_channel(session, channel_id))
+    return content_hashes
@@ -17,17 +17,21 @@ async def _raise_not_found() -> None:
 
 
 async def _invalidate_credential_cache(bot_id: str, provider: str, strategy: str) -> None:
-    """Инвалидирует кэш credentials для указанного bot_id, provider и strategy."""
-    from redis.asyncio import Redis
-    from app.config import settings
+    """Инвалидирует кэш credentials и выданных по ним токенов для bot_id, provider и strategy."""
+    from app.auth.cache import TokenCache, token_cache
+    from app.managers.local_cache import INVALIDATION_CHANNEL
+    from app.redis_pool import cache_redis, delete_keys, delete_patterns
+    token_cache.invalidate(bot_id, provider, strategy)
     try:
-        redis = Redis.from_url(settings.CACHE_REDIS_URL)
+        redis = cache_redis()
         # Удаляем конкретные ключи кэша
-        await redis.delete(
+        await delete_keys(redis, [
             f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy}:default",
             f"credential:bot:{bot_id}:provider:{provider}:strategy:{strategy}:singleton"
-        )
-        await redis.aclose()
+        ])
+        # Токены кредов в Redis и в L1 реплик консьюмера
+        await delete_patterns(redis, [TokenCache.redis_pattern(bot_id, provider)])
+        await redis.publish(INVALIDATION_CHANNEL, TokenCache.invalidation_key(bot_id, provider, strategy))
     except Exception:
         pass  # Игнорируем ошибки кэша
 
@@ -45,6 +45,15 @@ async def delete_message(session: AsyncSession, message_id: UUID | str) -> None:
     await session.delete(await get_message(session, message_id))
 
 
+async def forget_message(message_id: UUID | str) -> None:
+    """
+    Сбрасывает сообщение из кеша рассылки эмиттеров во всех процессах.
+    Вызывается после commit: раньше другой процесс успеет перечитать и закешировать старую строку.
+    """
+    from app.services.emitter_service import invalidate_emitter_cache
+    await invalidate_emitter_cache(message_id=str(message_id))
+
+
 async def prepare_message_copy(message_copy_in: schemas_message.MessageCreate,
                                sender_id: UUID | str | None,
                                recipient_id: UUID | str | None) -> schemas_message.MessageCreate:
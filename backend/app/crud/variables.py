@@ -8,17 +8,15 @@ from app.models import AnonymousUserVariables
 from app.models import ChannelVariables
 from app.models import SessionVariables
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.config import settings
 from app.database import sessionmanager
-from redis.asyncio import Redis
 from app.managers.data_manager import DataManager
+from app.redis_pool import cache_redis
 
 
 async def _invalidate_variables_cache(variable_id: str, cls_variables):
     """Инвалидирует кеш переменных в зависимости от типа"""
     try:
-        redis = Redis.from_url(settings.CACHE_REDIS_URL)
-        data_manager = DataManager(redis, sessionmanager.engine)
+        data_manager = DataManager(cache_redis(), sessionmanager.engine)
         
         if cls_variables == UserVariables:
             await data_manager.invalidate_user_variables_cache(variable_id)
@@ -28,8 +26,6 @@ async def _invalidate_variables_cache(variable_id: str, cls_variables):
             await data_manager.invalidate_channel_variables_cache(variable_id)
         elif cls_variables == SessionVariables:
             await data_manager.invalidate_session_variables_cache(variable_id)
-        
-        await redis.aclose()
     except Exception as e:
         logging.warning(f"Failed to invalidate cache for {cls_variables.__name__}:{variable_id}: {e}")
 
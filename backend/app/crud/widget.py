@@ -9,6 +9,7 @@ from app.api.dependencies.auth import CurrentUser
 from app.models.widget import WidgetModel
 from app.schemas import widget as schemas_widget
 from app.crud.utils import is_object_unique
+from app.managers.widget_manager import forget_rendered_widget
 
 
 async def check_widget_unique(
@@ -62,8 +63,13 @@ async def update_widget(
     widget_in: schemas_widget.WidgetUpdate,
 ) -> Type[WidgetModel]:
     widget = await get_widget(session, widget_id)
+    content_hash = widget.content_hash
     for key, value in widget_in.model_dump(exclude_unset=True).items():
         setattr(widget, key, value)
+    if content_hash:
+        # Готовый виджет общий для одинаковых рендеров: правленая строка больше
+        # не соответствует хешу, и новые сообщения ее не переиспользуют
+        widget.content_hash = None
     return widget
 
 
@@ -71,3 +77,16 @@ async def delete_widget(session: AsyncSession, widget_id: UUID | str) -> None:
     await session.delete(await get_widget(session, widget_id))
 
 
+async def forget_widgets(*content_hashes: Optional[str]) -> None:
+    """
+    Сбрасывает виджеты из кешей всех процессов после правки или удаления.
+    Вызывается после commit: раньше другой процесс успеет перечитать и закешировать старую строку.
+    """
+    from app.services.emitter_service import invalidate_emitter_cache
+    for content_hash in content_hashes:
+        if content_hash:
+            await forget_rendered_widget(content_hash)
+    # Виджет исходных сообщений эмиттеров лежит в кеше рассылки вместе с сообщением
+    await invalidate_emitter_cache(all_messages=True)
+
+
@@ -0,0 +1,118 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.engine.variables import TemplateCache
+from app.managers.data_manager import CacheLock, DataManager
+from app.schemas.bot import BotProcessor
+from app.schemas.connection import ConnectionGroupExport
+from app.schemas.step import StepExport
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledBot:
+    """
+    Провалидированная структура бота с индексами шагов и групп связей
+    и кешем скомпилированных шаблонов подстановки.
+    Строится один раз на версию структуры и переиспользуется между сообщениями.
+    """
+
+    def __init__(self, bot: BotProcessor, version: str | None):
+        self.bot = bot
+        self.version = version
+        self.steps: dict[str, StepExport] = {str(step.id): step for step in bot.steps}
+        self.connection_groups: dict[str, ConnectionGroupExport] = {}
+        for step in bot.steps:
+            for connection_group in step.connection_groups:
+                self.connection_groups[str(connection_group.id)] = connection_group
+        for connection_group in bot.master_connection_groups:
+            self.connection_groups[str(connection_group.id)] = connection_group
+        # Шаблоны подстановки компилируются лениво при первом использовании
+        self.templates = TemplateCache()
+
+    @classmethod
+    def from_row(cls, bot: dict[str, Any], version: str | None) -> "CompiledBot":
+        cache_structure = bot.get("cache_structure")
+        if not isinstance(cache_structure, dict):
+            raise ValueError(f"Invalid bot id-{bot.get('id')}: missing cache_structure")
+        return cls(BotProcessor(**cache_structure), version)
+
+    def get_step(self, step_id) -> Optional[StepExport]:
+        if step_id is None:
+            return None
+        return self.steps.get(str(step_id))
+
+    def get_connection_group(self, group_id) -> Optional[ConnectionGroupExport]:
+        if group_id is None:
+            return None
+        return self.connection_groups.get(str(group_id))
+
+
+class CompiledBotCache:
+    """
+    Кеш скомпилированных ботов в памяти воркера.
+    Ключ — id бота, актуальность проверяется по версии структуры в Redis,
+    которую меняет DataManager.update_bot при каждой публикации cache_structure_bot.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._bots: OrderedDict[str, CompiledBot] = OrderedDict()
+        self.cache_lock = CacheLock()
+
+    async def get(self, data_manager: DataManager, bot_id) -> Optional[CompiledBot]:
+        if not bot_id:
+            return None
+        bot_id = str(bot_id)
+        version = await data_manager.get_bot_version(bot_id)
+        compiled = self._lookup(bot_id, version)
+        if compiled:
+            return compiled
+
+        lock = self.cache_lock.get_lock(f"compiled:{bot_id}")
+        async with lock:
+            compiled = self._lookup(bot_id, version)
+            if compiled:
+                logger.debug(f"Delayed compiled bot hit: {bot_id}")
+                return compiled
+
+            bot = await data_manager.get_bot(bot_id)
+            if not bot:
+                return None
+
+            if version is None:
+                version = await data_manager.ensure_bot_version(bot_id)
+                compiled = CompiledBot.from_row(bot, version)
+                if version is None:
+                    # Структуру успели переопубликовать, пока мы её читали:
+                    # используем её для текущего сообщения, но не кешируем.
+                    return compiled
+            else:
+                compiled = CompiledBot.from_row(bot, version)
+
+            self._store(bot_id, compiled)
+            logger.debug(f"Compiled bot {bot_id} (version={version}, steps={len(compiled.steps)})")
+            return compiled
+
+    def invalidate(self, bot_id=None) -> None:
+        if bot_id is None:
+            self._bots.clear()
+            return
+        self._bots.pop(str(bot_id), None)
+
+    def _lookup(self, bot_id: str, version: str | None) -> Optional[CompiledBot]:
+        compiled = self._bots.get(bot_id)
+        if compiled is None or version is None or compiled.version != version:
+            return None
+        self._bots.move_to_end(bot_id)
+        return compiled
+
+    def _store(self, bot_id: str, compiled: CompiledBot) -> None:
+        self._bots[bot_id] = compiled
+        self._bots.move_to_end(bot_id)
+        while len(self._bots) > self.maxsize:
+            self._bots.popitem(last=False)
+
+
+compiled_bot_cache = CompiledBotCache()
@@ -1,27 +1,36 @@
+import asyncio
 import json
 import logging
 import traceback
 from abc import abstractmethod, ABC
 import random
+import tempfile
+import time
 from copy import deepcopy
 from datetime import datetime
-from typing import Any, Optional, Dict
+from typing import Any, Optional
 from uuid import uuid4
 
-from jqqb_evaluator.evaluator import Evaluator
-from redis.asyncio import Redis
+from app.redis_pool import cache_redis
 
+from app.auth.cache import token_cache
 from app.auth.credentials_resolver import CredentialsResolver
 from app.auth.service import AuthService
 from app.config import settings
 
 from app.database import sessionmanager
+from app.engine.bot_cache import CompiledBot, compiled_bot_cache
+from app.engine.code_executor import get_code_executor
 from app.engine.request import make_request
-from app.engine.variables import variable_substitution_pydantic, update_variables_dict, variable_substitution
+from app.engine.response_cache import response_cache
+from app.engine.variables import update_variables_dict, VariablesChanges, \
+    TemplateCache, compile_rule_value
+from app.jqqb import compile_rules
 from app.loggers import BotLogger
 from app.loggers.bot import NoopBotLogger
 from app.managers.data_manager import DataManager
 from app.managers.message_manager import MessageManager
+from app.metrics.engine import engine_metrics
 from app.models.base import UUID
 from app.models.connection import SearchType
 from app.schemas.bot import BotProcessor
@@ -37,9 +46,12 @@ from sqlalchemy import text
 from app.database import sessionmanager
 from app.schemas.templates import TemplateInstancePublic
 from app.utils.dict import deep_merge_dicts, get_value_by_list_keys, deep_set, get_value_by_path
-from app.engine.safe_env import safe_globals
 
-redis = Redis.from_url(settings.CACHE_REDIS_URL)
+redis = cache_redis()
+if settings.AUTH_TOKEN_REDIS_CACHE:
+    token_cache.set_redis(redis)
+if settings.RESPONSE_CACHE_REDIS:
+    response_cache.set_redis(redis)
 logger = logging.getLogger(__name__)
 
 
@@ -51,11 +63,15 @@ class ConnectionHandler(ABC):
 
 
 class ConnectionResponseHandler(ConnectionHandler):
-    def __init__(self, bot: BotProcessor, auth: AuthService, data_manager: DataManager, logger: Optional[BotLogger] = None, ):
+    def __init__(self, bot: BotProcessor, auth: AuthService, data_manager: DataManager, logger: Optional[BotLogger] = None,
+                 templates: Optional[TemplateCache] = None,
+                 attachment_repo: Optional[SqlAttachmentRepository] = None):
         self.logger = logger or NoopBotLogger()
         self.auth = auth
         self.data_manager = data_manager
         self.bot = bot
+        self.templates = templates or TemplateCache()
+        self.attachment_repo = attachment_repo
 
     async def handle(self, connection_group: ConnectionGroupExport, context: dict,
                      all_variables: dict = {}):
@@ -63,9 +79,12 @@ class ConnectionResponseHandler(ConnectionHandler):
 
         try:
             if connection_group.request:
-                request_in: RequestSubstitute = await variable_substitution_pydantic(
-                    RequestSubstitute.model_validate(connection_group.request.__dict__),
-                    context=deep_merge_dicts(context, all_variables)
+                request_template = self.templates.get(
+                    connection_group.request, "request",
+                    lambda: RequestSubstitute.model_validate(connection_group.request.__dict__).model_dump()
+                )
+                request_in: RequestSubstitute = RequestSubstitute.model_validate(
+                    request_template.render(deep_merge_dicts(context, all_variables))
                 )
         except Exception as e:
             await self.logger.error(f"Error in response handler: {e}")
@@ -89,6 +108,7 @@ class ConnectionResponseHandler(ConnectionHandler):
         except Exception as e:
             await self.logger.error(f"Auth injection failed: {e}")
 
+        files = []
         try:
             files = await self._prepare_request_files(request_in.attachments)
         except Exception as e:
@@ -103,42 +123,60 @@ class ConnectionResponseHandler(ConnectionHandler):
                 data=request_in.data,
                 files=files,
                 headers=request_in.headers,
-                proxies=request_in.proxies
+                proxies=request_in.proxies,
+                cache_ttl=connection_group.request.cache_ttl,
+                cache_scope=context.get("credentials_id") or str(self.bot.id),
             )
             await self.logger.info(f"Response: {result_json}")
-            for file in files:
-                file[1].close()
             return result_json
         except Exception as e:
             await self.logger.error(f"Error in response handler: {e}")
             return None
+        finally:
+            for _, (_, fileobj, _) in files:
+                fileobj.close()
 
     async def _prepare_request_files(self, attachments: list | None):
-        files = []
         if not attachments:
-            return files
+            return []
 
         # attachments can be IDs or variable placeholders already substituted into dicts
-        repo = SqlAttachmentRepository(sessionmanager.engine)
+        attachment_ids = [att.get("id") if isinstance(att, dict) else att for att in attachments]
+        attachment_ids = [str(attachment_id) for attachment_id in attachment_ids if attachment_id]
+        if self.attachment_repo is None:
+            self.attachment_repo = SqlAttachmentRepository(sessionmanager.engine)
+        metas = await self.attachment_repo.get_many(attachment_ids)
         storage = S3StorageService()
-
-        for att in attachments:
-            attachment_id = att.get("id") if isinstance(att, dict) else att
-            if not attachment_id:
-                continue
-
-            meta = await repo.get_by_id(attachment_id)
+        semaphore = asyncio.Semaphore(settings.ATTACHMENT_DOWNLOAD_CONCURRENCY)
+
+        async def download(meta):
+            # Файл пишется частями во временный файл, большой уходит на диск;
+            # httpx потом читает его в multipart тоже частями
+            spool = tempfile.SpooledTemporaryFile(max_size=settings.ATTACHMENT_SPOOL_MAX_MEMORY)
+            try:
+                async with semaphore:
+                    await storage.download_to(meta.key, spool)
+            except BaseException:
+                spool.close()
+                raise
+            filename = meta.key.split("/")[-1] if isinstance(meta.key, str) else "file"
+            return "files", (filename, spool, meta.content_type or "application/octet-stream")
+
+        found = []
+        for attachment_id in attachment_ids:
+            meta = metas.get(attachment_id)
             if not meta:
                 await self.logger.info(f"Attachment not found: {attachment_id}")
                 continue
+            found.append(meta)
 
-            key = meta.key
-            content_type = meta.content_type or "application/octet-stream"
-            data = await storage.get_bytes(key)
-            filename = key.split("/")[-1] if isinstance(key, str) else "file"
-
-            # httpx files format supports tuples: (name, bytes, content_type)
-            files.append(("files", (filename, data, content_type)))
+        files = []
+        for meta, result in zip(found, await asyncio.gather(*(download(meta) for meta in found),
+                                                             return_exceptions=True)):
+            if isinstance(result, BaseException):
+                await self.logger.error(f"Attachment download failed: {meta.id}: {result}")
+                continue
+            files.append(result)
         return files
 
 
@@ -151,61 +189,25 @@ class ConnectionCodeHandler(ConnectionHandler):
         await self.logger.info("Working code handler...")
         try:
             if connection_group.code:
-                return await CodeExecutor(self.logger).execute(connection_group.code, context,
-                                                                               deepcopy(all_variables))
+                return await get_code_executor(self.logger).execute(connection_group.code, context, all_variables)
         except Exception as e:
 
             await self.logger.error(f"Error in code handler: {e}")
             return None
 
 
-class CodeExecutorBase(ABC):
-    @abstractmethod
-    async def execute(self, code: str, context: Optional[Dict[str, Any]] = None,
-                      variables: Optional[Dict[str, Any]] = None) -> Any:
-        pass
-
-
-class CodeExecutor(CodeExecutorBase):
-    def __init__(self, logger: BotLogger):
-        self.logger = logger
-        self.available_globals = safe_globals
-        self.available_globals[self.logger.print.__name__] = self.logger.print
-
-    async def execute(self, code: str, context: dict | None = None, variables: dict | None = None):
-        available_variables = {}
-        context = context or {}
-        variables = variables or {}
-        try:
-            exec(compile(code, '<string>', 'exec'),
-                 {"__builtins__": None, **self.available_globals},
-                 available_variables)
-
-            if 'main' not in available_variables:
-                await self.logger.error("Error: функция 'main' не определена.")
-                return context
-
-            result = await available_variables['main'](context, variables=variables)
-            return result
-
-        except Exception as e:
-            traceback_str = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
-            print(traceback_str)
-            await self.logger.error(f"Execution error:\n{traceback_str}")
-            return context
-
-
 class ConnectionHandlerFactory:
     @staticmethod
     def get_handler(search_type: SearchType, logger,
                     bot: BotProcessor | None = None,
                     auth: AuthService | None = None,
-                    data_manager: DataManager | None = None) -> ConnectionHandler | None:
+                    data_manager: DataManager | None = None,
+                    templates: TemplateCache | None = None) -> ConnectionHandler | None:
         match search_type:
             case SearchType.message:
                 return None
             case SearchType.response:
-                return ConnectionResponseHandler(bot, auth, data_manager, logger)
+                return ConnectionResponseHandler(bot, auth, data_manager, logger, templates)
             case SearchType.code:
                 return ConnectionCodeHandler(logger)
             case SearchType.integration:
@@ -222,7 +224,7 @@ class ConnectionHandlerFactory:
                     if hasattr(logger, 'error'):
                         logger.error("Bot ID is required for integration handler")
                     return None
-                return ConnectionIntegrationHandler(logger, data_manager, bot_id)
+                return ConnectionIntegrationHandler(logger, data_manager, bot_id, templates)
             case _:
                 raise ValueError(f"Unsupported search type: {search_type}")
 
@@ -250,6 +252,9 @@ class Processor(BaseProcessor):
         self.data_manager: DataManager = data_manager
         self.logger: BotLogger = logger
         self.all_variables = all_variables
+        self.variables_changes = VariablesChanges()
+        self.templates = TemplateCache()
+        self.auth_service = AuthService(CredentialsResolver(data_manager))
         self.current_step = None
         self.context: dict[str, Any] = {}
         self.message: dict[str, Any] = {}
@@ -261,7 +266,7 @@ class Processor(BaseProcessor):
                 if isinstance(variables_save_as, str):
                     variables_save_as = json.loads(variables_save_as)
                 self.all_variables = await update_variables_dict(
-                    self.all_variables, None, variables_save_as, context
+                    self.all_variables, None, variables_save_as, context, self.variables_changes
                 )
 
                 await self.logger.info("Variables updated locally in memory.")
@@ -274,31 +279,41 @@ class Processor(BaseProcessor):
         next_step = self._get_current_step(connection.next_step_id)
         return await self._switch_to_next_step(next_step)
 
-    async def _evaluate_and_switch(self, connection: ConnectionExport, context: dict) -> bool:
+    def _merge_with_variables(self, context: dict | None) -> dict:
+        safe_all_variables = self.all_variables if self.all_variables is not None else {}
+        for key, value in safe_all_variables.items():
+            if value is None:
+                safe_all_variables[key] = {}
+        return deep_merge_dicts(safe_all_variables, context or None)
+
+    async def _evaluate_and_switch(self, connection: ConnectionExport, context: dict,
+                                   rules_context: dict | None = None) -> bool:
+        """
+        Проверяет правила связи и переходит по ней.
+        rules_context — контекст, уже объединенный с переменными; группа связей
+        собирает его один раз для всех своих связей.
+        """
         await self.logger.info("Check rules and context")
         rules_str = connection.rules
         if not rules_str or not context:
             return await self.switch_to_next_step(connection)
 
-        await self.logger.info("Create context")
-
-        safe_all_variables = self.all_variables if self.all_variables is not None else {}
-        for key, value in safe_all_variables.items():
-            if value is None:
-                safe_all_variables[key] = {}
-        context = deep_merge_dicts(safe_all_variables, context or None)
-        await self.logger.info("Substitution variables...")
+        if rules_context is None:
+            await self.logger.info("Create context")
+            rules_context = self._merge_with_variables(context)
 
         try:
-            rules_str = await variable_substitution(rules_str, context)
-            evaluator = Evaluator(json.loads(rules_str))
+            predicate = self.templates.get(
+                connection, "rules", lambda: rules_str,
+                lambda rules: compile_rules(rules, compile_rule_value)
+            )
         except Exception as e:
-            await self.logger.error(f"Error variable substitution: {e}")
+            await self.logger.error(f"Error compiling rules: {e}")
             return False
 
         await self.logger.info("Working evaluator...")
         try:
-            if evaluator.object_matches_rules(context):
+            if predicate(rules_context):
                 return await self.switch_to_next_step(connection)
         except Exception as e:
             await self.logger.error(f"Error evaluating rules: {e}")
@@ -309,16 +324,17 @@ class Processor(BaseProcessor):
     async def process_connection_groups(self, connection_groups: list[ConnectionGroupExport], context: dict):
         for connection_group in connection_groups:
             await self.logger.info("Processing connection group...")
-            resolver = CredentialsResolver(self.data_manager)
-            auth_service = AuthService(resolver)
-            handler = ConnectionHandlerFactory.get_handler(connection_group.search_type, self.logger, self.bot, auth_service, self.data_manager)
+            handler = ConnectionHandlerFactory.get_handler(connection_group.search_type, self.logger, self.bot,
+                                                           self.auth_service, self.data_manager, self.templates)
             if handler:
                 self.context = await handler.handle(connection_group, context, self.all_variables)
             await self._save_variables(connection_group.variables, self.context)
             await self.logger.info("Start evaluate rules and switch step...")
 
+            # Переменные не меняются между связями группы — контекст правил общий
+            rules_context = self._merge_with_variables(self.context) if self.context else None
             for connection in connection_group.connections:
-                if await self._evaluate_and_switch(connection, self.context):
+                if await self._evaluate_and_switch(connection, self.context, rules_context):
                     return True
 
         await self.logger.info("No connection matched in group.")
@@ -343,7 +359,8 @@ class Processor(BaseProcessor):
         if next_step.message:
             await self.logger.info("Create step message...")
             message_service = MessageService(engine=sessionmanager.engine)
-            await message_service.send_message(self.session, next_step.message, context=context)
+            await message_service.send_message(self.session, next_step.message, context=context,
+                                               templates=self.templates)
 
     def _get_current_step(self, step_id: str) -> StepTemplate:
         ...
@@ -353,10 +370,12 @@ class Processor(BaseProcessor):
 
 
 class TemplateProcessor(Processor):
-    def __init__(self, template, logger, data_manager: DataManager, bot):
+    def __init__(self, template, logger, data_manager: DataManager, bot, templates: TemplateCache | None = None):
         super().__init__(logger, {}, data_manager)
         self.logger = logger
         self.bot = bot
+        if templates is not None:
+            self.templates = templates
         self.instance: TemplateInstancePublic = template
         self.context: dict[str, Any] = {}
         self.current_step: StepExport | None = None
@@ -431,22 +450,25 @@ class TemplateProcessor(Processor):
 
 class MessageProcessor(Processor):
     def __init__(self, sender_id: str,
-                 bot: dict[str, Any],
+                 bot: CompiledBot,
                  channel: dict[str, Any],
                  message: dict[str, Any],
                  data_manager: DataManager):
         super().__init__(logger, {}, data_manager)
         self.sender_id = sender_id
-        cache_structure = bot.get("cache_structure")
-        if not isinstance(cache_structure, dict):
-            raise ValueError(f"Invalid bot id-{bot.get('id')}: missing cache_structure")
-        self.bot = BotProcessor(**cache_structure)
+        if bot is None:
+            raise ValueError("Bot not found.")
+        self.compiled_bot = bot
+        self.bot: BotProcessor = bot.bot
+        self.templates = bot.templates
         self.channel = ChannelSimple(**channel)
         self.message: dict[str, Any] = message
         self.all_variables = None
         self.session = None
         self.current_step = None
         self.context: dict[str, Any] = {}
+        # Шаг, на котором сообщение застало сессию; метка метрик задержки
+        self.entry_step_id = None
 
         self.logger: BotLogger = BotLogger(self.bot.id)
 
@@ -471,15 +493,18 @@ class MessageProcessor(Processor):
         if next_step.message:
             await self.logger.info("Create step message...")
             message_service = MessageService(engine=sessionmanager.engine)
-            await message_service.send_message(self.session, next_step.message, context=context)
+            await message_service.send_message(self.session, next_step.message, context=context,
+                                               templates=self.templates)
         if next_step.template_instance:
             await self.logger.info("Processing template...")
 
-            template_processor = TemplateProcessor(next_step.template_instance, self.logger, self.data_manager, self.bot)
+            template_processor = TemplateProcessor(next_step.template_instance, self.logger, self.data_manager,
+                                                   self.bot, self.templates)
             template_outputs = await template_processor.run(self.context, self.all_variables)
             safe_all_variables = self.all_variables if self.all_variables is not None else {}
             safe_template_outputs = template_outputs if template_outputs is not None else {}
             self.all_variables = deep_merge_dicts(safe_all_variables, safe_template_outputs)
+            self.variables_changes.mark_dict(safe_template_outputs)
             return await self.process_connection_groups(next_step.connection_groups, self.context)
 
         if next_step.is_proxy:
@@ -489,17 +514,33 @@ class MessageProcessor(Processor):
         return True
 
     def _get_current_step(self, step_id):
-        for step in self.bot.steps:
-            if step.id == step_id:
-                return step
+        return self.compiled_bot.get_step(step_id)
+
+    async def _commit_variables(self):
+        """Сохраняет только изменённые за сообщение пространства имен переменных."""
+        if not self.variables_changes:
+            return
+        await self.data_manager.patch_variables(self.sender_id, self.bot.id, self.channel.id,
+                                                self.session.id, self.variables_changes.patches(self.all_variables))
+        self.variables_changes.clear()
 
     async def run(self, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            await self._process()
+            status = "ok"
+        finally:
+            engine_metrics.observe_processing(self.bot.id, self.entry_step_id, status, time.perf_counter() - started)
+
+    async def _process(self):
         await self.logger.info("Start working bot...")
         await self.logger.info("Get or create session...")
 
         self.session = SessionSimple(
             **(await self.data_manager.get_or_create_session(self.sender_id, self.bot.id, self.channel.id,
                                                              self.bot.first_step_id)))
+        self.entry_step_id = self.session.step_id
 
         await self.logger.info("Load variables...")
         self.all_variables = await self.data_manager.get_all_variables(self.sender_id, self.bot.id, self.channel.id,
@@ -512,8 +553,7 @@ class MessageProcessor(Processor):
         self.context = self.message
         await self.logger.info("Check master groups...")
         if await self.process_connection_groups(self.bot.master_connection_groups, self.context):
-            await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                         self.session.id, self.all_variables)
+            await self._commit_variables()
             self.session.step_id = self.current_step.id
             await self.data_manager.update_session(self.session.user_id,
                                                    self.session.bot_id,
@@ -527,8 +567,7 @@ class MessageProcessor(Processor):
         self.logger.set_step(self.current_step.id)
 
         if await self.process_connection_groups(self.current_step.connection_groups, self.context):
-            await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                         self.session.id, self.all_variables)
+            await self._commit_variables()
             self.session.step_id = self.current_step.id
             await self.data_manager.update_session(self.session.user_id,
                                                    self.session.bot_id,
@@ -537,8 +576,7 @@ class MessageProcessor(Processor):
             return
 
         await self.logger.info("No transitions triggered, committing any updated variables.")
-        await self.data_manager.update_all_variables(self.sender_id, self.bot.id, self.channel.id,
-                                                     self.session.id, self.all_variables)
+        await self._commit_variables()
         self.session.step_id = self.current_step.id
         await self.data_manager.update_session(self.session.user_id,
                                                self.session.bot_id,
@@ -546,6 +584,57 @@ class MessageProcessor(Processor):
                                                self.session.step_id)
 
 
+async def _run_processor(bot_id, message_processor: MessageProcessor) -> None:
+    """Обрабатывает сообщение ботом не дольше BOT_RUN_TIMEOUT; ошибки и таймаут пробрасываются."""
+    timeout = settings.BOT_RUN_TIMEOUT or None
+    try:
+        await asyncio.wait_for(message_processor.run(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"[ERROR][check_message] bot={bot_id}: timed out after {timeout}s")
+        raise
+
+
+async def _run_bot(data_manager: DataManager, bot_id, sender_id, channel: dict, message: dict) -> bool:
+    """Запускает бота-подписчика; его ошибки и таймаут не мешают остальным подписчикам."""
+    try:
+        bot = await compiled_bot_cache.get(data_manager, bot_id)
+        message_processor = MessageProcessor(sender_id, bot, channel, message, data_manager)
+    except Exception as e:
+        logger.error(f"[ERROR][check_message] bot={bot_id}: {e}")
+        return False
+
+    try:
+        await _run_processor(bot_id, message_processor)
+    except asyncio.TimeoutError:
+        return False
+    except Exception as e:
+        logger.error(f"[ERROR][check_message] bot={bot_id}: {e}\n{traceback.format_exc()}")
+        return False
+    return True
+
+
+async def _run_subscribers(data_manager: DataManager, subscriber_ids: list, sender_id,
+                           channel: dict, message: dict) -> None:
+    """
+    Запускает ботов-подписчиков канала параллельно, не более BOT_FANOUT_CONCURRENCY одновременно.
+    При BOT_FANOUT_CONCURRENCY=1 боты обрабатываются последовательно, как раньше.
+    """
+    concurrency = max(settings.BOT_FANOUT_CONCURRENCY, 1)
+    if concurrency == 1 or len(subscriber_ids) < 2:
+        for subscriber_id in subscriber_ids:
+            await _run_bot(data_manager, subscriber_id, sender_id, channel, message)
+        return
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_isolated(subscriber_id):
+        async with engine_metrics.acquire(semaphore, "bot_fanout"):
+            # Каждый бот получает свою копию сообщения: контекст обработки может его менять
+            await _run_bot(data_manager, subscriber_id, sender_id, channel, deepcopy(message))
+
+    await asyncio.gather(*(run_isolated(subscriber_id) for subscriber_id in subscriber_ids))
+
+
 async def check_message(message: dict, channel_id: UUID | str | None = None):
     """Check and process a message."""
     data_manager = DataManager(redis, sessionmanager.engine)
@@ -565,28 +654,26 @@ async def check_message(message: dict, channel_id: UUID | str | None = None):
     sender_id = message_obj.get("sender_id")
     if not recipient_id:
         default_bot_id = channel.get("default_bot_id")
-        bot = await data_manager.get_bot(default_bot_id)
         try:
+            bot = await compiled_bot_cache.get(data_manager, default_bot_id)
             message_processor = MessageProcessor(sender_id, bot, channel, message, data_manager)
         except Exception as e:
             logger.error(f"[ERROR][check_message] {e}")
             return
-        await message_processor.run()
+        # Сбой или таймаут бота по умолчанию оставляет запись стрима неподтвержденной
+        await _run_processor(default_bot_id, message_processor)
         subscribers = await data_manager.get_channel_subscribers(channel_id)
-        for subscriber in subscribers:
-            subscriber_id = subscriber.get("id")
-            if subscriber_id != default_bot_id:
-                bot = await data_manager.get_bot(subscriber_id)
-                try:
-                    message_processor = MessageProcessor(sender_id, bot, channel, message, data_manager)
-                except Exception as e:
-                    logger.error(f"[ERROR][check_message] {e}")
-                    return
-                await message_processor.run()
+        subscriber_ids = [subscriber.get("id") for subscriber in subscribers
+                          if subscriber.get("id") != default_bot_id]
+        await _run_subscribers(data_manager, subscriber_ids, sender_id, channel, message)
         return True
 
     if recipient_id:
-        bot = await data_manager.get_bot(recipient_id)
+        try:
+            bot = await compiled_bot_cache.get(data_manager, recipient_id)
+        except Exception as e:
+            logger.error(f"[ERROR][check_message] {e}")
+            return
         if not bot:
             logger.warning("Bot not found.")
             return False
@@ -595,5 +682,5 @@ async def check_message(message: dict, channel_id: UUID | str | None = None):
         except Exception as e:
             logger.error(f"[ERROR][check_message] {e}")
             return
-        await message_processor.run()
+        await _run_processor(recipient_id, message_processor)
         return True
@@ -0,0 +1,370 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import traceback
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from app.config import settings
+from app.engine.safe_env import safe_globals
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1024)
+def compile_code(code: str):
+    """
+    Компилирует код шага один раз. Строки кода приходят из закешированной
+    структуры бота, поэтому хеш строки уже посчитан и поиск в кеше бесплатный.
+    """
+    return compile(code, '<string>', 'exec')
+
+
+def load_main(code: str, extra_globals: Dict[str, Any]):
+    """Исполняет модуль пользователя в безопасном окружении и возвращает его main."""
+    available_variables: Dict[str, Any] = {}
+    exec(compile_code(code), {"__builtins__": None, **safe_globals, **extra_globals}, available_variables)
+    return available_variables.get("main")
+
+
+def _cow(container, key, value):
+    if type(value) is dict:
+        value = CowDict(value)
+    elif type(value) is list:
+        value = CowList(value)
+    else:
+        return value
+    container._store(key, value)
+    return value
+
+
+class CowDict(dict):
+    """
+    Снимок словаря с копированием при записи.
+    Копируется только верхний уровень; вложенные dict/list копируются при первом
+    обращении к ним, поэтому исходные переменные не меняются, а нетронутые ветки
+    не копируются вовсе.
+    """
+
+    def _store(self, key, value):
+        dict.__setitem__(self, key, value)
+
+    def __getitem__(self, key):
+        return _cow(self, key, dict.__getitem__(self, key))
+
+    def __iter__(self):
+        # Свой итератор отключает быстрый путь dict(...)/{**d}, отдающий исходные ветки
+        return iter(dict.keys(self))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def values(self):
+        return [self[key] for key in dict.keys(self)]
+
+    def items(self):
+        return [(key, self[key]) for key in dict.keys(self)]
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *default)
+
+    def popitem(self):
+        key = next(reversed(dict.keys(self)))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            dict.__setitem__(self, key, default)
+        return self[key]
+
+    def copy(self):
+        return CowDict(self.items())
+
+
+class CowList(list):
+    """Снимок списка с копированием вложенных dict/list при обращении."""
+
+    def _store(self, index, value):
+        list.__setitem__(self, index, value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return _cow(self, index, list.__getitem__(self, index))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def pop(self, index=-1):
+        value = self[index]
+        list.pop(self, index)
+        return value
+
+    def copy(self):
+        return CowList(self)
+
+
+def snapshot(variables: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Дешевая замена deepcopy переменных для кода шага."""
+    return CowDict(variables or {})
+
+
+class CodeExecutorBase(ABC):
+    @abstractmethod
+    async def execute(self, code: str, context: Optional[Dict[str, Any]] = None,
+                      variables: Optional[Dict[str, Any]] = None) -> Any:
+        pass
+
+
+class CodeExecutor(CodeExecutorBase):
+    """Исполнение кода шага в event loop консьюмера."""
+
+    def __init__(self, logger):
+        self.logger = logger
+        # Собственная копия окружения: print у каждого бота свой
+        self.available_globals = {self.logger.print.__name__: self.logger.print}
+
+    async def execute(self, code: str, context: dict | None = None, variables: dict | None = None):
+        context = context or {}
+        # Код шага может менять variables — отдаем снимок вместо самих переменных
+        variables = snapshot(variables)
+        try:
+            main = load_main(code, self.available_globals)
+            if main is None:
+                await self.logger.error("Error: функция 'main' не определена.")
+                return context
+
+            result = await main(context, variables=variables)
+            return result
+
+        except Exception as e:
+            traceback_str = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+            logger.error(f"Code step execution failed:\n{traceback_str}")
+            await self.logger.error(f"Execution error:\n{traceback_str}")
+            return context
+
+
+class CodeTimeoutError(Exception):
+    pass
+
+
+# --- Исполнение в отдельном процессе ---
+
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+# Очередь (job_id, pid) в родительский процесс: по ней находится воркер зависшей задачи
+_started = None
+_job_id: Optional[str] = None
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CodeTimeoutError("CPU time limit exceeded")
+
+
+def _raise_timeout(signum, frame):
+    # Сигнал, опоздавший к уже завершенной задаче, воркер не роняет
+    if _job_id is not None:
+        raise CodeTimeoutError("Execution timed out")
+
+
+def _address_space_size() -> Optional[int]:
+    """Виртуальный размер процесса (VSZ) в байтах; None, если его не узнать (не Linux)."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _init_worker(memory_limit_mb: int, started=None) -> None:
+    global _worker_loop, _started
+    import resource
+    _worker_loop = asyncio.new_event_loop()
+    _started = started
+    signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    signal.signal(signal.SIGUSR1, _raise_timeout)
+    if memory_limit_mb:
+        # Воркер — форк консьюмера и наследует его адресное пространство, которое само
+        # может быть больше лимита: код шага получает memory_limit_mb сверх текущего VSZ
+        size = _address_space_size()
+        if size is None:
+            logger.warning("Code executor memory limit is not applied: process size is unknown")
+            return
+        limit = size + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _set_cpu_limit(seconds: float) -> None:
+    """Мягкий лимит CPU считается от уже потраченного воркером времени."""
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = resource.RLIM_INFINITY if not seconds else int(usage.ru_utime + usage.ru_stime + seconds) + 1
+    if hard != resource.RLIM_INFINITY and soft != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _run_in_worker(job_id: str, code: str, context: dict, variables: dict, cpu_limit: float):
+    """Возвращает (результат, строки print, текст ошибки)."""
+    global _worker_loop, _job_id
+    printed: list[str] = []
+    _job_id = job_id
+    if _started is not None:
+        _started.put((job_id, os.getpid()))
+
+    async def print(*args, sep=' ', end='\n'):
+        printed.append((sep.join(str(arg) for arg in args) + end).rstrip('\n'))
+
+    _set_cpu_limit(cpu_limit)
+    try:
+        main = load_main(code, {"print": print})
+        if main is None:
+            return context, printed, "Error: функция 'main' не определена."
+        return _worker_loop.run_until_complete(main(context, variables=variables)), printed, None
+    except BaseException as e:
+        if asyncio.all_tasks(_worker_loop):
+            # Прерванный main остался в цикле событий — следующей задаче нужен чистый цикл
+            _worker_loop = asyncio.new_event_loop()
+        return context, printed, ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+    finally:
+        _job_id = None
+        _set_cpu_limit(0)
+
+
+class ProcessCodeExecutor(CodeExecutorBase):
+    """
+    Исполнение кода шага в пуле процессов с лимитами CPU и памяти на вызов.
+    Зацикленный или тяжелый main не блокирует event loop консьюмера.
+    Аргументы и результат передаются через pickle, поэтому копия переменных не нужна.
+    Бесконечный счет останавливает RLIMIT_CPU внутри воркера. Задачу, не уложившуюся
+    в CODE_EXECUTOR_TIMEOUT, прерывает сигнал в ее воркере; только если воркер не ответил
+    за STOP_GRACE секунд, он завершается, и пул пересоздается.
+    """
+
+    STOP_GRACE = 1
+
+    _pool: Optional[ProcessPoolExecutor] = None
+    _started = None
+    # job_id выполняющихся задач и pid воркера, который их взял
+    _running: dict[str, Optional[int]] = {}
+
+    def __init__(self, logger):
+        self.logger = logger
+
+    @classmethod
+    def get_pool(cls) -> ProcessPoolExecutor:
+        if cls._pool is None:
+            context = multiprocessing.get_context()
+            cls._started = context.Queue()
+            cls._pool = ProcessPoolExecutor(
+                max_workers=settings.CODE_EXECUTOR_WORKERS,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(settings.CODE_EXECUTOR_MEMORY_LIMIT_MB, cls._started),
+            )
+        return cls._pool
+
+    @classmethod
+    def reset_pool(cls, pool: Optional[ProcessPoolExecutor] = None) -> None:
+        """
+        Сбрасывает пул. С аргументом pool сбрасывает, только если это всё ещё текущий пул:
+        задачи, получившие BrokenProcessPool от одного сломанного пула, не закрывают новый.
+        """
+        if pool is not None and pool is not cls._pool:
+            return
+        pool, cls._pool, cls._started = cls._pool, None, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def _collect_started(cls) -> None:
+        started = cls._started
+        while started is not None:
+            try:
+                job_id, pid = started.get_nowait()
+            except queue.Empty:
+                return
+            if job_id in cls._running:
+                cls._running[job_id] = pid
+
+    @classmethod
+    async def _stop_job(cls, pool: ProcessPoolExecutor, job_id: str, future) -> None:
+        """Прерывает задачу, не уложившуюся в таймаут; остальные задачи пула продолжают работу."""
+        if future.cancel():
+            return  # Еще не начиналась
+        cls._collect_started()
+        pid = cls._running.get(job_id)
+        if pid is None or future.done():
+            return
+        try:
+            os.kill(pid, signal.SIGUSR1)
+        except ProcessLookupError:
+            return
+        done, _ = await asyncio.wait([asyncio.wrap_future(future)], timeout=cls.STOP_GRACE)
+        if done:
+            return
+        logger.warning(f"Code executor worker {pid} did not stop, killing it")
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        cls.reset_pool(pool)
+
+    async def execute(self, code: str, context: dict | None = None, variables: dict | None = None):
+        context = context or {}
+        variables = variables or {}
+        timeout = settings.CODE_EXECUTOR_TIMEOUT or None
+        for attempt in range(2):
+            pool = self.get_pool()
+            job_id = uuid4().hex
+            self._running[job_id] = None
+            try:
+                future = pool.submit(_run_in_worker, job_id, code, context, variables,
+                                     settings.CODE_EXECUTOR_CPU_LIMIT)
+                result, printed, error = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                await self._stop_job(pool, job_id, future)
+                await self.logger.error(f"Execution error: timed out after {timeout}s")
+                return context
+            except BrokenProcessPool as e:
+                self.reset_pool(pool)
+                if not attempt:
+                    # Пул ломается и при завершении чужого зависшего воркера — повторяем один раз на новом
+                    continue
+                await self.logger.error(f"Execution error: worker crashed: {e}")
+                return context
+            except Exception as e:
+                await self.logger.error(f"Execution error: {e}")
+                return context
+            finally:
+                self._running.pop(job_id, None)
+                self._collect_started()
+            break
+
+        for line in printed:
+            await self.logger.print(line)
+        if error:
+            await self.logger.error(f"Execution error:\n{error}")
+        return result
+
+
+def get_code_executor(logger) -> CodeExecutorBase:
+    if settings.CODE_EXECUTOR_BACKEND == "process":
+        return ProcessCodeExecutor(logger)
+    return CodeExecutor(logger)
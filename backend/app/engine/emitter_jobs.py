@@ -0,0 +1,20 @@
+import logging
+
+from app.broker import broker
+
+logger = logging.getLogger(__name__)
+
+EMITTER_BATCH_STREAM = "emitter.batch"
+EMITTER_EVENTS_STREAM = "emitter.events"
+
+
+# Задачи планировщика хранятся в Redis ссылкой на функцию, поэтому она живет в
+# импортируемом модуле, а не в scheduler.py (тот запускается как __main__)
+async def publish_emitter_message_batch(message_data):
+    logger.info(f"[EMIT] Publishing message batch: {message_data}")
+    await broker.publish(message_data, stream=EMITTER_BATCH_STREAM)
+
+
+async def publish_emitter_event(event: str, data: dict):
+    logger.info(f"[EMIT] Publishing event: {event} | data: {data}")
+    await broker.publish({"event": event, "data": data}, stream=EMITTER_EVENTS_STREAM)
@@ -1,7 +1,9 @@
+import asyncio
 import io
 import json
+import tempfile
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Union
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Union
 from fastapi import UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 from openpyxl import Workbook
@@ -14,6 +16,8 @@ from app.services.s3_storage_service import S3StorageService
 from app.services.attachment_repository_sql import SqlAttachmentRepository
 from app.database import sessionmanager
 
+CHUNK_SIZE = 64 * 1024
+
 
 class FileCreatorException(Exception):
     pass
@@ -24,40 +28,68 @@ class FileCreator(ABC):
     def create(self, data: Any) -> io.BytesIO:
         pass
 
+    def stream(self, data: Any) -> Iterator[bytes]:
+        """Файл частями. По умолчанию собирается целиком через create."""
+        b = self.create(data)
+        while chunk := b.read(CHUNK_SIZE):
+            yield chunk
+
+
+def _batched(parts: Iterable[str], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Склеивает мелкие строки в куски около size байт."""
+    buffer, buffered = [], 0
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield "".join(buffer).encode('utf-8')
+            buffer, buffered = [], 0
+    if buffer:
+        yield "".join(buffer).encode('utf-8')
+
 
 class CSVFileCreator(FileCreator):
     def create(self, data: List[Dict[str, Any]]) -> io.BytesIO:
-        b = io.BytesIO()
-        if data:
-            header = ",".join(data[0].keys()) + "\n"
-            csv_data = header + "".join([",".join(str(value) for value in row.values()) + "\n" for row in data])
-            b.write(csv_data.encode('utf-8'))
-        b.seek(0)
-        return b
+        return io.BytesIO(b"".join(self.stream(data)))
+
+    def stream(self, data: List[Dict[str, Any]]) -> Iterator[bytes]:
+        return _batched(self._lines(data))
+
+    @staticmethod
+    def _lines(data: List[Dict[str, Any]]) -> Iterator[str]:
+        # Формат прежний: значения через str() без кавычек, None пишется как "None"
+        if not data:
+            return
+        yield ",".join(data[0].keys()) + "\n"
+        for row in data:
+            yield ",".join(str(value) for value in row.values()) + "\n"
 
 
 class ExcelFileCreator(FileCreator):
     def create(self, data: List[Dict[str, Any]]) -> io.BytesIO:
-        b = io.BytesIO()
-        wb = Workbook()
-        ws = wb.active
+        return io.BytesIO(b"".join(self.stream(data)))
+
+    def stream(self, data: List[Dict[str, Any]]) -> Iterator[bytes]:
+        # write-only режим сбрасывает строки на диск, а не держит ячейки в памяти
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
         if data:
-            header = list(data[0].keys())
-            ws.append(header)
+            ws.append(list(data[0].keys()))
             for row in data:
                 ws.append(list(row.values()))
-        wb.save(b)
-        b.seek(0)
-        return b
+        with tempfile.TemporaryFile() as f:
+            wb.save(f)
+            f.seek(0)
+            while chunk := f.read(CHUNK_SIZE):
+                yield chunk
 
 
 class JSONFileCreator(FileCreator):
     def create(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> io.BytesIO:
-        b = io.BytesIO()
-        json_data = json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
-        b.write(json_data)
-        b.seek(0)
-        return b
+        return io.BytesIO(b"".join(self.stream(data)))
+
+    def stream(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Iterator[bytes]:
+        return _batched(json.JSONEncoder(ensure_ascii=False, indent=4).iterencode(data))
 
 
 class TXTFileCreator(FileCreator):
@@ -98,7 +130,6 @@ async def create_universal_file_attachment(session: AsyncSession, data: Any, fil
     if not creator:
         raise ValueError(f"Неподдерживаемый тип файла: {file_type}")
 
-    b = creator.create(data)
     full_name = f"{filename}.{file_type}"
     guessed_type, _ = mimetypes.guess_type(full_name)
     content_type = guessed_type or {
@@ -113,6 +144,13 @@ async def create_universal_file_attachment(session: AsyncSession, data: Any, fil
         storage = S3StorageService()
         repo = SqlAttachmentRepository(sessionmanager.engine)
         service = AttachmentService(storage, repo)
-    meta = await service.create_from_bytes(b.getvalue(), full_name, content_type)
+    meta = await service.create_from_stream(iterate_in_thread(creator.stream(data)), full_name, content_type)
     return {"id": meta.id, "content_type": meta.content_type, "file_name": meta.file_name,
             "size": meta.size, "url": f"{meta.id}"}
+
+
+async def iterate_in_thread(chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+    """Генерация файла (openpyxl, json) идет в потоке и не блокирует event loop."""
+    iterator = iter(chunks)
+    while (chunk := await asyncio.to_thread(next, iterator, None)) is not None:
+        yield chunk
@@ -1,9 +1,9 @@
 """Handler для выполнения интеграций через библиотеки."""
-from typing import Dict, Any, Union
+from typing import Dict, Any, Optional, Union
 from uuid import UUID
 
 from app.engine.bot_processor import ConnectionHandler
-from app.engine.variables import replace_variables_universal
+from app.engine.variables import TemplateCache
 from app.utils.dict import deep_merge_dicts
 from app.integrations.registry import registry
 from app.auth.credentials_resolver import CredentialsResolver
@@ -15,9 +15,11 @@ from app.schemas.connection import ConnectionGroupExport
 class ConnectionIntegrationHandler(ConnectionHandler):
     """Handler для интеграций, использующих библиотеки напрямую."""
     
-    def __init__(self, logger: BotLogger, data_manager: DataManager, bot_id: Union[UUID, str]):
+    def __init__(self, logger: BotLogger, data_manager: DataManager, bot_id: Union[UUID, str],
+                 templates: Optional[TemplateCache] = None):
         self.logger = logger
         self.data_manager = data_manager
+        self.templates = templates or TemplateCache()
         # Преобразуем bot_id в UUID если это строка
         if isinstance(bot_id, str):
             try:
@@ -64,7 +66,8 @@ class ConnectionIntegrationHandler(ConnectionHandler):
         
         try:
             # Подставляем переменные в config (рекурсивно для всех значений)
-            substituted_config = await replace_variables_universal(integration_config, merged_context)
+            config_template = self.templates.get(connection_group, "integration_config", lambda: integration_config)
+            substituted_config = config_template.render(merged_context)
             await self.logger.info(f"Config after variable substitution: {substituted_config}")
         except Exception as e:
             await self.logger.error(f"Error substituting variables in integration config: {e}")
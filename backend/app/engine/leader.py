@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+from app.engine.ordering import _RELEASE_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+# Продлеваем свое лидерство или занимаем свободное; чужое не трогаем
+_HOLD_SCRIPT = """
+local current = redis.call('get', KEYS[1])
+if current == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if not current then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LeaderElection:
+    """
+    Выбор ведущей реплики через ключ в Redis (SET NX PX).
+    Лидер продлевает ключ каждые renew_interval секунд; если продлить не удалось
+    (ключ истек или Redis недоступен), лидерство снимается сразу, до истечения ttl
+    у других реплик — так два лидера одновременно не работают.
+    """
+
+    REDIS_PREFIX = "leader:"
+
+    def __init__(self, redis, name: str, ttl: float = 15, renew_interval: float = 5):
+        self.redis = redis
+        self.key = self.REDIS_PREFIX + name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.token = uuid4().hex
+        self.is_leader = False
+
+    async def run(self, on_elected: Optional[Callback] = None, on_revoked: Optional[Callback] = None) -> None:
+        """Цикл выборов: пытается стать лидером и удерживает лидерство до отмены."""
+        try:
+            while True:
+                leader = await self._try_hold()
+                if leader and not self.is_leader:
+                    self.is_leader = True
+                    logger.info(f"[LEADER] Acquired {self.key}")
+                    await self._callback(on_elected)
+                elif not leader and self.is_leader:
+                    self.is_leader = False
+                    logger.warning(f"[LEADER] Lost {self.key}")
+                    await self._callback(on_revoked)
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                await self._callback(on_revoked)
+                await self.resign()
+
+    async def _try_hold(self) -> bool:
+        try:
+            return bool(await self.redis.eval(_HOLD_SCRIPT, 1, self.key, self.token, int(self.ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"[LEADER] Election for {self.key} failed: {e}")
+            return False
+
+    async def _callback(self, callback: Optional[Callback]) -> None:
+        if callback is None:
+            return
+        try:
+            await callback()
+        except Exception:
+            logger.exception(f"[LEADER] Callback for {self.key} failed")
+
+    async def resign(self) -> None:
+        try:
+            await self.redis.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+        except Exception as e:
+            logger.warning(f"[LEADER] Failed to release {self.key}: {e}")
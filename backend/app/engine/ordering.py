@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+# Снимаем блокировку, только если она всё ещё наша
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Продлеваем блокировку, только если она всё ещё наша
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def session_key(message_data: Any) -> Optional[str]:
+    """
+    Ключ упорядочивания сообщения из стрима: канал и отправитель.
+    Получатель в ключ не входит: сообщение в канал и личное сообщение боту от того же
+    отправителя меняют одну сессию (отправитель, бот, канал) и не должны идти параллельно.
+    """
+    try:
+        channel_id = message_data.get("channel_id")
+        message_obj = message_data["message"]["message"]
+        sender_id = message_obj.get("sender_id")
+    except (KeyError, TypeError, AttributeError):
+        return None
+    if not channel_id or not sender_id:
+        return None
+    return f"{channel_id}:{sender_id}"
+
+
+class KeyedScheduler:
+    """
+    Обработка по одному на ключ при полной параллельности между ключами.
+    Внутри процесса задачи ключа идут в порядке прихода (FIFO-очередь asyncio.Lock).
+    Между репликами блокировка в Redis (SET NX PX) дает только взаимное исключение:
+    кто из ожидающих реплик возьмет ключ следующим, решает опрос, а не порядок в стриме.
+    Пока обработка идет, блокировка продлевается каждые lock_ttl / 3 секунд, поэтому
+    долгая обработка не отдает ключ другой реплике; снимается она только владельцем.
+    """
+
+    REDIS_PREFIX = "ordering:"
+
+    def __init__(self, redis=None, lock_ttl: float = 120, poll_interval: float = 0.05,
+                 max_poll_interval: float = 0.5):
+        self.redis = redis
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.renew_interval = lock_ttl / 3
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._waiters: dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Optional[str]):
+        if key is None:
+            yield
+            return
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                token = await self._acquire_remote(key)
+                renewer = asyncio.create_task(self._renew_remote(key, token)) if token else None
+                try:
+                    yield
+                finally:
+                    if renewer is not None:
+                        renewer.cancel()
+                        await asyncio.gather(renewer, return_exceptions=True)
+                    await self._release_remote(key, token)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                # Ключ никому не нужен — не копим блокировки для каждого отправителя
+                del self._waiters[key]
+                self._locks.pop(key, None)
+
+    async def _acquire_remote(self, key: str) -> Optional[str]:
+        if self.redis is None:
+            return None
+        token = uuid4().hex
+        delay = self.poll_interval
+        try:
+            while not await self.redis.set(self.REDIS_PREFIX + key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+        except Exception as e:
+            logger.warning(f"Ordering lock for {key} unavailable, processing without it: {e}")
+            return None
+        return token
+
+    async def _renew_remote(self, key: str, token: str) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                renewed = await self.redis.eval(_RENEW_SCRIPT, 1, self.REDIS_PREFIX + key, token,
+                                                int(self.lock_ttl * 1000))
+            except Exception as e:
+                logger.warning(f"Failed to renew ordering lock for {key}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Ordering lock for {key} expired before processing finished")
+                return
+
+    async def _release_remote(self, key: str, token: Optional[str]) -> None:
+        if token is None:
+            return
+        try:
+            await self.redis.eval(_RELEASE_SCRIPT, 1, self.REDIS_PREFIX + key, token)
+        except Exception as e:
+            logger.warning(f"Failed to release ordering lock for {key}: {e}")
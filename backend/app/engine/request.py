@@ -1,30 +1,224 @@
-from httpx import AsyncClient, Response, Limits, Timeout, AsyncHTTPTransport
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+from urllib.parse import urlsplit
 
+from httpx import (AsyncClient, AsyncHTTPTransport, ConnectError, ConnectTimeout, HTTPError, Limits, Response,
+                   Timeout, TransportError)
 
-global_http_client = AsyncClient(
-    timeout=Timeout(30.0),
-    limits=Limits(
-        max_connections=100,           # до 100 одновременных соединений (параллельных)
-        max_keepalive_connections=20   # держать открытыми 20 соединений
-    ),
+from app.config import settings
+from app.engine.response_cache import CACHEABLE_METHODS, ResponseCache, response_cache
+from app.metrics.engine import engine_metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class ResponseTooLarge(HTTPError):
+    pass
+
+
+class HttpClientRegistry:
+    """
+    Общие HTTP-клиенты процесса. Клиент выбирается по настройкам прокси и TLS
+    и живет до aclose(), поэтому соединения и TLS-сессии переиспользуются между вызовами.
+    Помимо общего пула ограничивается число одновременных запросов к одному хосту.
+    """
+
+    def __init__(
+            self,
+            *,
+            timeout: float = 30.0,
+            connect_timeout: float = 10.0,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            max_connections_per_host: int = 20,
+            retries: int = 2,
+            retry_backoff: float = 0.5,
+            retry_after_max: float = 30,
+            max_response_bytes: int = 0,
+            cache: Optional[ResponseCache] = None,
+    ):
+        self.timeout = Timeout(timeout, connect=connect_timeout)
+        self.limits = Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_after_max = retry_after_max
+        self.max_response_bytes = max_response_bytes
+        self.cache = cache
+        self._clients: dict[tuple, AsyncClient] = {}
+        self._host_slots: dict[tuple, asyncio.Semaphore] = {}
+
+    def get(self, proxy: Optional[str] = None, verify: bool = True) -> AsyncClient:
+        key = (proxy or None, verify)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._clients[key] = self._build(proxy or None, verify)
+        return client
+
+    def _build(self, proxy: Optional[str], verify: bool) -> AsyncClient:
+        transport = AsyncHTTPTransport(
+            verify=verify,
+            http2=HTTP2_AVAILABLE,
+            limits=self.limits,
+            proxy=proxy,
+            # Исходящие через прокси запросы уходят по IPv4
+            local_address="0.0.0.0" if proxy else None,
+        )
+        return AsyncClient(timeout=self.timeout, limits=self.limits, transport=transport, verify=verify)
+
+    def _host_slot(self, client_key: tuple, url: str) -> asyncio.Semaphore:
+        key = (client_key, urlsplit(str(url)).netloc)
+        slot = self._host_slots.get(key)
+        if slot is None:
+            slot = self._host_slots[key] = asyncio.Semaphore(self.max_connections_per_host)
+        return slot
+
+    async def request(self, method: str, url: str, *, proxy: Optional[str] = None, verify: bool = True,
+                      max_bytes: Optional[int] = None, cache_ttl: Optional[float] = None, cache_scope=None,
+                      **kwargs) -> Response:
+        """
+        Выполняет запрос через общий клиент. С cache_ttl ответы GET/HEAD берутся из кеша;
+        ключ — метод, URL, params и cache_scope (id кредов) вместе с заголовками запроса.
+        """
+        method = method.upper()
+        if not cache_ttl or self.cache is None or method not in CACHEABLE_METHODS:
+            return await self._request(method, url, proxy=proxy, verify=verify, max_bytes=max_bytes, **kwargs)
+
+        headers = kwargs.pop("headers", None)
+        key = self.cache.make_key(method, url, kwargs.get("params"), [cache_scope, headers, proxy])
+
+        async def fetch(extra_headers: dict) -> Response:
+            request_headers = {**headers, **extra_headers} if isinstance(headers, dict) else headers or extra_headers
+            return await self._request(method, url, proxy=proxy, verify=verify, max_bytes=max_bytes,
+                                       headers=request_headers, **kwargs)
+
+        return await self.cache.get_or_fetch(key, cache_ttl, fetch)
+
+    async def _request(self, method: str, url: str, *, proxy: Optional[str] = None, verify: bool = True,
+                       max_bytes: Optional[int] = None, **kwargs) -> Response:
+        """
+        Выполняет запрос с повторами и читает тело не больше max_bytes
+        (по умолчанию max_response_bytes, 0 — без ограничения).
+        Повторяются идемпотентные запросы при сетевых ошибках и ответах 429/502/503/504;
+        остальные — только если соединение не удалось установить.
+        Если сервер просит ждать (Retry-After) дольше retry_after_max, ответ возвращается без повтора.
+        """
+        client = self.get(proxy, verify)
+        max_bytes = self.max_response_bytes if max_bytes is None else max_bytes
+        # Файлы читаются при отправке, повторить такой запрос нельзя
+        retries = 0 if kwargs.get("files") else self.retries
+        operation = f"{method} {urlsplit(str(url)).netloc}"
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with engine_metrics.acquire(self._host_slot((proxy or None, verify), url), "http_host"):
+                    started = time.perf_counter()
+                    status = "error"
+                    try:
+                        response = await self._send(client, method, url, max_bytes, **kwargs)
+                        status = str(response.status_code)
+                    finally:
+                        engine_metrics.observe_call("http", operation, status, time.perf_counter() - started)
+            except (ConnectError, ConnectTimeout) as e:
+                if attempt >= retries:
+                    raise
+                logger.warning(f"{method} {url}: {e!r}, retrying")
+            except TransportError as e:
+                if attempt >= retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                logger.warning(f"{method} {url}: {e!r}, retrying")
+            else:
+                if attempt >= retries or method not in IDEMPOTENT_METHODS or response.status_code not in RETRY_STATUSES:
+                    return response
+                retry_after = self._retry_after(response)
+                if retry_after is not None and retry_after > self.retry_after_max:
+                    logger.warning(f"{method} {url}: HTTP {response.status_code}, "
+                                   f"Retry-After {retry_after:g}s exceeds {self.retry_after_max:g}s, giving up")
+                    return response
+                logger.warning(f"{method} {url}: HTTP {response.status_code}, retrying")
+            await asyncio.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    @staticmethod
+    def _retry_after(response: Optional[Response]) -> Optional[float]:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return None
+
+    def _backoff(self, attempt: int, response: Optional[Response]) -> float:
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.retry_after_max)
+        return self.retry_backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    @staticmethod
+    async def _send(client: AsyncClient, method: str, url: str, max_bytes: int, **kwargs) -> Response:
+        request = client.build_request(method, url, **kwargs)
+        response = await client.send(request, stream=True)
+        try:
+            if not max_bytes:
+                await response.aread()
+                return response
+            declared = response.headers.get("Content-Length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ResponseTooLarge(f"Response body is {declared} bytes, limit is {max_bytes}")
+            chunks, size = [], 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ResponseTooLarge(f"Response body exceeds {max_bytes} bytes")
+                chunks.append(chunk)
+        finally:
+            await response.aclose()
+        # Тело уже распаковано, заголовки кодирования к нему не относятся
+        headers = [(k, v) for k, v in response.headers.multi_items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return Response(response.status_code, headers=headers, content=b"".join(chunks),
+                        request=request, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        self._host_slots.clear()
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close HTTP client: {e}")
+
+
+http_clients = HttpClientRegistry(
+    timeout=settings.HTTP_TIMEOUT,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    max_connections=settings.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    max_connections_per_host=settings.HTTP_MAX_CONNECTIONS_PER_HOST,
+    retries=settings.HTTP_RETRIES,
+    retry_backoff=settings.HTTP_RETRY_BACKOFF,
+    retry_after_max=settings.HTTP_RETRY_AFTER_MAX,
+    max_response_bytes=settings.HTTP_MAX_RESPONSE_BYTES,
+    cache=response_cache,
 )
 
 
 async def make_request(method, url, params=None, headers=None, content=None, data=None, json_field=None, files=None,
-                       proxies=None) -> dict:
-    http_client = global_http_client
-    if proxies is not None:
-        http_client = AsyncClient(
-            timeout=Timeout(30.0),
-            limits=Limits(
-                max_connections=100,  # до 100 одновременных соединений (параллельных)
-                max_keepalive_connections=20  # держать открытыми 20 соединений
-            ),
-            proxies=proxies,
-            transport=AsyncHTTPTransport(local_address="0.0.0.0")
-        )
-    response: Response = await http_client.request(
-        method, url, params=params, files=files, content=content, json=json_field, data=data, headers=headers,
+                       proxies=None, cache_ttl=None, cache_scope=None) -> dict:
+    response: Response = await http_clients.request(
+        method, url, proxy=proxies, params=params, files=files, content=content, json=json_field, data=data,
+        headers=headers, cache_ttl=cache_ttl, cache_scope=cache_scope,
     )
     json_result = {"response": response.json()}
     return json_result
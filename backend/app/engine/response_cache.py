@@ -0,0 +1,200 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from httpx import Request, Response
+
+from app.config import settings
+from app.metrics.engine import engine_metrics
+
+logger = logging.getLogger(__name__)
+
+CACHEABLE_METHODS = frozenset({"GET", "HEAD"})
+# Заголовки, которые не относятся к уже распакованному телу
+_SKIP_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "set-cookie"})
+
+
+def parse_cache_control(value: Optional[str]) -> dict[str, Optional[str]]:
+    directives: dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+class ResponseCache:
+    """
+    Кеш ответов идемпотентных внешних запросов (GET/HEAD), включается TTL у запроса или интеграции.
+    L1 — LRU в памяти процесса, L2 (опционально) — Redis, общий для всех реплик.
+    TTL ограничивается Cache-Control ответа (max-age, no-store, no-cache); устаревшая запись
+    с ETag/Last-Modified хранится еще revalidate_window секунд и перепроверяется условным запросом.
+    Параллельные промахи по одному ключу ждут один запрос к API (singleflight).
+    """
+
+    REDIS_PREFIX = "http:cache:"
+
+    def __init__(self, redis=None, maxsize: int = 1000, max_entry_bytes: int = 1024 * 1024,
+                 revalidate_window: float = 300):
+        self._redis = redis
+        self.maxsize = maxsize
+        self.max_entry_bytes = max_entry_bytes
+        self.revalidate_window = revalidate_window
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def set_redis(self, redis) -> None:
+        self._redis = redis
+
+    @staticmethod
+    def make_key(method: str, url: str, params: Any = None, scope: Any = None) -> str:
+        raw = json.dumps([method.upper(), str(url), params, scope], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _now() -> float:
+        return time.time()
+
+    def _is_fresh(self, entry: dict) -> bool:
+        return entry["expires_at"] > self._now()
+
+    async def get_or_fetch(self, key: str, ttl: float,
+                           fetch: Callable[[dict], Awaitable[Response]]) -> Response:
+        """
+        Возвращает ответ из кеша или выполняет fetch(extra_headers).
+        В extra_headers передаются заголовки условного запроса, если есть что перепроверить.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and self._is_fresh(entry):
+            self._entries.move_to_end(key)
+            engine_metrics.observe_cache("http", "l1", True)
+            return self._build(entry)
+        engine_metrics.observe_cache("http", "l1", False)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._load(key, ttl, fetch))
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        # shield: отмена одного ожидающего не должна отменять запрос для остальных
+        result = await asyncio.shield(task)
+        return self._build(result) if isinstance(result, dict) else result
+
+    async def _load(self, key: str, ttl: float, fetch: Callable[[dict], Awaitable[Response]]):
+        entry = self._entries.get(key)
+        if entry is not None and entry["stale_until"] <= self._now():
+            self._entries.pop(key, None)
+            entry = None
+        if entry is None:
+            entry = await self._redis_get(key)
+        if entry is not None and self._is_fresh(entry):
+            self._remember(key, entry)
+            engine_metrics.observe_cache("http", "redis", True)
+            return entry
+        engine_metrics.observe_cache("http", "redis", False)
+
+        extra_headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                extra_headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                extra_headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = await fetch(extra_headers)
+        if response.status_code == 304 and entry is not None:
+            entry = {**entry, **self._lifetime(response, ttl, entry)}
+            await self._store(key, entry)
+            return entry
+
+        entry = self._entry(response, ttl)
+        if entry is None:
+            self._entries.pop(key, None)
+            return response
+        await self._store(key, entry)
+        return entry
+
+    def _lifetime(self, response: Response, ttl: float, entry: Optional[dict] = None) -> dict:
+        directives = parse_cache_control(response.headers.get("Cache-Control"))
+        max_age = directives.get("s-maxage") or directives.get("max-age")
+        if "no-cache" in directives:
+            ttl = 0
+        elif max_age and max_age.isdigit():
+            ttl = min(ttl, int(max_age))
+        etag = response.headers.get("ETag") or (entry or {}).get("etag")
+        last_modified = response.headers.get("Last-Modified") or (entry or {}).get("last_modified")
+        now = self._now()
+        keep = ttl + (self.revalidate_window if etag or last_modified else 0)
+        return {
+            "expires_at": now + ttl,
+            "stale_until": now + keep,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+    def _entry(self, response: Response, ttl: float) -> Optional[dict]:
+        if response.status_code != 200:
+            return None
+        directives = parse_cache_control(response.headers.get("Cache-Control"))
+        if "no-store" in directives or len(response.content) > self.max_entry_bytes:
+            return None
+        entry = self._lifetime(response, ttl)
+        if entry["stale_until"] <= self._now():
+            return None
+        return {
+            **entry,
+            "method": response.request.method,
+            "url": str(response.request.url),
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in _SKIP_HEADERS],
+            "body": base64.b64encode(response.content).decode("ascii"),
+        }
+
+    @staticmethod
+    def _build(entry: dict) -> Response:
+        return Response(
+            entry["status"],
+            headers=entry["headers"],
+            content=base64.b64decode(entry["body"]),
+            request=Request(entry["method"], entry["url"]),
+        )
+
+    def _remember(self, key: str, entry: dict) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _store(self, key: str, entry: dict) -> None:
+        self._remember(key, entry)
+        await self._redis_set(key, entry)
+
+    async def _redis_get(self, key: str) -> Optional[dict]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(self.REDIS_PREFIX + key)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"Response cache redis read failed: {e}")
+            return None
+
+    async def _redis_set(self, key: str, entry: dict) -> None:
+        if self._redis is None:
+            return
+        ttl = int(entry["stale_until"] - self._now())
+        if ttl <= 0:
+            return
+        try:
+            await self._redis.set(self.REDIS_PREFIX + key, json.dumps(entry), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Response cache redis write failed: {e}")
+
+
+response_cache = ResponseCache(
+    maxsize=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+)
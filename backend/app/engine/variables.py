@@ -1,6 +1,6 @@
 import json
 import logging
-from typing import Any, Dict, List, Union, Optional, Tuple, Type
+from typing import Any, Callable, Dict, List, Union, Optional, Tuple, Type
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import SessionModel
@@ -34,77 +34,169 @@ async def variable_loader(
     return value
 
 
+def _format_variable_value(value: Any) -> str:
+    """Представляет значение переменной в виде строки для вставки в шаблон."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)  # Encode for complex types
+    if value is None:
+        return ""
+    return str(value)
+
+
+# Символы, с которых может начинаться валидный JSON: без них json.loads заведомо упадёт
+_JSON_START_CHARS = frozenset('{["-0123456789tfnNI')
+
+
+def _loads_if_json(text: str) -> Any:
+    """Пытается вернуть JSON из строки после подстановки, иначе саму строку."""
+    if text.lstrip()[:1] not in _JSON_START_CHARS:
+        return text
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+class StringTemplate:
+    """
+    Скомпилированная строка с переменными: чередование литералов и путей переменных.
+    Рендер не использует регулярные выражения.
+    """
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: Tuple[Union[str, Tuple[str, ...]], ...]):
+        self.parts = parts
+
+    def render(self, context: Dict[str, Any] | None = None) -> Any:
+        chunks = []
+        for part in self.parts:
+            if isinstance(part, str):
+                chunks.append(part)
+            else:
+                value = get_value_by_list_keys(context, part) if context else None
+                chunks.append(_format_variable_value(value))
+        return _loads_if_json("".join(chunks))
+
+
+class LiteralTemplate:
+    """Значение без переменных."""
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def render(self, context: Dict[str, Any] | None = None) -> Any:
+        return self.value
+
+
+class ListTemplate:
+    __slots__ = ("items",)
+
+    def __init__(self, items: list):
+        self.items = items
+
+    def render(self, context: Dict[str, Any] | None = None) -> list:
+        return [item.render(context) for item in self.items]
+
+
+class DictTemplate:
+    __slots__ = ("items",)
+
+    def __init__(self, items: list):
+        self.items = items
+
+    def render(self, context: Dict[str, Any] | None = None) -> dict:
+        return {key.render(context): value.render(context) for key, value in self.items}
+
+
+@lru_cache(maxsize=4096)
+def compile_string_template(text: str) -> Optional[StringTemplate]:
+    """
+    Разбирает строку на литералы и пути переменных {$path$}.
+    Возвращает None, если переменных в строке нет.
+    """
+    parts: List[Union[str, Tuple[str, ...]]] = []
+    position = 0
+    for match in VARIABLE_PATTERN.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        parts.append(tuple(match.group(1).split(".")))
+        position = match.end()
+    if not parts:
+        return None
+    if position < len(text):
+        parts.append(text[position:])
+    return StringTemplate(tuple(parts))
+
+
+def compile_template(data: Any):
+    """
+    Компилирует строку, список или словарь в дерево шаблона с методом render(context).
+    Результат рендера совпадает с replace_variables_universal.
+    """
+    if isinstance(data, str):
+        return compile_string_template(data) or LiteralTemplate(data)
+    if isinstance(data, list):
+        return ListTemplate([compile_template(item) for item in data])
+    if isinstance(data, dict):
+        return DictTemplate([
+            (compile_template(key) if isinstance(key, str) else LiteralTemplate(key), compile_template(value))
+            for key, value in data.items()
+        ])
+    return LiteralTemplate(data)
+
+
+def compile_rule_value(value: Any) -> Optional[Callable[[Dict[str, Any]], Any]]:
+    """
+    Компилятор значений для app.jqqb.compile_rules: функция рендера значения
+    по контексту или None, если переменных в значении нет.
+    """
+    template = compile_template(value)
+    return None if isinstance(template, LiteralTemplate) else template.render
+
+
+class TemplateCache:
+    """
+    Кеш скомпилированных шаблонов для объектов структуры бота.
+    Живёт вместе со скомпилированным ботом и сбрасывается вместе с его версией.
+    """
+
+    def __init__(self):
+        self._templates: Dict[Tuple[int, str], Tuple[Any, Any]] = {}
+
+    def get(self, owner: Any, kind: str, build: Callable[[], Any],
+            compiler: Callable[[Any], Any] = compile_template):
+        key = (id(owner), kind)
+        entry = self._templates.get(key)
+        # Храним ссылку на владельца, чтобы id не переиспользовался, пока шаблон в кеше
+        if entry is None or entry[0] is not owner:
+            entry = (owner, compiler(build()))
+            self._templates[key] = entry
+        return entry[1]
+
+
 async def replace_variables_universal(
         data: Union[str, List[Any], Dict[str, Any]] = {},
         context: Dict[str, Any] | None = None
 ) -> Union[str, List[Any], Dict[str, Any]]:
     """
     Рекурсивно заменяет переменные в формате {$variable_name$} в строке, списке или словаре
-    на соответствующие значения, полученные с помощью функции variable_loader.
-    """
-
-    def replace_in_string(text: str, replacements: Dict[str, Any]) -> str:
-        """
-        Заменяет переменные в строке, используя предоставленные значения.
-        """
-
-        def replace_match(match: re.Match) -> str:
-            """
-            Внутренняя функция для обработки одного совпадения переменной.
-            """
-            variable_name = match.group(1)
-            # Ensure the value is JSON encoded only if it's not a primitive or collection type
-            value = replacements[variable_name]
-            if isinstance(value, (dict, list)):
-                return json.dumps(value, ensure_ascii=False)  # Encode for complex types
-            else:
-                if value is None:
-                    return ""
-                return str(value)  # Ensure it is still represented as string in the target data
-
-        return VARIABLE_PATTERN.sub(replace_match, text)  # Returns origin Type
-
+    на соответствующие значения из контекста. Разбор строк кешируется.
+    """
     if isinstance(data, str):
-        # 1. Extract replace map
-        variable_names = extract_variable_names(data)  # Extract map to go through.
-        if variable_names:
-            replacements: Dict[str, Any] = {}
-            for variable_name in variable_names:  # Go through variable names
-                value = await variable_loader(variable_name, context)  # Load values from variable loader, Passing context
-                replacements[variable_name] = value
-
-            new_string = replace_in_string(data, replacements)  # Returns origin Type
-            # Now we attempt to convert this to JSON or leave it be
-
-            if isinstance(new_string, str):  # This is only done IF new Type == str
-                try:
-                    return json.loads(new_string)  # Try to get back a JSON if you can
-                except json.JSONDecodeError as e:
-                    return new_string  # return String if cant
-            else:
-                return new_string  # We have JSON - no need to string it.
-        return data  # Return data if No variables where found!
+        template = compile_string_template(data)
+        return data if template is None else template.render(context)
 
     elif isinstance(data, list):
-        new_list: List[Any] = []
-        for item in data:
-            # Рекурсивно обрабатываем каждый элемент списка.
-            new_list.append(
-                await replace_variables_universal(item, context))
-        return new_list
+        # Рекурсивно обрабатываем каждый элемент списка.
+        return [await replace_variables_universal(item, context) for item in data]
 
     elif isinstance(data, dict):
         new_dict: Dict[str, Any] = {}
         for key, value in data.items():
-            # Process Key
-            new_key = key
-            if isinstance(key, str):
-                # Рекурсивно обрабатываем ключ, если он строка.
-                new_key = await replace_variables_universal(key, context)
-
-            # Рекурсивно обрабатываем значение.
+            # Рекурсивно обрабатываем ключ, если он строка.
+            new_key = await replace_variables_universal(key, context) if isinstance(key, str) else key
             new_dict[new_key] = await replace_variables_universal(value, context)
-
         return new_dict
 
     return data
@@ -365,18 +457,77 @@ async def get_all_variables_dict(session: AsyncSession, session_obj: SessionMode
 
 async def variable_substitution_pydantic(
                                          model: Type[BaseModelPydantic],
-                                         context: Dict[str, Any] | None = None) -> BaseModel:
+                                         context: Dict[str, Any] | None = None,
+                                         templates: Optional[TemplateCache] = None) -> BaseModel:
     """
     Выполняет подстановку переменных в полях Pydantic-модели.
+    Если передан кеш шаблонов, модель компилируется один раз.
     """
-    data = await replace_variables_universal(model.model_dump(), context)
+    if templates is not None:
+        data = templates.get(model, "model", model.model_dump).render(context)
+    else:
+        data = await replace_variables_universal(model.model_dump(), context)
     return model.model_validate(data)
 
 
+class VariablesChanges:
+    """
+    Отслеживает изменённые пространства имен переменных и их ключи верхнего уровня,
+    чтобы сохранять только затронутые данные.
+    """
+
+    SCOPES = ("bot", "user", "channel", "session")
+
+    def __init__(self):
+        # {namespace: {key, ...}}; None вместо множества — изменено всё пространство имен
+        self._changed: Dict[str, Optional[set]] = {}
+
+    def mark(self, namespace: str, key: Optional[str] = None) -> None:
+        if namespace not in self.SCOPES:
+            return
+        if key is None:
+            self._changed[namespace] = None
+            return
+        keys = self._changed.setdefault(namespace, set())
+        if keys is not None:
+            keys.add(key)
+
+    def mark_dict(self, variables: Dict[str, Any]) -> None:
+        """Отмечает все ключи верхнего уровня из словаря вида {namespace: {key: value}}."""
+        for namespace, data in variables.items():
+            if isinstance(data, dict):
+                for key in data:
+                    self.mark(namespace, key)
+            else:
+                self.mark(namespace)
+
+    def __bool__(self) -> bool:
+        return bool(self._changed)
+
+    @property
+    def namespaces(self) -> List[str]:
+        return list(self._changed)
+
+    def patches(self, all_variables: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Возвращает {namespace: {key: value}} только для изменённых ключей."""
+        result: Dict[str, Dict[str, Any]] = {}
+        for namespace, keys in self._changed.items():
+            data = all_variables.get(namespace) or {}
+            if keys is None:
+                result[namespace] = dict(data) if isinstance(data, dict) else {}
+            else:
+                result[namespace] = {key: data.get(key) for key in keys if key in data}
+        return result
+
+    def clear(self) -> None:
+        self._changed.clear()
+
+
 async def update_variables_dict(current_vars: dict,
                                  session: AsyncSession,
                                  variables: dict,
-                                 context: dict) -> dict:
+                                 context: dict,
+                                 changes: Optional[VariablesChanges] = None) -> dict:
     updated_vars = current_vars.copy()
     for source_path, target_path in variables.items():
         target_variable_path, value = await _process_variable(session, session, source_path, target_path, context)
@@ -385,4 +536,6 @@ async def update_variables_dict(current_vars: dict,
         namespace, variable_parts = split_namespace(target_variable_path)
         variable_dict = _build_variable_dict(variable_parts, value)
         updated_vars[namespace] = deep_merge_dicts(updated_vars.get(namespace, {}), variable_dict)
+        if changes is not None:
+            changes.mark(namespace, variable_parts[0] if variable_parts else None)
     return updated_vars
@@ -3,13 +3,18 @@ import logging
 import os
 from uuid import uuid4
 
-from faststream import FastStream
+from faststream import Context, FastStream
+from faststream.middlewares import AckPolicy
 from faststream.redis import StreamSub
 from app.broker import broker
 from app.schemas import rebuild_models
 from app.config import settings
 from app.engine.bot_processor import check_message
-from redis.asyncio import Redis
+from app.engine.ordering import KeyedScheduler, session_key
+from app.metrics.engine import engine_metrics
+from app.metrics.server import start_metrics_server
+from app.stream_consumer import StreamConsumer
+from app.redis_pool import broker_redis, redis_pools
 
 import logging.config
 from app.logging_config import LOGGING_CONFIG
@@ -24,6 +29,9 @@ consumer_id = f"{role}-consumer-{uuid4()}"
 app = FastStream(broker)
 
 semaphore = asyncio.Semaphore(settings.DB_POOL_SIZE)
+stream_redis = broker_redis()
+# Сообщения одной сессии обрабатываются по очереди, в том числе на разных репликах
+session_scheduler = KeyedScheduler(stream_redis, lock_ttl=settings.SESSION_LOCK_TTL)
 
 
 async def handle_message(message_data):
@@ -37,110 +45,66 @@ async def handle_message(message_data):
     await check_message(message, channel_id)
 
 
-async def process_batch(messages, stream_name, group_name, from_claim=False):
-    async def process_one_safe(m):
-        async with semaphore:
-            try:
-                if from_claim:
-                    msg_id, payload = m
-                    await handle_message(payload)
-                    return msg_id
-                else:
-                    if isinstance(m.get("channel_id"), str) and m.get("channel_id") == "init":
-                        logger.debug("Skipping init message")
-                        return
-                    await handle_message(m)
-                    return None
-            except Exception:
-                logger.exception("Failed to process message")
-                return None
-
-    results = await asyncio.gather(*[process_one_safe(m) for m in messages])
-
-    if from_claim:
-        ack_ids = [msg_id for msg_id in results if msg_id]
-        logger.debug(f"ACKing messages: {ack_ids}")
-        if ack_ids:
-            await broker._connection.xack(stream_name, group_name, *ack_ids)
+async def process_one_safe(payload) -> bool:
+    """Обрабатывает одну запись стрима. True — запись можно подтвердить."""
+    try:
+        if isinstance(payload, dict) and payload.get("channel_id") == "init":
+            logger.debug("Skipping init message")
+            return True
+        # Ждём свою очередь до захвата семафора, чтобы не занимать слот впустую
+        async with session_scheduler.hold(session_key(payload)):
+            async with engine_metrics.acquire(semaphore, f"{role}_stream"):
+                await handle_message(payload)
+        return True
+    except Exception:
+        logger.exception("Failed to process message")
+        return False
+
 
 if role == "user":
+    stream_name, group_name = settings.USER_STREAM_NAME, settings.USER_STREAM_GROUP
+elif role == "bot":
+    stream_name, group_name = settings.BOT_STREAM_NAME, settings.BOT_STREAM_GROUP
+else:
+    raise ValueError(f"Unknown role: {role}")
 
-    @broker.subscriber(stream=StreamSub(
-        settings.USER_STREAM_NAME,
-        group=settings.USER_STREAM_GROUP,
-        consumer=consumer_id,
-        batch=True,
-        max_records=100,
-        no_ack=False))
-    async def handle_user_message(messages):
-        logger.info(f"Received {len(messages)} user messages")
-        await process_batch(messages, settings.USER_STREAM_NAME, settings.USER_STREAM_GROUP)
+stream_consumer = StreamConsumer(
+    stream_redis, stream_name, group_name, consumer_id, process_one_safe,
+    min_idle_ms=settings.STREAM_RECLAIM_IDLE_MS,
+    reclaim_count=settings.STREAM_RECLAIM_COUNT,
+    max_deliveries=settings.STREAM_MAX_DELIVERIES,
+)
 
-elif role == "bot":
 
-    @broker.subscriber(stream=StreamSub(
-        settings.BOT_STREAM_NAME,
-        group=settings.BOT_STREAM_GROUP,
+@broker.subscriber(
+    stream=StreamSub(
+        stream_name,
+        group=group_name,
         consumer=consumer_id,
         batch=True,
-        max_records=100,
-        no_ack=False))
-    async def handle_bot_message(messages):
-        logger.info(f"Received {len(messages)} bot messages")
-        await process_batch(messages, settings.BOT_STREAM_NAME, settings.BOT_STREAM_GROUP)
-
-else:
-    raise ValueError(f"Unknown role: {role}")
+        max_records=100),
+    # Подтверждаем сами: только успешно обработанные записи, одним XACK на батч
+    ack_policy=AckPolicy.MANUAL)
+async def handle_stream_messages(messages, message=Context("message")):
+    logger.info(f"Received {len(messages)} {role} messages")
+    await stream_consumer.process(zip(message.raw_message["message_ids"], messages))
 
 
 @app.after_startup
 async def after_startup_tasks():
-    stream_name = settings.BOT_STREAM_NAME if role == "bot" else settings.USER_STREAM_NAME
-    group_name = settings.BOT_STREAM_GROUP if role == "bot" else settings.USER_STREAM_GROUP
-
-    redis = Redis.from_url(settings.REDIS_URL)
+    start_metrics_server(settings.METRICS_PORT)
     try:
-        await redis.xadd(stream_name, {"message": "init", "channel_id": "init"})
+        await stream_redis.xadd(stream_name, {"message": "init", "channel_id": "init"})
         logger.info(f"[{role.upper()}] Initialized stream: {stream_name}")
     except Exception as e:
         logger.warning(f"[{role.upper()}] Stream initialization skipped or failed: {e}")
 
-    async def reclaim_pending():
-        logger.info(f"[{role.upper()}] Reclaim loop started for stream: {stream_name}, group: {group_name}, consumer: {consumer_id}")
-
-        while True:
-            try:
-                pending = await redis.xpending_range(
-                    stream_name,
-                    group_name,
-                    min="-",
-                    max="+",
-                    count=10
-                )
-                logger.debug(f"[{role.upper()}] Pending messages: {len(pending)}")
-
-                to_reclaim = [entry for entry in pending if entry["consumer"] != consumer_id]
-                for entry in to_reclaim:
-                    msg_id = entry["message_id"]
-                    logger.warning(f"[{role.upper()}] Reclaiming {msg_id} from {entry['consumer']}")
-
-                    claimed = await redis.xclaim(
-                        stream_name,
-                        group_name,
-                        consumer_id,
-                        min_idle_time=10_000,
-                        message_ids=[msg_id],
-                    )
-                    logger.info(f"[{role.upper()}] Claimed {len(claimed)} message(s)")
-
-                    await process_batch(claimed, stream_name, group_name, from_claim=True)
-            except Exception as e:
-                logger.exception(f"[{role.upper()}] Error during reclaim_pending: {e}")
-
-            logger.debug(f"[{role.upper()}] Reclaim loop sleeping 30s...")
-            await asyncio.sleep(30)
-
-    asyncio.create_task(reclaim_pending())
+    asyncio.create_task(stream_consumer.run_reclaim_loop(settings.STREAM_RECLAIM_INTERVAL))
+
+
+@app.after_shutdown
+async def after_shutdown_tasks():
+    await redis_pools.close()
 
 
 if __name__ == "__main__":
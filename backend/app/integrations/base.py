@@ -23,6 +23,7 @@ class IntegrationMetadata:
     credentials_strategy: str  # "api_key" или "oauth"
     library_name: Optional[str] = None  # "python-telegram-bot" если используется
     examples: Optional[List[dict]] = None  # Примеры использования
+    cache_ttl: Optional[int] = None  # Кеш ответов GET-запросов интеграции в секундах, None — без кеша
 
 
 class BaseIntegration(ABC):
@@ -110,10 +110,8 @@ class GetSubscribersIntegration(BaseIntegration):
         
         try:
             # Создаем DataManager для получения данных
-            from redis.asyncio import Redis
-            from app.config import settings
-            redis = Redis.from_url(settings.CACHE_REDIS_URL)
-            data_manager = DataManager(redis, sessionmanager.engine)
+            from app.redis_pool import cache_redis
+            data_manager = DataManager(cache_redis(), sessionmanager.engine)
             
             # Получаем список подписчиков с их типами
             subscribers_ids = await data_manager.get_channel_all_subscribers(
@@ -14,6 +14,8 @@ except ImportError:
     HTTPX_AVAILABLE = False
     httpx = None
 
+from app.engine.request import http_clients
+
 
 class OpenweathermapGetAirPollutionIntegration(BaseIntegration):
     """Интеграция для получения данных о загрязнении воздуха через OpenWeatherMap Air Pollution API."""
@@ -52,6 +54,7 @@ class OpenweathermapGetAirPollutionIntegration(BaseIntegration):
             credentials_provider="openweathermap",
             credentials_strategy="api_key",
             library_name="httpx" if HTTPX_AVAILABLE else None,
+            cache_ttl=300,
             examples=[
                 {
                     "title": "Текущее загрязнение воздуха в Москве",
@@ -200,39 +203,40 @@ class OpenweathermapGetAirPollutionIntegration(BaseIntegration):
         # Если координаты не определены, получаем их через Geocoding API
         if lat is None or lon is None:
             try:
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    geocode_response = await client.get(
-                        "https://api.openweathermap.org/geo/1.0/direct",
-                        params={
-                            "q": location,
-                            "limit": 1,
-                            "appid": api_key
-                        }
-                    )
+                geocode_response = await http_clients.request(
+                    "GET",
+                    "https://api.openweathermap.org/geo/1.0/direct",
+                    params={
+                        "q": location,
+                        "limit": 1,
+                        "appid": api_key
+                    },
+                    cache_ttl=self.metadata.cache_ttl
+                )
                     
-                    if geocode_response.status_code == 200:
-                        geocode_data = geocode_response.json()
-                        if geocode_data and len(geocode_data) > 0:
-                            lat = geocode_data[0].get("lat")
-                            lon = geocode_data[0].get("lon")
-                        else:
-                            await logger.error(f"City not found: {location}")
-                            return {
-                                "response": {
-                                    "ok": False,
-                                    "error_code": 404,
-                                    "description": f"City not found: {location}"
-                                }
-                            }
+                if geocode_response.status_code == 200:
+                    geocode_data = geocode_response.json()
+                    if geocode_data and len(geocode_data) > 0:
+                        lat = geocode_data[0].get("lat")
+                        lon = geocode_data[0].get("lon")
                     else:
-                        await logger.error(f"Geocoding API error: {geocode_response.status_code}")
+                        await logger.error(f"City not found: {location}")
                         return {
                             "response": {
                                 "ok": False,
-                                "error_code": geocode_response.status_code,
-                                "description": "Failed to get coordinates for city"
+                                "error_code": 404,
+                                "description": f"City not found: {location}"
                             }
                         }
+                else:
+                    await logger.error(f"Geocoding API error: {geocode_response.status_code}")
+                    return {
+                        "response": {
+                            "ok": False,
+                            "error_code": geocode_response.status_code,
+                            "description": "Failed to get coordinates for city"
+                        }
+                    }
             except Exception as e:
                 await logger.error(f"Geocoding error: {e}")
                 return {
@@ -270,56 +274,57 @@ class OpenweathermapGetAirPollutionIntegration(BaseIntegration):
         
         # ИСПОЛЬЗУЕМ HTTPX ДЛЯ ПРЯМЫХ HTTP ЗАПРОСОВ К AIR POLLUTION API
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    endpoint,
-                    params=params
-                )
+            response = await http_clients.request(
+                "GET",
+                endpoint,
+                params=params,
+                cache_ttl=self.metadata.cache_ttl
+            )
                 
-                if response.status_code == 200:
-                    data = response.json()
+            if response.status_code == 200:
+                data = response.json()
                     
-                    # Возвращаем результат в формате системы
-                    return {
-                        "response": {
-                            "ok": True,
-                            "result": {
-                                "coord": data.get("coord", {}),
-                                "list": data.get("list", [])
-                            }
+                # Возвращаем результат в формате системы
+                return {
+                    "response": {
+                        "ok": True,
+                        "result": {
+                            "coord": data.get("coord", {}),
+                            "list": data.get("list", [])
                         }
                     }
-                elif response.status_code == 401:
-                    await logger.error("Invalid API key")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 401,
-                            "description": "Invalid API key"
-                        }
+                }
+            elif response.status_code == 401:
+                await logger.error("Invalid API key")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 401,
+                        "description": "Invalid API key"
                     }
-                elif response.status_code == 400:
-                    error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
-                    error_message = error_data.get("message", "Bad request")
-                    await logger.error(f"Bad request: {error_message}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 400,
-                            "description": error_message
-                        }
+                }
+            elif response.status_code == 400:
+                error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+                error_message = error_data.get("message", "Bad request")
+                await logger.error(f"Bad request: {error_message}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 400,
+                        "description": error_message
                     }
-                else:
-                    error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    await logger.error(f"OpenWeatherMap API error: {error_message}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": response.status_code,
-                            "description": error_message
-                        }
+                }
+            else:
+                error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                await logger.error(f"OpenWeatherMap API error: {error_message}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": response.status_code,
+                        "description": error_message
                     }
+                }
         except httpx.TimeoutException as e:
             await logger.error(f"Request timeout: {e}")
             return {
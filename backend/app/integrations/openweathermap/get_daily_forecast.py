@@ -14,6 +14,8 @@ except ImportError:
     HTTPX_AVAILABLE = False
     httpx = None
 
+from app.engine.request import http_clients
+
 
 class OpenweathermapGetDailyForecastIntegration(BaseIntegration):
     """Интеграция для получения ежедневного прогноза погоды через OpenWeatherMap Daily Forecast API."""
@@ -63,6 +65,7 @@ class OpenweathermapGetDailyForecastIntegration(BaseIntegration):
             credentials_provider="openweathermap",
             credentials_strategy="api_key",
             library_name="httpx" if HTTPX_AVAILABLE else None,
+            cache_ttl=600,
             examples=[
                 {
                     "title": "Ежедневный прогноз для Москвы",
@@ -202,64 +205,65 @@ class OpenweathermapGetDailyForecastIntegration(BaseIntegration):
         
         # ИСПОЛЬЗУЕМ HTTPX ДЛЯ ПРЯМЫХ HTTP ЗАПРОСОВ К DAILY FORECAST API
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    "https://api.openweathermap.org/data/2.5/forecast/daily",
-                    params=params
-                )
+            response = await http_clients.request(
+                "GET",
+                "https://api.openweathermap.org/data/2.5/forecast/daily",
+                params=params,
+                cache_ttl=self.metadata.cache_ttl
+            )
                 
-                if response.status_code == 200:
-                    data = response.json()
+            if response.status_code == 200:
+                data = response.json()
                     
-                    # Возвращаем результат в формате системы
-                    return {
-                        "response": {
-                            "ok": True,
-                            "result": {
-                                "city": {
-                                    "id": data.get("city", {}).get("id"),
-                                    "name": data.get("city", {}).get("name"),
-                                    "country": data.get("city", {}).get("country"),
-                                    "coord": data.get("city", {}).get("coord", {}),
-                                    "population": data.get("city", {}).get("population"),
-                                    "timezone": data.get("city", {}).get("timezone")
-                                },
-                                "cnt": data.get("cnt"),
-                                "cod": data.get("cod"),
-                                "message": data.get("message", 0),
-                                "list": data.get("list", [])
-                            }
+                # Возвращаем результат в формате системы
+                return {
+                    "response": {
+                        "ok": True,
+                        "result": {
+                            "city": {
+                                "id": data.get("city", {}).get("id"),
+                                "name": data.get("city", {}).get("name"),
+                                "country": data.get("city", {}).get("country"),
+                                "coord": data.get("city", {}).get("coord", {}),
+                                "population": data.get("city", {}).get("population"),
+                                "timezone": data.get("city", {}).get("timezone")
+                            },
+                            "cnt": data.get("cnt"),
+                            "cod": data.get("cod"),
+                            "message": data.get("message", 0),
+                            "list": data.get("list", [])
                         }
                     }
-                elif response.status_code == 401:
-                    await logger.error("Invalid API key")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 401,
-                            "description": "Invalid API key"
-                        }
+                }
+            elif response.status_code == 401:
+                await logger.error("Invalid API key")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 401,
+                        "description": "Invalid API key"
                     }
-                elif response.status_code == 404:
-                    await logger.error(f"City not found: {location}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 404,
-                            "description": f"City not found: {location}"
-                        }
+                }
+            elif response.status_code == 404:
+                await logger.error(f"City not found: {location}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 404,
+                        "description": f"City not found: {location}"
                     }
-                else:
-                    error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    await logger.error(f"OpenWeatherMap API error: {error_message}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": response.status_code,
-                            "description": error_message
-                        }
+                }
+            else:
+                error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                await logger.error(f"OpenWeatherMap API error: {error_message}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": response.status_code,
+                        "description": error_message
                     }
+                }
         except httpx.TimeoutException as e:
             await logger.error(f"Request timeout: {e}")
             return {
@@ -14,6 +14,8 @@ except ImportError:
     HTTPX_AVAILABLE = False
     httpx = None
 
+from app.engine.request import http_clients
+
 
 class OpenweathermapGetForecastIntegration(BaseIntegration):
     """Интеграция для получения прогноза погоды через OpenWeatherMap API."""
@@ -63,6 +65,7 @@ class OpenweathermapGetForecastIntegration(BaseIntegration):
             credentials_provider="openweathermap",
             credentials_strategy="api_key",
             library_name="httpx" if HTTPX_AVAILABLE else None,
+            cache_ttl=600,
             examples=[
                 {
                     "title": "Прогноз для Москвы",
@@ -212,61 +215,62 @@ class OpenweathermapGetForecastIntegration(BaseIntegration):
         
         # ИСПОЛЬЗУЕМ HTTPX ДЛЯ ПРЯМЫХ HTTP ЗАПРОСОВ
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    "https://api.openweathermap.org/data/2.5/forecast",
-                    params=params
-                )
+            response = await http_clients.request(
+                "GET",
+                "https://api.openweathermap.org/data/2.5/forecast",
+                params=params,
+                cache_ttl=self.metadata.cache_ttl
+            )
                 
-                if response.status_code == 200:
-                    data = response.json()
+            if response.status_code == 200:
+                data = response.json()
                     
-                    # Возвращаем результат в формате системы
-                    return {
-                        "response": {
-                            "ok": True,
-                            "result": {
-                                "city": {
-                                    "id": data.get("city", {}).get("id"),
-                                    "name": data.get("city", {}).get("name"),
-                                    "country": data.get("city", {}).get("country"),
-                                    "coord": data.get("city", {}).get("coord", {})
-                                },
-                                "cnt": data.get("cnt"),
-                                "list": data.get("list", []),
-                                "message": data.get("message", 0)
-                            }
+                # Возвращаем результат в формате системы
+                return {
+                    "response": {
+                        "ok": True,
+                        "result": {
+                            "city": {
+                                "id": data.get("city", {}).get("id"),
+                                "name": data.get("city", {}).get("name"),
+                                "country": data.get("city", {}).get("country"),
+                                "coord": data.get("city", {}).get("coord", {})
+                            },
+                            "cnt": data.get("cnt"),
+                            "list": data.get("list", []),
+                            "message": data.get("message", 0)
                         }
                     }
-                elif response.status_code == 401:
-                    await logger.error("Invalid API key")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 401,
-                            "description": "Invalid API key"
-                        }
+                }
+            elif response.status_code == 401:
+                await logger.error("Invalid API key")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 401,
+                        "description": "Invalid API key"
                     }
-                elif response.status_code == 404:
-                    await logger.error(f"City not found: {location}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": 404,
-                            "description": f"City not found: {location}"
-                        }
+                }
+            elif response.status_code == 404:
+                await logger.error(f"City not found: {location}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": 404,
+                        "description": f"City not found: {location}"
                     }
-                else:
-                    error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
-                    error_message = error_data.get("message", f"HTTP {response.status_code}")
-                    await logger.error(f"OpenWeatherMap API error: {error_message}")
-                    return {
-                        "response": {
-                            "ok": False,
-                            "error_code": response.status_code,
-                            "description": error_message
-                        }
+                }
+            else:
+                error_data = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+                error_message = error_data.get("message", f"HTTP {response.status_code}")
+                await logger.error(f"OpenWeatherMap API error: {error_message}")
+                return {
+                    "response": {
+                        "ok": False,
+                        "error_code": response.status_code,
+                        "description": error_message
                     }
+                }
         except httpx.TimeoutException as e:
             await logger.error(f"Request timeout: {e}")
             return {
@@ -1,4 +1,5 @@
 from jqqb_evaluator.evaluator import Evaluator
 
+from .compiler import compile_rules
 from .rule import Rule
 from .rule_group import RuleGroup
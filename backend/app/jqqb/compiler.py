@@ -0,0 +1,92 @@
+import json
+from typing import Any, Callable, Optional
+
+from app.jqqb.rule import Rule
+from app.jqqb.rule_group import RuleGroup
+
+Predicate = Callable[[dict], bool]
+# Возвращает функцию рендера значения по контексту или None, если значение статическое
+ValueCompiler = Callable[[Any], Optional[Callable[[dict], Any]]]
+
+# Поля узла, от которых зависит структура правила, а не только сравниваемое значение
+_STRUCTURE_KEYS = ("field", "type", "operator", "condition")
+
+
+def compile_rules(rule_set: Any, compile_value: ValueCompiler | None = None) -> Predicate:
+    """
+    Компилирует дерево правил jQuery-QueryBuilder в предикат predicate(obj) -> bool.
+    Результат совпадает с RuleGroup(rule_set).evaluate(obj), но оператор, путь поля
+    и приведение типов вычисляются один раз. Переменные в значениях правил
+    подставляются лениво — в момент проверки, из того же obj.
+    """
+    if isinstance(rule_set, str):
+        rule_set = json.loads(rule_set)
+    return _compile_node(rule_set, compile_value)
+
+
+def _compile_node(node: dict, compile_value: ValueCompiler | None) -> Predicate:
+    if compile_value is not None and _has_dynamic_structure(node, compile_value):
+        render = compile_value(node)
+        return lambda obj: RuleGroup.get_rule_object(render(obj)).evaluate(obj)
+    try:
+        if "rules" in node:
+            return _compile_group(node, compile_value)
+        return _compile_rule(node, compile_value)
+    except Exception as e:
+        # Некорректный узел падает только при проверке, как и в RuleGroup:
+        # до него может не дойти из-за короткого замыкания AND/OR.
+        def fail(obj, error=e):
+            raise error
+        return fail
+
+
+def _has_dynamic_structure(node: dict, compile_value: ValueCompiler) -> bool:
+    return any(isinstance(node.get(key), str) and compile_value(node[key]) is not None for key in _STRUCTURE_KEYS)
+
+
+def _compile_group(node: dict, compile_value: ValueCompiler | None) -> Predicate:
+    predicates = tuple(_compile_node(rule, compile_value) for rule in node["rules"])
+    if node["condition"] == "AND":
+        return lambda obj: all(predicate(obj) for predicate in predicates)
+    return lambda obj: any(predicate(obj) for predicate in predicates)
+
+
+def _compile_rule(node: dict, compile_value: ValueCompiler | None) -> Predicate:
+    rule = Rule(node)
+    operator = rule.get_operator()
+    get_input = _compile_input(rule)
+
+    render = compile_value(rule.value) if compile_value is not None else None
+    if render is None:
+        value = rule.get_value()
+        return lambda obj: operator(get_input(obj), value)
+
+    def predicate(obj):
+        return operator(get_input(obj), _typecast(rule, render(obj)))
+    return predicate
+
+
+def _typecast(rule: Rule, value: Any) -> Any:
+    if isinstance(value, list):
+        return [rule.typecast_value(item) for item in value]
+    return rule.typecast_value(value)
+
+
+def _compile_input(rule: Rule) -> Callable[[dict], Any]:
+    """Повторяет Rule.get_input с заранее разобранным путем поля."""
+    fields = tuple(rule.field.split("."))
+    steps = len(fields)
+
+    def get_input(obj):
+        result = obj
+        for i, field in enumerate(fields):
+            result = result.get(field)
+            if i == steps - 2 and isinstance(result, list) and isinstance(result[0], dict):
+                result = [x[fields[-1]] for x in result]
+                break
+            if result is not None and isinstance(result, list) and i != steps - 1:
+                result = result[0]
+            if result is None:
+                break
+        return _typecast(rule, result)
+    return get_input
@@ -48,7 +48,10 @@ from app.admin import dashboard
 from database import sessionmanager
 from app.broker import broker
 from app.fast_socket_app import fast_socket_app
-from app.engine.request import global_http_client
+from app.engine.request import http_clients
+from app.redis_pool import redis_pools
+from app.services.s3_storage_service import s3_clients, s3_presign_clients
+from app.metrics.server import metrics_app
 from uvicorn.config import LOGGING_CONFIG as UVICORN_LOGGING_CONFIG
 
 logging.config.dictConfig(LOGGING_CONFIG)
@@ -69,7 +72,10 @@ async def lifespan(app: FastAPI):
         await broker.close()
         await fast_socket_app.stop()
         logging.info("Background services stopped")
-        await global_http_client.aclose()
+        await http_clients.aclose()
+        await s3_clients.close()
+        await s3_presign_clients.close()
+        await redis_pools.close()
         if sessionmanager.engine is not None:  # pyright: ignore
             await sessionmanager.close()
 
@@ -117,6 +123,7 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 app.include_router(sockets.router, tags=["ws"])
 app.include_router(media_router, prefix=f"/{settings.MEDIA_URL}", tags=["media"])
 app.mount("/admin", admin_app)
+app.mount("/metrics", metrics_app)
 
 
 @app.get("/health", tags=["health"])
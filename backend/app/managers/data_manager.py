@@ -8,6 +8,8 @@ from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy import text
 import asyncio
+from app.managers.local_cache import INVALIDATION_CHANNEL, LocalCache, local_cache
+from app.metrics.engine import engine_metrics
 from app.models.base import BaseModel
 from app.utils.secret_box import decrypt_blob_to_dict
 
@@ -124,6 +126,20 @@ class QueryProvider:
     def get_session_variables_query(session_id: str) -> tuple[str, dict[str, Any]]:
         return "SELECT * FROM session_variables WHERE id = :session_id", {"session_id": session_id}
 
+    @staticmethod
+    def get_variables_batch_query(queries: dict[str, tuple[str, dict[str, Any]]]) -> tuple[str, dict[str, Any]]:
+        """
+        Объединяет запросы переменных нескольких пространств имен в один запрос.
+        Каждая строка результата — (scope, row), где row — json исходной строки.
+        Имена параметров у запросов пространств имен не пересекаются.
+        """
+        parts = []
+        params: dict[str, Any] = {}
+        for scope, (query, query_params) in queries.items():
+            parts.append(f"SELECT '{scope}' AS scope, row_to_json(q) AS row FROM ({query}) q")
+            params.update(query_params)
+        return " UNION ALL ".join(parts), params
+
     @staticmethod
     def get_session_query(user_id: str, bot_id: str, channel_id: str) -> tuple[str, dict[str, Any]]:
         return """SELECT *
@@ -178,6 +194,14 @@ class QueryProvider:
         return ("UPDATE user_variables SET data = :variables WHERE id = :id RETURNING data",
                 {"id": user_id, "variables": variables})
 
+    @staticmethod
+    def patch_variables_query(namespace: str, variables_id: str, patch: str):
+        """Слияние ключей верхнего уровня в data без перезаписи остальных ключей"""
+        return (f"""UPDATE {namespace}_variables
+                    SET data = (COALESCE(data::jsonb, '{{}}'::jsonb) || CAST(:patch AS jsonb))::json
+                    WHERE id = :id""",
+                {"id": variables_id, "patch": patch})
+
     @staticmethod
     def update_session_query(user_id: str, bot_id: str, channel_id: str, step_id: str) -> tuple[str, dict[str, Any]]:
         return """UPDATE session
@@ -268,11 +292,14 @@ class QueryProvider:
         return base, params
 
 class DataManager:
-    def __init__(self, redis: Redis, engine: AsyncEngine):
+    def __init__(self, redis: Redis, engine: AsyncEngine, l1_cache: LocalCache | None = None):
         self.redis = redis
         self.engine = engine
         self.cache_lock = CacheLock()
         self.query_provider = QueryProvider(engine)
+        # L1 в памяти процесса перед Redis для редко меняющихся объектов
+        self.l1_cache = l1_cache or local_cache
+        self.l1_cache.ensure_listener(redis)
 
     @staticmethod
     async def _get_db_query(db_query: Callable[[], tuple[str, dict]], conn) -> dict:
@@ -291,41 +318,70 @@ class DataManager:
         data = [dict(row) for row in result.mappings()]
         return data
 
-    async def _get_or_load_list(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> list:
-        cached = await self.redis.get(key)
+    def _key_class(self, key: str) -> str:
+        """Класс ключа для метрик: имя класса L1 или префикс ключа без идентификаторов."""
+        name, _ = self.l1_cache.key_class(key)
+        if name is not None:
+            return name
+        parts = key.split(":")
+        return ":".join(parts[:2]) if parts[0] == "variables" else parts[0]
+
+    async def _get_cached(self, key: str) -> tuple[Any, int]:
+        """Читает значение из L1, затем из Redis. Возвращает (значение или None, поколение L1)."""
+        key_class = self._key_class(key)
+        cached = self.l1_cache.get(key)
+        if cached is not None:
+            logger.debug(f"L1 cache hit: {key}")
+            engine_metrics.observe_cache(key_class, "l1", True)
+            return json.loads(cached), self.l1_cache.token()
+        if self.l1_cache.active and self.l1_cache.key_class(key)[0] is not None:
+            engine_metrics.observe_cache(key_class, "l1", False)
+        token = self.l1_cache.token()
+        with engine_metrics.time_call("redis", "get"):
+            cached = await self.redis.get(key)
+        engine_metrics.observe_cache(key_class, "redis", bool(cached))
         if cached:
+            self.l1_cache.set(key, cached, token)
+            return json.loads(cached), token
+        return None, token
+
+    async def _load_and_cache(self, key: str, ttl: int, token: int, load: Callable[[Any], Any]):
+        with engine_metrics.time_call("db", f"load:{self._key_class(key)}"):
+            async with self.engine.connect() as conn:
+                data = await load(conn)
+        payload = json.dumps(data, default=str)
+        await self.redis.set(key, payload, ex=ttl)
+        self.l1_cache.set(key, payload, token)
+        logger.debug(f"Cache miss: {key}, loading from DB")
+        return data
+
+    async def _get_or_load_list(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> list:
+        cached, token = await self._get_cached(key)
+        if cached is not None:
             logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+            return cached
 
         lock = self.cache_lock.get_lock(key)
         async with lock:
-            if cached:
+            cached, token = await self._get_cached(key)
+            if cached is not None:
                 logger.debug(f"Delayed cache hit: {key}")
-                return json.loads(cached)
-            async with self.engine.connect() as conn:
-                data = await self._get_list_db_query(db_query, conn)
-                await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
-                logger.debug(f"Cache miss: {key}, loading from DB")
-                return data
+                return cached
+            return await self._load_and_cache(key, ttl, token, lambda conn: self._get_list_db_query(db_query, conn))
 
     async def _get_or_load(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> dict:
-        cached = await self.redis.get(key)
-        if cached:
+        cached, token = await self._get_cached(key)
+        if cached is not None:
             logger.debug(f"Cache hit: {key}")
-            return json.loads(cached)
+            return cached
 
         lock = self.cache_lock.get_lock(key)
         async with lock:
-            cached = await self.redis.get(key)
-            if cached:
+            cached, token = await self._get_cached(key)
+            if cached is not None:
                 logger.debug(f"Delayed cache hit: {key}")
-                return json.loads(cached)
-            async with self.engine.connect() as conn:
-
-                data = await self._get_db_query(db_query, conn)
-                await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
-                logger.debug(f"Cache miss: {key}, loading from DB")
-                return data
+                return cached
+            return await self._load_and_cache(key, ttl, token, lambda conn: self._get_db_query(db_query, conn))
 
     @staticmethod
     async def _update_db_query(db_query: Callable[[], tuple[str, dict]], conn) -> dict:
@@ -335,13 +391,25 @@ class DataManager:
         await conn.commit()
         return row
 
+    async def _publish_invalidation(self, key: str):
+        """Сбрасывает ключ в L1 этого процесса и рассылает сброс остальным воркерам."""
+        if self.l1_cache.key_class(key)[0] is None:
+            return
+        self.l1_cache.invalidate(key)
+        try:
+            await self.redis.publish(INVALIDATION_CHANNEL, key)
+        except Exception as e:
+            logger.warning(f"Failed to publish cache invalidation for {key}: {e}")
+
     async def _update_cache(self, key: str, ttl: int, data: dict | list):
         await self.redis.set(key, json.dumps(data, default=str), ex=ttl)
+        await self._publish_invalidation(key)
         logger.debug(f"Cache updated: {key}")
 
     async def _invalidate_cache(self, key: str):
         """Инвалидирует кеш по ключу"""
         await self.redis.delete(key)
+        await self._publish_invalidation(key)
         logger.debug(f"Cache invalidated: {key}")
 
     async def invalidate_user_variables_cache(self, user_id: str):
@@ -360,17 +428,35 @@ class DataManager:
         """Инвалидирует кеш переменных сессии"""
         await self._invalidate_cache(f"variables:session:{session_id}")
 
+    async def invalidate_keys(self, keys: list[str]):
+        """Инвалидирует несколько ключей одним pipeline: UNLINK и рассылка сбросов L1"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return
+        local_keys = [key for key in keys if self.l1_cache.key_class(key)[0] is not None]
+        for key in local_keys:
+            self.l1_cache.invalidate(key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.unlink(*keys)
+            for key in local_keys:
+                pipe.publish(INVALIDATION_CHANNEL, key)
+            await pipe.execute()
+        logger.debug(f"Cache invalidated: {keys}")
+
     async def invalidate_all_variables_cache(self, user_id: str, bot_id: str, channel_id: str, session_id: str):
         """Инвалидирует кеш всех переменных для пользователя"""
-        await self.invalidate_user_variables_cache(user_id)
-        await self.invalidate_bot_variables_cache(bot_id)
-        await self.invalidate_channel_variables_cache(channel_id)
-        await self.invalidate_session_variables_cache(session_id)
+        await self.invalidate_keys([
+            f"variables:user:{user_id}",
+            f"variables:bot:{bot_id}",
+            f"variables:channel:{channel_id}",
+            f"variables:session:{session_id}",
+        ])
 
     async def _update(self, key: str, ttl: int, db_query: Callable[[], tuple[str, dict]]) -> dict:
         async with self.engine.connect() as conn:
             try:
-                row = await self._update_db_query(db_query, conn)
+                with engine_metrics.time_call("db", f"update:{self._key_class(key)}"):
+                    row = await self._update_db_query(db_query, conn)
                 if not row:
                     logger.warning(f"No row returned for update with key={key}")
                     return {}
@@ -429,6 +515,23 @@ class DataManager:
             db_query=lambda: QueryProvider.get_bot_query(bot_id)
         )
 
+    async def get_bot_version(self, bot_id: str) -> str | None:
+        """Возвращает версию опубликованной структуры бота (меняется в update_bot)"""
+        version = await self.redis.get(f"bot:{bot_id}:version")
+        if version is None:
+            return None
+        return version.decode() if isinstance(version, bytes) else str(version)
+
+    async def ensure_bot_version(self, bot_id: str) -> str | None:
+        """
+        Назначает версию структуре бота, если её ещё нет.
+        Возвращает None, если версию параллельно выставил другой процесс.
+        """
+        version = uuid4().hex
+        if await self.redis.set(f"bot:{bot_id}:version", version, nx=True):
+            return version
+        return None
+
     async def get_bot_variables(self, bot_id: str) -> dict:
         return await self._get_or_load(
             key=f"variables:bot:{bot_id}",
@@ -464,12 +567,84 @@ class DataManager:
             db_query=lambda: QueryProvider.get_session_query(user_id, bot_id, channel_id)
         )
 
+    @staticmethod
+    def _variables_scopes(user_id: str, bot_id: str, channel_id: str,
+                          session_id: str) -> dict[str, tuple[str, tuple[str, dict[str, Any]]]]:
+        """Ключи кеша и запросы для всех пространств имен переменных"""
+        return {
+            "bot": (f"variables:bot:{bot_id}", QueryProvider.get_bot_variables_query(bot_id)),
+            "channel": (f"variables:channel:{channel_id}", QueryProvider.get_channel_variables_query(channel_id)),
+            "session": (f"variables:session:{session_id}", QueryProvider.get_session_variables_query(session_id)),
+            "user": (f"variables:user:{user_id}", QueryProvider.get_user_variables_query(user_id)),
+        }
+
+    @staticmethod
+    async def _get_variables_batch_db_query(queries: dict[str, tuple[str, dict[str, Any]]], conn) -> dict[str, dict]:
+        query, params = QueryProvider.get_variables_batch_query(queries)
+        result = await conn.execute(text(query), params)
+        rows = {scope: {} for scope in queries}
+        for scope, row in result.all():
+            rows[scope] = json.loads(row) if isinstance(row, str) else dict(row)
+        return rows
+
+    async def _cache_variables_batch(self, keys: dict[str, str], rows: dict[str, dict], ttl: int = 300) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for scope, row in rows.items():
+                pipe.set(keys[scope], json.dumps(row, default=str), ex=ttl)
+            await pipe.execute()
+
+    async def get_variables_batch(self, user_id: str, bot_id: str, channel_id: str, session_id: str) -> dict[str, dict]:
+        """
+        Загружает строки переменных всех пространств имен:
+        один MGET в Redis и один запрос в БД для промахов.
+        """
+        scopes = self._variables_scopes(user_id, bot_id, channel_id, session_id)
+        keys = {scope: key for scope, (key, _) in scopes.items()}
+        with engine_metrics.time_call("redis", "mget"):
+            cached_values = await self.redis.mget(list(keys.values()))
+
+        rows: dict[str, dict] = {}
+        for scope, cached in zip(keys, cached_values):
+            engine_metrics.observe_cache(f"variables:{scope}", "redis", bool(cached))
+            if cached:
+                rows[scope] = json.loads(cached)
+        missing = [scope for scope in scopes if scope not in rows]
+        if not missing:
+            logger.debug(f"Cache hit: variables for session {session_id}")
+            return rows
+
+        lock = self.cache_lock.get_lock(f"variables:batch:{session_id}")
+        async with lock:
+            cached_values = await self.redis.mget([keys[scope] for scope in missing])
+            for scope, cached in zip(list(missing), cached_values):
+                if cached:
+                    rows[scope] = json.loads(cached)
+                    missing.remove(scope)
+            if not missing:
+                logger.debug(f"Delayed cache hit: variables for session {session_id}")
+                return rows
+
+            with engine_metrics.time_call("db", "load:variables"):
+                async with self.engine.connect() as conn:
+                    loaded = await self._get_variables_batch_db_query(
+                        {scope: scopes[scope][1] for scope in missing}, conn
+                    )
+            await self._cache_variables_batch(keys, loaded)
+            logger.debug(f"Cache miss: variables {missing} for session {session_id}, loaded from DB")
+            rows.update(loaded)
+            return rows
+
     async def get_all_variables(self, user_id: str, bot_id: str, channel_id: str, session_id: str) -> dict:
-        bot_result = await self.get_bot_variables(bot_id)
-        channel_result = await self.get_channel_variables(channel_id)
-        session_data = (await self.get_session_variables(session_id)).get("data")
-        user_result = await self.get_user_variables(user_id)
-        
+        rows = await self.get_variables_batch(user_id, bot_id, channel_id, session_id)
+        return self._compose_all_variables(rows, user_id, bot_id, channel_id)
+
+    @staticmethod
+    def _compose_all_variables(rows: dict[str, dict], user_id: str, bot_id: str, channel_id: str) -> dict:
+        bot_result = rows.get("bot") or {}
+        channel_result = rows.get("channel") or {}
+        session_data = (rows.get("session") or {}).get("data")
+        user_result = rows.get("user") or {}
+
         bot_variables = bot_result.get("data") if bot_result.get("data") is not None else {}
         bot_base_data = {
             "id": str(bot_result.get("id", bot_id)),
@@ -511,7 +686,9 @@ class DataManager:
 
     async def get_or_create_session(self, user_id: str, bot_id: str, channel_id: str, first_step_id: str) -> dict:
         key = f"session:user:{user_id}:bot:{bot_id}:channel:{channel_id}"
-        cached = await self.redis.get(key)
+        with engine_metrics.time_call("redis", "get"):
+            cached = await self.redis.get(key)
+        engine_metrics.observe_cache("session", "redis", bool(cached))
         if cached:
             logger.debug(f"Cache hit: {key}")
             return json.loads(cached)
@@ -559,12 +736,14 @@ class DataManager:
 
     async def update_bot(self, bot_id: str, cache_structure: dict) -> dict:
         cache_structure = json.dumps(cache_structure, default=str)
-        print(cache_structure)
-        return await self._update(
+        data = await self._update(
             key=f"bot:{bot_id}",
             ttl=3600,
             db_query=lambda: QueryProvider.update_bot_structure_query(bot_id, cache_structure)
         )
+        # Новая версия структуры сбрасывает скомпилированные копии бота во всех воркерах
+        await self.redis.set(f"bot:{bot_id}:version", uuid4().hex)
+        return data
 
     async def update_bot_variables(self, bot_id: str, updated_variables: dict) -> dict:
         variables_to_update = updated_variables if updated_variables is not None else {}
@@ -611,10 +790,56 @@ class DataManager:
 
     async def update_all_variables(self, user_id: str, bot_id: str, channel_id: str, session_id: str,
                                    all_variables: dict) -> None:
-        await self.update_bot_variables(bot_id, all_variables.get("bot"))
-        await self.update_user_variables(user_id, all_variables.get("user"))
-        await self.update_channel_variables(channel_id, all_variables.get("channel"))
-        await self.update_session_variables(session_id, all_variables.get("session"))
+        """
+        Сохраняет все пространства имен переменных в одной транзакции
+        и обновляет кеш одним pipeline.
+        """
+        update_queries = {
+            "bot": QueryProvider.update_bot_variables_query,
+            "user": QueryProvider.update_user_variables_query,
+            "channel": QueryProvider.update_channel_variables_query,
+            "session": QueryProvider.update_session_variables_query,
+        }
+        ids = {"bot": bot_id, "user": user_id, "channel": channel_id, "session": session_id}
+        scopes = self._variables_scopes(user_id, bot_id, channel_id, session_id)
+        try:
+            async with self.engine.begin() as conn:
+                for scope, update_query in update_queries.items():
+                    variables = all_variables.get(scope)
+                    variables = json.dumps(variables if variables is not None else {}, default=str)
+                    query, params = update_query(ids[scope], variables)
+                    await conn.execute(text(query), params)
+                rows = await self._get_variables_batch_db_query(
+                    {scope: query for scope, (_, query) in scopes.items()}, conn
+                )
+            await self._cache_variables_batch({scope: key for scope, (key, _) in scopes.items()}, rows)
+        except Exception as e:
+            logger.exception(f"Error updating and caching variables for session={session_id}: {e}")
+
+    async def patch_variables(self, user_id: str, bot_id: str, channel_id: str, session_id: str,
+                              patches: dict[str, dict]) -> None:
+        """
+        Сохраняет только изменённые ключи указанных пространств имен (JSON merge)
+        в одной транзакции и обновляет их кеш одним pipeline.
+        """
+        ids = {"bot": bot_id, "user": user_id, "channel": channel_id, "session": session_id}
+        patches = {scope: patch for scope, patch in patches.items() if patch and scope in ids}
+        if not patches:
+            return
+        scopes = self._variables_scopes(user_id, bot_id, channel_id, session_id)
+        try:
+            async with self.engine.begin() as conn:
+                for scope, patch in patches.items():
+                    query, params = QueryProvider.patch_variables_query(
+                        scope, ids[scope], json.dumps(patch, default=str)
+                    )
+                    await conn.execute(text(query), params)
+                rows = await self._get_variables_batch_db_query(
+                    {scope: scopes[scope][1] for scope in patches}, conn
+                )
+            await self._cache_variables_batch({scope: scopes[scope][0] for scope in patches}, rows)
+        except Exception as e:
+            logger.exception(f"Error patching variables {list(patches)} for session={session_id}: {e}")
 
     async def get_bot_credentials_list(self, bot_id: str) -> list[dict]:
         return await self._get_or_load_list(
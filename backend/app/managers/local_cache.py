@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "datamanager:invalidate"
+
+# Классы ключей, которые можно держать в памяти процесса, и их TTL в секундах.
+# Переменные и сессии меняются на каждом сообщении и в L1 не попадают.
+KEY_CLASSES: list[tuple[str, re.Pattern, float]] = [
+    ("channel", re.compile(r"^channel:[^:]+$"), 60),
+    ("subscribers", re.compile(r"^channel:[^:]+:subscribers(:[^:]+)?$"), 60),
+    ("bot", re.compile(r"^bot:[^:]+$"), 60),
+    ("credentials", re.compile(r"^bot:[^:]+:credentials$"), 30),
+]
+
+
+class LocalCache:
+    """
+    L1-кеш DataManager в памяти процесса: ограниченный LRU с TTL по классу ключа.
+    Хранит JSON-строку из Redis, поэтому каждый вызов получает свою копию объекта.
+    Записи удаляются по сообщениям канала INVALIDATION_CHANNEL; пока подписка
+    не активна, кеш не используется, чтобы не отдавать устаревшие данные.
+    Другие кеши процесса получают сбросы своих ключей через on_invalidate(prefix, handler).
+    """
+
+    def __init__(self, maxsize: int = 10_000, key_classes=None):
+        self.maxsize = maxsize
+        self.key_classes = key_classes if key_classes is not None else KEY_CLASSES
+        self._entries: OrderedDict[str, tuple[float, str | bytes]] = OrderedDict()
+        self._generation = 0
+        self._listening = False
+        self._listener: Optional[asyncio.Task] = None
+        self._handlers: list[tuple[str, Callable[[str], None]]] = []
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+
+    @property
+    def active(self) -> bool:
+        return self._listening
+
+    def key_class(self, key: str) -> tuple[Optional[str], float]:
+        for name, pattern, ttl in self.key_classes:
+            if pattern.match(key):
+                return name, ttl
+        return None, 0
+
+    def get(self, key: str) -> Optional[str | bytes]:
+        if not self._listening:
+            return None
+        name, _ = self.key_class(key)
+        if name is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses[name] = self.misses.get(name, 0) + 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits[name] = self.hits.get(name, 0) + 1
+        return entry[1]
+
+    def token(self) -> int:
+        """Поколение инвалидаций; берется до чтения из Redis и передается в set."""
+        return self._generation
+
+    def set(self, key: str, value: str | bytes, token: Optional[int] = None) -> None:
+        if not self._listening or value is None:
+            return
+        # Пока читали из Redis, пришла инвалидация — значение могло устареть
+        if token is not None and token != self._generation:
+            return
+        _, ttl = self.key_class(key)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._generation += 1
+        self._entries.pop(key, None)
+
+    def on_invalidate(self, prefix: str, handler: Callable[[str], None]) -> None:
+        """Подписывает handler на сбросы ключей с префиксом prefix из INVALIDATION_CHANNEL."""
+        self._handlers.append((prefix, handler))
+
+    def _notify(self, key: str) -> None:
+        for prefix, handler in self._handlers:
+            if not key.startswith(prefix):
+                continue
+            try:
+                handler(key)
+            except Exception as e:
+                logger.warning(f"Cache invalidation handler failed for {key}: {e}")
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "active": self._listening,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+    def ensure_listener(self, redis) -> None:
+        """Запускает подписку на инвалидации в текущем event loop, если она еще не работает."""
+        if self._listener is not None and not self._listener.done():
+            return
+        try:
+            self._listener = asyncio.get_running_loop().create_task(self._listen(redis))
+        except RuntimeError:
+            self._listener = None
+
+    async def _listen(self, redis) -> None:
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Всё, что могло измениться до подписки, считаем устаревшим
+                self.clear()
+                self._listening = True
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    key = message.get("data")
+                    key = key.decode() if isinstance(key, bytes) else str(key)
+                    self.invalidate(key)
+                    self._notify(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Local cache invalidation listener failed: {e}")
+            finally:
+                self._listening = False
+                self.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)
+
+
+local_cache = LocalCache()
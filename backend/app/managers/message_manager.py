@@ -1,3 +1,7 @@
+import json
+import uuid
+from datetime import datetime
+
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine
 
@@ -5,45 +9,51 @@ from app.managers.base import BaseManager
 from app.utils.decorators import prepare_insert_data
 
 
+# Профиль отправителя/получателя: поиск по первичному ключу в каждой таблице подписчиков
+_PROFILE_JOINS = """
+LEFT JOIN "user" {alias}_u ON {alias}_u.id = inserted.{column}
+LEFT JOIN anonymous_user {alias}_a ON {alias}_a.id = inserted.{column}
+LEFT JOIN bot {alias}_b ON {alias}_b.id = inserted.{column}"""
+
+_PROFILE_JSON = """json_strip_nulls(json_build_object(
+        'id', COALESCE({alias}_u.id, {alias}_a.id, {alias}_b.id),
+        'type', CASE
+            WHEN {alias}_u.id IS NOT NULL THEN 'user'
+            WHEN {alias}_a.id IS NOT NULL THEN 'anonymous_user'
+            WHEN {alias}_b.id IS NOT NULL THEN 'bot'
+        END,
+        'username', {alias}_u.username,
+        'name', {alias}_b.name,
+        'email', {alias}_u.email
+    ))"""
+
+SQL_SELECT_WITH_PROFILES = f"""
+SELECT
+    inserted.*,
+    {_PROFILE_JSON.format(alias="s")} AS sender,
+    {_PROFILE_JSON.format(alias="r")} AS recipient
+FROM inserted{_PROFILE_JOINS.format(alias="s", column="sender_id")}{_PROFILE_JOINS.format(alias="r", column="recipient_id")}"""
+
 SQL_INSERT_WITH_JOIN = """
 WITH inserted AS (
     INSERT INTO message (id, text, params, channel_id, recipient_id, sender_id, widget_id, created_at, updated_at)
     VALUES (:id, :text, :params, :channel_id, :recipient_id, :sender_id, :widget_id, :created_at, :updated_at)
     RETURNING *
-),
-sender_union AS (
-    SELECT id, 'user' AS type, username, email, NULL AS name FROM "user"
-    UNION ALL
-    SELECT id, 'anonymous_user' AS type, NULL AS username, NULL AS email, NULL AS name FROM anonymous_user
-    UNION ALL
-    SELECT id, 'bot' AS type, NULL AS username, NULL AS email, name FROM bot
-),
-recipient_union AS (
-    SELECT id, 'user' AS type, username, email, NULL AS name FROM "user"
-    UNION ALL
-    SELECT id, 'anonymous_user' AS type, NULL AS username, NULL AS email, NULL AS name FROM anonymous_user
-    UNION ALL
-    SELECT id, 'bot' AS type, NULL AS username, NULL AS email, name FROM bot
-)
-SELECT
-    inserted.*,
-    json_strip_nulls(json_build_object(
-        'id', s.id,
-        'type', s.type,
-        'username', s.username,
-        'name', s.name,
-        'email', s.email
-    )) AS sender,
-    json_strip_nulls(json_build_object(
-        'id', r.id,
-        'type', r.type,
-        'username', r.username,
-        'name', r.name,
-        'email', r.email
-    )) AS recipient
-FROM inserted
-LEFT JOIN sender_union s ON s.id = inserted.sender_id
-LEFT JOIN recipient_union r ON r.id = inserted.recipient_id"""
+)""" + SQL_SELECT_WITH_PROFILES
+
+SQL_INSERT_MANY_WITH_JOIN = """
+WITH inserted AS (
+    INSERT INTO message (id, text, params, channel_id, recipient_id, sender_id, widget_id, created_at, updated_at)
+    SELECT id, text, params, channel_id, recipient_id, sender_id, widget_id, created_at, updated_at
+    FROM json_to_recordset(CAST(:rows AS json)) AS r(
+        id varchar, text varchar, params json, channel_id varchar, recipient_id varchar, sender_id varchar,
+        widget_id varchar, created_at timestamp, updated_at timestamp
+    )
+    RETURNING *
+)""" + SQL_SELECT_WITH_PROFILES
+
+MESSAGE_COLUMNS = ("id", "text", "params", "channel_id", "recipient_id", "sender_id", "widget_id",
+                   "created_at", "updated_at")
 
 
 class MessageManager(BaseManager):
@@ -53,3 +63,25 @@ class MessageManager(BaseManager):
         async with self.engine.begin() as conn:
             result = await conn.execute(text(SQL_INSERT_WITH_JOIN), data)
             return dict(result.mappings().first())
+
+    async def insert_many(self, rows: list[dict]) -> list[dict]:
+        """
+        Вставляет пачку сообщений одним INSERT ... SELECT в одной транзакции.
+        params передаются как есть (dict/list), без предварительной сериализации.
+        """
+        if not rows:
+            return []
+        now = datetime.now()
+        payload = []
+        for row in rows:
+            row = {column: row.get(column) for column in MESSAGE_COLUMNS}
+            row["id"] = str(row["id"] or uuid.uuid4())
+            row["created_at"] = row["created_at"] or now
+            row["updated_at"] = row["updated_at"] or now
+            payload.append(row)
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                text(SQL_INSERT_MANY_WITH_JOIN),
+                {"rows": json.dumps(payload, ensure_ascii=False, default=str)},
+            )
+            return [dict(row) for row in result.mappings().all()]
@@ -1,3 +1,4 @@
 from .base import WebSocketManagerBase
 from .bot import BotWebSocketManager
 from .channel import ChannelWebSocketManager
+from .connection import WebSocketConnection
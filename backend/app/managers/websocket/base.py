@@ -1,77 +1,142 @@
 import asyncio
 import json
 import logging
-from typing import Dict, Union
+import time
+from typing import Dict, Optional, Union
 from uuid import UUID
 from fastapi import WebSocket
 from pydantic import BaseModel
 
+from app.config import settings
+from app.metrics.websocket import websocket_metrics
+from .connection import WebSocketConnection
+
 logger = logging.getLogger(__name__)
 
 
 class WebSocketManagerBase:
-    def __init__(self):
-        # Активные WebSocket-подключения: {entity_id: {unique_user_key: websocket}}
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
+    """
+    Рассылка сообщений подключенным клиентам сущности.
+    Карты соединений copy-on-write: изменения под lock заменяют словарь сущности целиком,
+    поэтому notify читает снимок без блокировки. Сообщение сериализуется один раз,
+    а отправка идет из очереди каждого соединения, и медленный клиент не задерживает остальных.
+    """
+
+    def __init__(self, queue_size: Optional[int] = None, send_timeout: Optional[float] = None,
+                 slow_consumer_policy: Optional[str] = None):
+        # Активные WebSocket-подключения: {entity_id: {unique_user_key: connection}}
+        self.active_connections: Dict[str, Dict[str, WebSocketConnection]] = {}
         self.lock = asyncio.Lock()
+        # Очереди, созданные самим менеджером для голого WebSocket
+        self._owned: set[WebSocketConnection] = set()
+        self.metrics_name = type(self).__name__
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.send_timeout = send_timeout or settings.WS_SEND_TIMEOUT
+        self.slow_consumer_policy = slow_consumer_policy or settings.WS_SLOW_CONSUMER_POLICY
 
     @staticmethod
     def _normalize_key(key: Union[UUID, str]) -> str:
         """Преобразовать key в строку."""
         return str(key)
 
+    @staticmethod
+    def _serialize(message: BaseModel | str) -> str:
+        if isinstance(message, str):
+            return message
+        if isinstance(message, BaseModel):
+            return message.model_dump_json()
+        try:
+            return json.dumps(message)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid message")
+
     async def notify(self, entity_id: Union[UUID, str], message: BaseModel | str) -> None:
-        """Отправить сообщение пользователю в сущности, если он подключен."""
+        """Поставить сообщение в очереди всех подключений сущности, не дожидаясь отправки."""
         entity_id = self._normalize_key(entity_id)
-        async with self.lock:
-            connections = self.active_connections.get(entity_id)
-
-            if not connections:
-                logger.warning(f"[WS] No active connections for {entity_id}")
-                return
-
-            disconnected = []
-
-            for user_key, websocket in connections.items():
-                try:
-                    msg = None
-                    if isinstance(message, str):
-                        msg = message
-
-                    if isinstance(message, BaseModel):
-                        msg = message.model_dump_json()
-                    if msg is None:
-                        try:
-                            msg = json.dumps(message)
-                        except json.JSONDecodeError:
-                            raise ValueError("Invalid message")
-                    await websocket.send_text(msg)
-                except Exception as e:
-                    logger.error(f"[WS] Send failed to {user_key} in {entity_id}: {repr(e)}")
-                    disconnected.append(user_key)
-
-            # Удаляем недоступные соединения
-            for user_key in disconnected:
-                del connections[user_key]
-                logger.info(f"[WS] Removed dead connection {user_key} from {entity_id}")
-
-            if not connections:
-                del self.active_connections[entity_id]
+        started = time.perf_counter()
+        connections = self.active_connections.get(entity_id)
+
+        if not connections:
+            logger.warning(f"[WS] No active connections for {entity_id}")
+            return
+
+        msg = self._serialize(message)
+        sent = 0
+        for connection in connections.values():
+            if connection.send(msg):
+                sent += 1
 
-    async def add_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str], websocket: WebSocket):
+        websocket_metrics.observe_broadcast(self.metrics_name, sent, len(connections) - sent,
+                                            time.perf_counter() - started)
+
+    def open_connection(self, websocket: WebSocket) -> WebSocketConnection:
+        """Создает исходящую очередь соединения с настройками менеджера и запускает писателя."""
+        connection = WebSocketConnection(websocket, queue_size=self.queue_size, send_timeout=self.send_timeout,
+                                         policy=self.slow_consumer_policy)
+        connection.start()
+        return connection
+
+    async def add_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str],
+                             websocket: WebSocket | WebSocketConnection):
+        """
+        Подписывает соединение на сущность. Готовое WebSocketConnection остается за вызывающим
+        (одно соединение может слушать несколько сущностей); для голого WebSocket очередь
+        создается здесь и закрывается вместе с подпиской.
+        """
         entity_id = self._normalize_key(entity_id)
+        connection_uuid = self._normalize_key(connection_uuid)
+        if isinstance(websocket, WebSocketConnection):
+            connection = websocket
+        else:
+            connection = self.open_connection(websocket)
+            self._owned.add(connection)
+        callback_key = (id(self), entity_id, connection_uuid)
+
+        async def on_close(closed: WebSocketConnection):
+            self._owned.discard(closed)
+            if closed.failed:
+                websocket_metrics.inc_failed(self.metrics_name, closed.failed)
+            if await self._discard(entity_id, connection_uuid, closed):
+                logger.info(f"[WS] Removed dead connection {connection_uuid} from {entity_id}")
+
         async with self.lock:
-            if entity_id not in self.active_connections:
-                self.active_connections[entity_id] = {}
-            self.active_connections[entity_id][connection_uuid] = websocket
+            entity_conns = self.active_connections.get(entity_id, {})
+            previous = entity_conns.get(connection_uuid)
+            if previous is None:
+                websocket_metrics.inc_active(self.metrics_name)
+            self.active_connections[entity_id] = {**entity_conns, connection_uuid: connection}
+            connection.add_close_callback(callback_key, on_close)
             logger.info(f"[WS] Connected: {connection_uuid} to {entity_id}")
+        if previous is not None and previous is not connection:
+            previous.remove_close_callback(callback_key)
+            await self._release(previous)
 
     async def remove_connection(self, entity_id: Union[UUID, str], connection_uuid: Union[UUID, str]):
         entity_id = self._normalize_key(entity_id)
+        connection_uuid = self._normalize_key(connection_uuid)
+        connection = self.active_connections.get(entity_id, {}).get(connection_uuid)
+        if connection is None:
+            return
+        connection.remove_close_callback((id(self), entity_id, connection_uuid))
+        if await self._discard(entity_id, connection_uuid, connection):
+            logger.info(f"[WS] Disconnected: {connection_uuid} from {entity_id}")
+        await self._release(connection)
+
+    async def _release(self, connection: WebSocketConnection) -> None:
+        if connection in self._owned:
+            self._owned.discard(connection)
+            await connection.close()
+
+    async def _discard(self, entity_id: str, connection_uuid: str, connection: WebSocketConnection) -> bool:
+        """Убирает именно это соединение (а не заменившее его с тем же ключом)."""
         async with self.lock:
             entity_conns = self.active_connections.get(entity_id)
-            if entity_conns and connection_uuid in entity_conns:
-                del entity_conns[connection_uuid]
-                logger.info(f"[WS] Disconnected: {connection_uuid} from {entity_id}")
-                if not entity_conns:
-                    del self.active_connections[entity_id]
\ No newline at end of file
+            if not entity_conns or entity_conns.get(connection_uuid) is not connection:
+                return False
+            remaining = {key: conn for key, conn in entity_conns.items() if key != connection_uuid}
+            if remaining:
+                self.active_connections[entity_id] = remaining
+            else:
+                del self.active_connections[entity_id]
+            websocket_metrics.dec_active(self.metrics_name)
+            return True
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# Что делать, когда очередь клиента заполнена
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+
+class WebSocketConnection:
+    """
+    Исходящая сторона одного WebSocket-соединения: ограниченная очередь и своя задача-писатель.
+    Рассылка только кладет готовый текст в очередь и не ждет медленного клиента.
+    При переполнении очереди по политике DROP_OLDEST выбрасывается самое старое сообщение,
+    по DISCONNECT соединение закрывается.
+    Одно соединение может быть подписано на несколько сущностей; каждая подписка
+    регистрирует свой обработчик закрытия.
+    """
+
+    def __init__(self, websocket: WebSocket, *, queue_size: int = 100, send_timeout: float = 5,
+                 policy: str = DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DISCONNECT):
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.policy = policy
+        self._close_callbacks: dict[Any, Callable[["WebSocketConnection"], Awaitable]] = {}
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max(queue_size, 1))
+        self.dropped = 0
+        self.failed = 0
+        self.closed = False
+        self._writer: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+
+    def add_close_callback(self, key: Any, callback: Callable[["WebSocketConnection"], Awaitable]) -> None:
+        self._close_callbacks[key] = callback
+
+    def remove_close_callback(self, key: Any) -> None:
+        self._close_callbacks.pop(key, None)
+
+    def start(self) -> None:
+        if self._writer is None:
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+
+    def send(self, text: str) -> bool:
+        """Ставит сообщение в очередь без ожидания. False — сообщение не будет доставлено."""
+        if self.closed or self._closer is not None:
+            return False
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.policy == DISCONNECT:
+            logger.warning("[WS] Send queue overflow, disconnecting slow consumer")
+            self._closer = asyncio.get_running_loop().create_task(self.close(code=1013))
+            return False
+        # Самое старое сообщение клиенту уже менее интересно, чем новое
+        self.queue.get_nowait()
+        self.dropped += 1
+        self.queue.put_nowait(text)
+        return False
+
+    async def _write_loop(self) -> None:
+        while True:
+            text = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), timeout=self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[WS] Send failed: {e!r}")
+                self.failed += 1
+                await self.close()
+                return
+
+    async def close(self, code: int = 1000) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        writer, self._writer = self._writer, None
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+        callbacks, self._close_callbacks = list(self._close_callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                await callback(self)
+            except Exception as e:
+                logger.error(f"[WS] Close callback failed: {e!r}")
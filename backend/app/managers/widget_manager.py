@@ -1,17 +1,118 @@
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 from app.managers.base import BaseManager
+from app.managers.local_cache import INVALIDATION_CHANNEL, local_cache
 from app.utils.decorators import prepare_insert_data
 
+logger = logging.getLogger(__name__)
+
+# Сброс строки готового виджета из кеша процессов: префикс + content_hash
+RENDERED_INVALIDATION_PREFIX = "widget:rendered:"
+
+# Поля, которые определяют содержимое готового виджета
+RENDERED_FIELDS = ("name", "description", "body", "css", "js", "owner_id", "parent_widget_id")
+
+SQL_INSERT_RENDERED = """
+WITH existing AS (
+    SELECT * FROM widget WHERE content_hash = :content_hash
+),
+inserted AS (
+    INSERT INTO widget (id, name, description, body, css, js, owner_id, is_render, parent_widget_id, content_hash,
+                        created_at, updated_at)
+    SELECT CAST(:id AS varchar), CAST(:name AS varchar), CAST(:description AS varchar), CAST(:body AS varchar),
+           CAST(:css AS varchar), CAST(:js AS varchar), CAST(:owner_id AS varchar), TRUE,
+           CAST(:parent_widget_id AS varchar), CAST(:content_hash AS varchar),
+           CAST(:created_at AS timestamp), CAST(:updated_at AS timestamp)
+    WHERE NOT EXISTS (SELECT 1 FROM existing)
+    ON CONFLICT (content_hash) WHERE content_hash IS NOT NULL DO NOTHING
+    RETURNING *
+)
+SELECT * FROM existing
+UNION ALL
+SELECT * FROM inserted"""
+
+
+def widget_content_hash(data: dict) -> str:
+    raw = json.dumps([data.get(field) for field in RENDERED_FIELDS], ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
 
 class WidgetManager(BaseManager):
+    # Недавно сохраненные готовые виджеты процесса: content_hash -> (истекает, строка).
+    # Как и L1 DataManager, используется только при активной подписке на инвалидации
+    _rendered: OrderedDict = OrderedDict()
+    RENDERED_CACHE_SIZE = 1024
+    RENDERED_CACHE_TTL = 300
 
     @prepare_insert_data()
     async def insert(self, data: dict) -> dict:
         async with self.engine.begin() as conn:
             result = await conn.execute(text("""
-                INSERT INTO widget (id, name, description, body, css, js, owner_id, is_render, parent_widget_id, created_at, updated_at) 
+                INSERT INTO widget (id, name, description, body, css, js, owner_id, is_render, parent_widget_id, created_at, updated_at)
                 VALUES (:id, :name, :description, :body, :css, :js, :owner_id, :is_render, :parent_widget_id, :created_at, :updated_at) RETURNING *
             """), data)
-            return dict(result.mappings().first())
\ No newline at end of file
+            return dict(result.mappings().first())
+
+    async def insert_rendered(self, data: dict) -> dict:
+        """
+        Сохраняет готовый виджет по хешу содержимого: одинаковый рендер переиспользует
+        существующую строку, и сообщения ссылаются на нее вместо новой копии.
+        """
+        content_hash = widget_content_hash(data)
+        cached = self._rendered.get(content_hash) if local_cache.active else None
+        if cached is not None and cached[0] > time.monotonic():
+            self._rendered.move_to_end(content_hash)
+            return dict(cached[1])
+
+        now = datetime.now()
+        params = {field: data.get(field) for field in RENDERED_FIELDS}
+        params.update(id=str(uuid.uuid4()), content_hash=content_hash, created_at=now, updated_at=now)
+        for field in ("owner_id", "parent_widget_id"):
+            if params[field] is not None:
+                params[field] = str(params[field])
+
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(text(SQL_INSERT_RENDERED), params)).mappings().first()
+            if row is None:
+                # Такой же виджет вставили параллельно — он виден уже после конфликта
+                row = (await conn.execute(
+                    text("SELECT * FROM widget WHERE content_hash = :content_hash"), {"content_hash": content_hash}
+                )).mappings().first()
+        row = dict(row)
+        if not local_cache.active:
+            return row
+
+        self._rendered[content_hash] = (time.monotonic() + self.RENDERED_CACHE_TTL, row)
+        self._rendered.move_to_end(content_hash)
+        while len(self._rendered) > self.RENDERED_CACHE_SIZE:
+            self._rendered.popitem(last=False)
+        return dict(row)
+
+    @classmethod
+    def forget_rendered(cls, content_hash: str) -> None:
+        cls._rendered.pop(content_hash, None)
+
+
+async def forget_rendered_widget(content_hash: str) -> None:
+    """Сбрасывает готовый виджет из кеша этого и остальных процессов после правки или удаления строки."""
+    from app.redis_pool import cache_redis
+    WidgetManager.forget_rendered(content_hash)
+    try:
+        await cache_redis().publish(INVALIDATION_CHANNEL, RENDERED_INVALIDATION_PREFIX + content_hash)
+    except Exception as e:
+        logger.warning(f"Failed to publish rendered widget invalidation for {content_hash}: {e}")
+
+
+local_cache.on_invalidate(
+    RENDERED_INVALIDATION_PREFIX,
+    lambda key: WidgetManager.forget_rendered(key[len(RENDERED_INVALIDATION_PREFIX):]),
+)
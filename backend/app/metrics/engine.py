@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class EngineMetrics:
+    """Prometheus metrics helpers for the message-processing hot path."""
+
+    def __init__(self) -> None:
+        self._processing_duration = Histogram(
+            "bot_message_processing_seconds",
+            "Time spent processing one message by one bot, labelled by the step the message arrived at.",
+            labelnames=("bot", "step", "status"),
+            buckets=LATENCY_BUCKETS,
+        )
+        self._cache_requests = Counter(
+            "cache_requests_total",
+            "Cache lookups by key class, cache layer and result.",
+            labelnames=("key_class", "layer", "result"),
+        )
+        self._call_duration = Histogram(
+            "backend_call_duration_seconds",
+            "Duration of calls to Redis, the database and external HTTP services.",
+            labelnames=("backend", "operation", "status"),
+            buckets=LATENCY_BUCKETS,
+        )
+        self._batch_size = Histogram(
+            "batch_size",
+            "Number of items handled in one batch.",
+            labelnames=("kind",),
+            buckets=BATCH_BUCKETS,
+        )
+        self._semaphore_wait = Histogram(
+            "semaphore_wait_seconds",
+            "Time spent waiting to acquire a concurrency-limiting semaphore.",
+            labelnames=("name",),
+            buckets=LATENCY_BUCKETS,
+        )
+        self._stream_lag = Gauge(
+            "stream_group_lag",
+            "Entries in the stream not yet delivered to the consumer group.",
+            labelnames=("stream", "group"),
+        )
+        self._stream_pending = Gauge(
+            "stream_group_pending",
+            "Entries delivered to the consumer group but not acknowledged (PEL size).",
+            labelnames=("stream", "group"),
+        )
+
+    def observe_processing(self, bot: str, step: str | None, status: str, duration: float) -> None:
+        self._processing_duration.labels(bot=str(bot), step=str(step or ""), status=status).observe(duration)
+
+    def observe_cache(self, key_class: str, layer: str, hit: bool, count: int = 1) -> None:
+        """Record cache hits or misses for a key class ("l1", "redis" or "http" layer)."""
+        if count:
+            self._cache_requests.labels(key_class=key_class, layer=layer, result="hit" if hit else "miss").inc(count)
+
+    def observe_call(self, backend: str, operation: str, status: str, duration: float) -> None:
+        self._call_duration.labels(backend=backend, operation=operation, status=status).observe(duration)
+
+    @contextmanager
+    def time_call(self, backend: str, operation: str) -> Iterator[None]:
+        """Time a block as one call; the status is "error" if the block raises."""
+        started = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.observe_call(backend, operation, status, time.perf_counter() - started)
+
+    def observe_batch(self, kind: str, size: int) -> None:
+        self._batch_size.labels(kind=kind).observe(size)
+
+    def observe_semaphore_wait(self, name: str, duration: float) -> None:
+        self._semaphore_wait.labels(name=name).observe(duration)
+
+    @asynccontextmanager
+    async def acquire(self, semaphore, name: str) -> AsyncIterator[None]:
+        """Acquire the semaphore and record how long it took."""
+        started = time.perf_counter()
+        async with semaphore:
+            self.observe_semaphore_wait(name, time.perf_counter() - started)
+            yield
+
+    def set_stream_backlog(self, stream: str, group: str, pending: int, lag: int | None) -> None:
+        self._stream_pending.labels(stream=stream, group=group).set(pending)
+        if lag is not None:
+            self._stream_lag.labels(stream=stream, group=group).set(lag)
+
+
+engine_metrics = EngineMetrics()
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import logging
+
+from prometheus_client import make_asgi_app, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# ASGI-приложение /metrics для API
+metrics_app = make_asgi_app()
+
+_started_port: int | None = None
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0") -> bool:
+    """
+    Поднимает HTTP-сервер /metrics в отдельном потоке для воркеров без своего HTTP.
+    Повторный вызов и занятый порт не мешают работе воркера.
+    """
+    global _started_port
+    if not port or _started_port is not None:
+        return False
+    try:
+        start_http_server(port, addr=addr)
+    except OSError as e:
+        logger.warning(f"Metrics server on port {port} not started: {e}")
+        return False
+    _started_port = port
+    logger.info(f"Metrics server listening on {addr}:{port}")
+    return True
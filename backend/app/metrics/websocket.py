@@ -37,6 +37,10 @@ class WebSocketMetrics:
         if failed:
             self._messages_failed.labels(manager=manager).inc(failed)
 
+    def inc_failed(self, manager: str, count: int = 1) -> None:
+        """Record messages that were queued but failed to reach the client."""
+        self._messages_failed.labels(manager=manager).inc(count)
+
     def inc_active(self, manager: str) -> None:
         self._active_connections.labels(manager=manager).inc()
 
@@ -0,0 +1,29 @@
+"""add attachment file basename index
+
+Revision ID: add_attachment_file_basename_index
+Revises: add_widget_content_hash
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_attachment_file_basename_index'
+down_revision = 'add_widget_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /media/attachment/<name> ищет ключ по последнему сегменту
+    op.create_index(
+        'ix_attachment_file_basename',
+        'attachment',
+        [sa.text("regexp_replace(file, '^.*/', '')")],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_attachment_file_basename', table_name='attachment')
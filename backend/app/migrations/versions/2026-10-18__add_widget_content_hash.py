@@ -0,0 +1,33 @@
+"""add content_hash to widget
+
+Revision ID: add_widget_content_hash
+Revises: add_request_cache_ttl
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_widget_content_hash'
+down_revision = 'add_request_cache_ttl'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('widget', sa.Column('content_hash', sa.String(), nullable=True))
+    # Один готовый виджет на содержимое, шаблоны (без хеша) не ограничиваются
+    op.create_index(
+        'uq_widget_content_hash',
+        'widget',
+        ['content_hash'],
+        unique=True,
+        postgresql_where=sa.text('content_hash IS NOT NULL'),
+    )
+
+
+def downgrade():
+    op.drop_index('uq_widget_content_hash', table_name='widget')
+    op.drop_column('widget', 'content_hash')
@@ -2,7 +2,7 @@ import pathlib
 import uuid
 import os.path
 from typing import Optional, List, Union, Any
-from sqlalchemy import ForeignKey, Column, Dialect
+from sqlalchemy import ForeignKey, Column, Dialect, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import BaseModel, UUID
 from app.config import settings
@@ -20,6 +20,10 @@ class FileType(String):
 
 class AttachmentModel(BaseModel):
     __tablename__ = "attachment"
+    __table_args__ = (
+        # Поиск ключа по имени файла для /media/attachment/<name>
+        Index("ix_attachment_file_basename", text("regexp_replace(file, '^.*/', '')")),
+    )
 
     id: Mapped[UUID] = mapped_column(primary_key=True, default=uuid.uuid4, type_=UUID)
     content_type: Mapped[str | None]
@@ -35,6 +35,8 @@ class RequestModel(BaseModel):
     attachments: Mapped[Optional[str]]
     headers: Mapped[Optional[str]]
     proxies: Mapped[Optional[str]]
+    # Кеш ответа GET-запроса в секундах, None — без кеша
+    cache_ttl: Mapped[Optional[int]]
 
     url_params: Mapped[Optional[JSON]] = mapped_column(type_=JSON)
 
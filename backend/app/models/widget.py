@@ -1,6 +1,6 @@
 import uuid
 from typing import Optional, List, TYPE_CHECKING
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .base import BaseModel, UUID
 
@@ -24,8 +24,14 @@ class WidgetModel(BaseModel):
     
     is_render: Mapped[bool] = mapped_column(default=False, server_default="FALSE", comment="False = шаблон, True = готовый виджет")
     parent_widget_id: Mapped[Optional[UUID]] = mapped_column(ForeignKey("widget.id"), nullable=True, type_=UUID)
+    # sha256 отрендеренного содержимого: одинаковые готовые виджеты хранятся одной строкой
+    content_hash: Mapped[Optional[str]] = mapped_column(nullable=True)
     parent_widget: Mapped[Optional["WidgetModel"]] = relationship("WidgetModel", foreign_keys=[parent_widget_id], remote_side=[id], lazy="select")
 
+    __table_args__ = (
+        Index("uq_widget_content_hash", "content_hash", unique=True, postgresql_where=text("content_hash IS NOT NULL")),
+    )
+
     messages: Mapped[List["MessageModel"]] = relationship("MessageModel", foreign_keys="[MessageModel.widget_id]", back_populates="widget", lazy="select", load_on_pending=True)
 
     def __str__(self):
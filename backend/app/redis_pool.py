@@ -0,0 +1,91 @@
+import logging
+from typing import Iterable
+
+from redis.asyncio import BlockingConnectionPool, Redis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RedisPoolRegistry:
+    """
+    Общие пулы соединений Redis процесса: по одному на логический Redis
+    ("broker" — стримы и блокировки, "cache" — кеш данных).
+    Клиент для имени создается один раз и живет весь процесс; close() только
+    закрывает соединения пула, после него клиент переподключается сам.
+    """
+
+    def __init__(self, urls: dict[str, str], *, max_connections: int = 50, pool_timeout: float = 5,
+                 connect_timeout: float = 5, health_check_interval: int = 30):
+        self.urls = urls
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+        self._clients: dict[str, Redis] = {}
+
+    def get(self, name: str = "cache") -> Redis:
+        client = self._clients.get(name)
+        if client is None:
+            client = self._clients[name] = Redis(connection_pool=self._build_pool(self.urls[name]))
+        return client
+
+    def _build_pool(self, url: str) -> BlockingConnectionPool:
+        # При исчерпании пула ждем свободное соединение, а не получаем ошибку "Too many connections"
+        return BlockingConnectionPool.from_url(
+            url,
+            max_connections=self.max_connections,
+            timeout=self.pool_timeout,
+            socket_connect_timeout=self.connect_timeout,
+            health_check_interval=self.health_check_interval,
+            socket_keepalive=True,
+        )
+
+    async def close(self) -> None:
+        for name, client in self._clients.items():
+            try:
+                await client.connection_pool.disconnect()
+            except Exception as e:
+                logger.warning(f"Failed to close Redis pool {name}: {e}")
+
+
+redis_pools = RedisPoolRegistry(
+    {"broker": settings.REDIS_URL, "cache": settings.CACHE_REDIS_URL},
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    pool_timeout=settings.REDIS_POOL_TIMEOUT,
+    health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+)
+
+
+def cache_redis() -> Redis:
+    return redis_pools.get("cache")
+
+
+def broker_redis() -> Redis:
+    return redis_pools.get("broker")
+
+
+async def delete_keys(redis: Redis, keys: Iterable[str], *, batch_size: int = 500) -> int:
+    """Удаляет ключи пачками UNLINK одним pipeline (один round-trip вместо запроса на ключ)."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return 0
+    async with redis.pipeline(transaction=False) as pipe:
+        for i in range(0, len(keys), batch_size):
+            pipe.unlink(*keys[i:i + batch_size])
+        return sum(await pipe.execute())
+
+
+async def delete_patterns(redis: Redis, patterns: Iterable[str], *, batch_size: int = 500) -> int:
+    """Удаляет ключи по маскам SCAN, пачками через delete_keys."""
+    deleted = 0
+    for pattern in patterns:
+        batch = []
+        async for key in redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += await delete_keys(redis, batch, batch_size=batch_size)
+                batch = []
+        deleted += await delete_keys(redis, batch, batch_size=batch_size)
+    return deleted
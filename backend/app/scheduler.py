@@ -7,7 +7,10 @@ from typing import Union
 from faststream import FastStream
 from faststream.redis import StreamSub
 
+from apscheduler.jobstores.redis import RedisJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from fastapi import HTTPException
+from redis.connection import parse_url
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.logging_config import LOGGING_CONFIG
@@ -15,6 +18,12 @@ from app.config import settings
 from app.broker import broker
 from app.schemas import rebuild_models
 from app.database import sessionmanager
+from app.redis_pool import broker_redis, cache_redis, redis_pools
+from app.engine.emitter_jobs import EMITTER_EVENTS_STREAM, publish_emitter_message_batch
+from app.engine.leader import LeaderElection
+from app.services.emitter_service import emitter_broadcaster, invalidate_emitter_cache
+from app.metrics.engine import engine_metrics
+from app.metrics.server import start_metrics_server
 from app.models.emitter import EmitterModel
 from app.utils.message import bot_send_message_by_id
 import app.crud.emitter as crud_emitter
@@ -24,6 +33,7 @@ rebuild_models()
 logger = logging.getLogger(__name__)
 
 app = FastStream(broker)
+emitter_broadcaster.set_redis(cache_redis())
 
 
 async def send_message(message_id: Union[str, UUID], bot_id: Union[str, UUID], needs_message_processing: bool = True):
@@ -39,26 +49,28 @@ async def safe_send_message(message_id: Union[str, UUID], bot_id: Union[str, UUI
         logger.exception(f"Error while processing message_id={message_id}, bot_id={bot_id}: {e}")
 
 
-@broker.publisher("emitter.events")
-async def publish_emitter_event(event: str, data: dict):
-    logger.info(f"[EMIT] Publishing event: {event} | data: {data}")
-    await broker.publish({"event": event, "data": data}, "emitter.events")
-
-
-async def publish_emitter_message_batch(message_data):
-    logger.info(f"[EMIT] Publishing message batch: {message_data}")
-    await broker.publish(message_data, stream="emitter.batch")
-
-
-@broker.subscriber("emitter.events")
+@broker.subscriber(
+    stream=StreamSub(EMITTER_EVENTS_STREAM, group="scheduler-group", consumer=f"scheduler-consumer-{uuid4()}")
+)
 async def on_emitter_event(event_msg: dict):
+    """
+    Событие эмиттера обрабатывает одна реплика группы и меняет задачу прямо в общем хранилище;
+    лидер подхватит изменение при следующем опросе хранилища.
+    """
     event = event_msg["event"]
     data = event_msg["data"]
     logger.info(f"[EVENT] Received: {event} | data: {data}")
 
     async with sessionmanager.session() as session:
-        emitter = await crud_emitter.get_emitter(session, data["id"])
+        try:
+            emitter = await crud_emitter.get_emitter(session, data["id"])
+        except HTTPException:
+            logger.warning(f"[EVENT] Emitter {data['id']} not found, dropping its job")
+            scheduler.remove_emitter_job(data.get("job_id"))
+            return
         logger.info(f"[EVENT] Loaded emitter {emitter.name} (id={emitter.id})")
+        # Событие получает одна реплика группы, остальным сброс рассылается через Redis
+        await invalidate_emitter_cache(message_id=emitter.message_id, bot_id=emitter.bot_id)
 
         match event:
             case "emitter.created":
@@ -74,33 +86,71 @@ async def on_emitter_event(event_msg: dict):
 )
 async def process_emitter_batch(messages):
     logger.info(f"[BATCH] received {len(messages)} messages")
-    tasks = [safe_send_message(m.get("message_id"), m.get("bot_id"), m.get("needs_message_processing")) for m in messages]
-    await asyncio.gather(*tasks)
+    engine_metrics.observe_batch("emitter.batch", len(messages))
+    try:
+        # Вся пачка — одна вставка, одна транзакция и один pipeline Redis
+        await emitter_broadcaster.send(messages)
+    except Exception as e:
+        # Вставка не прошла, копий в базе нет: отправляем по одному, чтобы одно сообщение не топило пачку
+        logger.exception(f"[BATCH] Bulk send failed, falling back to per-message send: {e}")
+        tasks = [safe_send_message(m.get("message_id"), m.get("bot_id"), m.get("needs_message_processing"))
+                 for m in messages]
+        await asyncio.gather(*tasks)
+
+
+def build_jobstores() -> dict:
+    """Задачи эмиттеров хранятся в Redis брокера и переживают перезапуск и смену лидера."""
+    connect_args = parse_url(settings.REDIS_URL)
+    return {
+        "default": RedisJobStore(
+            db=connect_args.pop("db", 0),
+            jobs_key="scheduler:emitter:jobs",
+            run_times_key="scheduler:emitter:run_times",
+            **connect_args,
+        )
+    }
 
 
-class EmitterScheduler(AsyncIOScheduler):
-    async def start_scheduler(self):
-        logger.info("[SCHEDULER] Starting scheduler and loading emitters")
-        super().start()
-        self.schedule_sync_emitters()
+def emitter_job_args(emitter: EmitterModel) -> list:
+    return [{
+        "message_id": emitter.message.id,
+        "bot_id": emitter.bot_id,
+        "needs_message_processing": emitter.needs_message_processing
+    }]
 
-        async with sessionmanager.session() as session:
-            emitters = await crud_emitter.read_emitters(session)
-            emitter_job_ids = {e.job_id for e in emitters if e.job_id}
 
-            all_scheduler_jobs = self.get_jobs()
-            for job in all_scheduler_jobs:
-                if job.id != "sync_emitters" and job.id not in emitter_job_ids:
-                    logger.info(f"[SCHEDULER] Removing stale job: {job.id}")
-                    self.remove_job(job.id)
+def same_trigger(left, right) -> bool:
+    """У триггеров APScheduler нет __eq__: сравниваем тип, выражение и параметры."""
+    return (type(left) is type(right) and str(left) == str(right)
+            and str(left.timezone) == str(right.timezone)
+            and getattr(left, "jitter", None) == getattr(right, "jitter", None)
+            and getattr(left, "end_date", None) == getattr(right, "end_date", None))
 
-            for emitter in emitters:
-                await self.add_emitter(session, emitter)
 
-        logger.info("[SCHEDULER] Initial emitters loaded")
+class EmitterScheduler(AsyncIOScheduler):
+    """
+    Планировщик эмиттеров поверх общего хранилища задач.
+    Запущен на каждой реплике, но задачи выполняет только лидер; остальные стоят
+    на паузе и лишь применяют события эмиттеров к хранилищу.
+    """
+
+    async def start_scheduler(self, paused: bool = True):
+        logger.info(f"[SCHEDULER] Starting scheduler (paused={paused})")
+        super().start(paused=paused)
+
+    async def on_elected(self):
+        """Новый лидер сверяет хранилище с базой один раз и начинает выполнять задачи."""
+        await self.reconcile_emitters()
+        self.resume()
+        logger.info("[SCHEDULER] Leader: running emitter jobs")
+
+    async def on_revoked(self):
+        self.pause()
+        logger.info("[SCHEDULER] Follower: emitter jobs paused")
 
     async def add_emitter(self, session: AsyncSession, emitter: EmitterModel) -> EmitterModel:
         if emitter.message_id is None or emitter.cron_id is None:
+            self.remove_emitter_job(emitter.job_id)
             if emitter.is_active:
                 emitter.is_active = False
                 await session.commit()
@@ -110,18 +160,16 @@ class EmitterScheduler(AsyncIOScheduler):
         job = self.add_job(
             publish_emitter_message_batch,
             trigger=emitter.cron.get_cron_trigger(),
-            args=[{
-                "message_id": emitter.message.id,
-                "bot_id": emitter.bot_id,
-                "needs_message_processing": emitter.needs_message_processing
-            }],
+            args=emitter_job_args(emitter),
             id=emitter.job_id or None,
-            name=emitter.name
+            name=emitter.name,
+            replace_existing=True,
         )
 
-        emitter.job_id = job.id
-        await session.commit()
-        await session.refresh(emitter)
+        if emitter.job_id != job.id:
+            emitter.job_id = job.id
+            await session.commit()
+            await session.refresh(emitter)
         logger.info(f"[SCHEDULER] Added emitter: {emitter.name} (job_id={emitter.job_id})")
 
         if emitter.is_active:
@@ -134,16 +182,20 @@ class EmitterScheduler(AsyncIOScheduler):
 
     async def delete_emitter(self, session: AsyncSession, emitter: EmitterModel):
         logger.info(f"[SCHEDULER] Deleting emitter: {emitter.name}")
-        if emitter.job_id and self.get_job(emitter.job_id):
-            self.remove_job(emitter.job_id)
+        self.remove_emitter_job(emitter.job_id)
         await crud_emitter.delete_emitter(session, emitter.id)
         await session.commit()
 
+    def remove_emitter_job(self, job_id: str | None) -> None:
+        if job_id and self.get_job(job_id):
+            self.remove_job(job_id)
+
     async def update_emitter(self, session: AsyncSession, emitter: EmitterModel):
         logger.info(f"[SCHEDULER] Updating emitter: {emitter.name}")
-        if emitter.job_id is None:
+        if emitter.job_id is None or self.get_job(emitter.job_id) is None:
             return await self.add_emitter(session, emitter)
         if emitter.cron_id is None or emitter.message_id is None:
+            self.remove_emitter_job(emitter.job_id)
             if emitter.is_active:
                 emitter.is_active = False
                 await session.commit()
@@ -153,11 +205,7 @@ class EmitterScheduler(AsyncIOScheduler):
         job = self.modify_job(
             emitter.job_id,
             trigger=emitter.cron.get_cron_trigger(),
-            args=[{
-                "message_id": emitter.message.id,
-                "bot_id": emitter.bot_id,
-                "needs_message_processing": emitter.needs_message_processing
-            }]
+            args=emitter_job_args(emitter)
         )
 
         if emitter.is_active:
@@ -168,64 +216,78 @@ class EmitterScheduler(AsyncIOScheduler):
 
         return emitter
 
-    async def _run_sync_emitters(self):
-        logger.info("[SYNC] Running emitter synchronization")
+    async def reconcile_emitters(self):
+        """Сверка хранилища с базой: добавляет недостающие задачи, обновляет измененные, удаляет лишние."""
+        logger.info("[SYNC] Reconciling emitter jobs with the database")
         try:
             async with sessionmanager.session() as session:
                 emitters = await crud_emitter.read_emitters(session)
+                jobs = {job.id: job for job in self.get_jobs()}
                 valid_job_ids = set()
                 for emitter in emitters:
+                    existing_job = jobs.get(emitter.job_id) if emitter.job_id else None
+                    if existing_job is None or emitter.message_id is None or emitter.cron_id is None:
+                        emitter = await self.add_emitter(session, emitter)
+                        valid_job_ids.add(emitter.job_id)
+                        continue
+
                     valid_job_ids.add(emitter.job_id)
-                    existing_job = self.get_job(emitter.job_id) if emitter.job_id else None
-
-                    if existing_job is None:
-                        logger.info(f"[SYNC] Re-adding missing job for emitter {emitter.name}")
-                        await self.add_emitter(session, emitter)
-                    else:
-                        new_trigger = emitter.cron.get_cron_trigger()
-                        new_args = [{
-                            "message_id": emitter.message.id,
-                            "bot_id": emitter.bot_id,
-                            "needs_message_processing": emitter.needs_message_processing
-                        }]
-
-                        if existing_job.trigger != new_trigger or existing_job.args != new_args:
-                            logger.info(f"[SYNC] Updating job for emitter {emitter.name} (job_id={emitter.job_id})")
-                            self.modify_job(
-                                emitter.job_id,
-                                trigger=new_trigger,
-                                args=new_args,
-                                next_run_time=existing_job.next_run_time
-                            )
-
-                for job in self.get_jobs():
-                    if job.id != "sync_emitters" and job.id not in valid_job_ids:
-                        logger.info(f"[SYNC] Removing stale job: {job.id}")
-                        self.remove_job(job.id)
+                    new_trigger = emitter.cron.get_cron_trigger()
+                    new_args = emitter_job_args(emitter)
+                    if not same_trigger(existing_job.trigger, new_trigger) or list(existing_job.args) != new_args:
+                        logger.info(f"[SYNC] Updating job for emitter {emitter.name} (job_id={emitter.job_id})")
+                        self.modify_job(
+                            emitter.job_id,
+                            trigger=new_trigger,
+                            args=new_args,
+                            next_run_time=existing_job.next_run_time
+                        )
+
+                for job_id in jobs.keys() - valid_job_ids:
+                    logger.info(f"[SYNC] Removing stale job: {job_id}")
+                    self.remove_job(job_id)
 
         except Exception as e:
             logger.exception(f"[SYNC] Error during emitter synchronization: {repr(e)}")
 
-    def schedule_sync_emitters(self):
-        self.add_job(self._run_sync_emitters, trigger="interval", seconds=180, id="sync_emitters", name="Sync Emitters")
-        logger.info("[SCHEDULER] Scheduled emitter sync job every 180 seconds")
 
-
-scheduler = EmitterScheduler(timezone=settings.TIME_ZONE)
+scheduler = EmitterScheduler(
+    jobstores=build_jobstores(),
+    job_defaults={
+        # Пропущенные за время смены лидера запуски выполняются один раз, а не пачкой
+        "coalesce": True,
+        "max_instances": 1,
+        "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_TIME,
+    },
+    timezone=settings.TIME_ZONE,
+)
+leader_election = LeaderElection(
+    broker_redis(), "scheduler:emitters",
+    ttl=settings.SCHEDULER_LEADER_TTL,
+    renew_interval=settings.SCHEDULER_LEADER_RENEW_INTERVAL,
+)
 
 
 async def run_scheduler():
     logger.info("[START] Scheduler loop starting...")
+    election_task = None
     try:
-        await scheduler.start_scheduler()
+        await scheduler.start_scheduler(paused=True)
+        election_task = asyncio.create_task(leader_election.run(scheduler.on_elected, scheduler.on_revoked))
         logger.info("[START] Scheduler Worker started")
 
         while True:
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(settings.SCHEDULER_STORE_POLL_INTERVAL)
+            # Задачи могли поменять другие реплики: лидер перечитывает ближайший запуск из хранилища
+            if leader_election.is_leader:
+                scheduler.wakeup()
     except Exception as e:
         logger.exception("Scheduler worker encountered an error")
     finally:
         logger.info("[STOP] Scheduler worker stopping")
+        if election_task is not None:
+            election_task.cancel()
+            await asyncio.gather(election_task, return_exceptions=True)
         scheduler.shutdown()
 
 
@@ -237,9 +299,13 @@ async def run_faststream():
 
 async def main():
     logger.info("[MAIN] Starting application...")
+    start_metrics_server(settings.METRICS_PORT)
     scheduler_task = asyncio.create_task(run_scheduler())
     faststream_task = asyncio.create_task(run_faststream())
-    await asyncio.gather(scheduler_task, faststream_task)
+    try:
+        await asyncio.gather(scheduler_task, faststream_task)
+    finally:
+        await redis_pools.close()
     logger.info("[MAIN] Application exiting")
 
 
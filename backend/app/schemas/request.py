@@ -27,6 +27,7 @@ class RequestBase(BaseModel):
     url_params: Optional[Union[JsonSchemaValue, str]] = None
     attachments: Optional[str] = None
     proxies: Optional[str] = None
+    cache_ttl: Optional[int] = None
 
 
 class RequestSimple(RequestBase, Timestamp):
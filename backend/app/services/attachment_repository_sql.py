@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import Optional
-from sqlalchemy import text
+import logging
+from typing import Iterable, Optional
+from sqlalchemy import bindparam, text
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection
 
 from app.services.attachment_service import AttachmentRepository, AttachmentMeta
 
+logger = logging.getLogger(__name__)
+
 
 class SqlAttachmentRepository(AttachmentRepository):
     def __init__(self, engine: AsyncEngine | AsyncConnection) -> None:
@@ -53,4 +56,52 @@ class SqlAttachmentRepository(AttachmentRepository):
         data = dict(row)
         return AttachmentMeta(id=data["id"], content_type=data.get("content_type"), key=data.get("file"))
 
+    async def get_many(self, attachment_ids: Iterable[str]) -> dict[str, AttachmentMeta]:
+        """
+        Метаданные нескольких вложений одним запросом: {id: meta}, ненайденных в ответе нет.
+        Если запрос пачки не удался, вложения читаются по одному и пропускаются только
+        те, что прочитать не удалось, — как при поштучной загрузке.
+        """
+        ids = list(dict.fromkeys(str(attachment_id) for attachment_id in attachment_ids if attachment_id))
+        if not ids:
+            return {}
+        query = text(
+            "SELECT id, content_type, file FROM attachment WHERE id IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        try:
+            if hasattr(self.engine, "connect"):
+                async with self.engine.connect() as conn:  # type: ignore[attr-defined]
+                    rows = (await conn.execute(query, {"ids": ids})).mappings().all()
+            else:
+                conn = self.engine  # type: ignore[assignment]
+                rows = (await conn.execute(query, {"ids": ids})).mappings().all()
+        except Exception as e:
+            logger.warning(f"Batch attachment lookup failed, falling back to one by one: {e}")
+            await self._rollback()
+            return await self._get_each(ids)
+        return {
+            str(row["id"]): AttachmentMeta(id=row["id"], content_type=row.get("content_type"), key=row.get("file"))
+            for row in rows
+        }
+
+    async def _get_each(self, ids: list[str]) -> dict[str, AttachmentMeta]:
+        metas = {}
+        for attachment_id in ids:
+            try:
+                meta = await self.get_by_id(attachment_id)
+            except Exception as e:
+                logger.warning(f"Attachment {attachment_id} lookup failed: {e}")
+                await self._rollback()
+                continue
+            if meta:
+                metas[attachment_id] = meta
+        return metas
 
+    async def _rollback(self) -> None:
+        """Общее соединение после ошибки нужно вернуть в рабочее состояние."""
+        if hasattr(self.engine, "connect"):
+            return
+        try:
+            await self.engine.rollback()  # type: ignore[union-attr]
+        except Exception:
+            pass
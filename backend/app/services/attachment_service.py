@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Protocol, Optional, Tuple
+from typing import AsyncIterable, BinaryIO, Iterable, Protocol, Optional, Tuple
 from datetime import datetime
 import re
 import os
@@ -20,11 +20,14 @@ class AttachmentMeta:
 class AttachmentStoragePort(Protocol):
     async def upload(self, key: str, data: bytes, content_type: Optional[str] = None) -> None: ...
     async def get_bytes(self, key: str) -> bytes: ...
+    async def upload_stream(self, key: str, chunks: AsyncIterable[bytes], content_type: Optional[str] = None) -> int: ...
+    async def download_to(self, key: str, fileobj: BinaryIO, chunk_size: int = ...) -> int: ...
 
 
 class AttachmentRepository(Protocol):
     async def create(self, content_type: Optional[str], key: str, message_id: Optional[str] = None) -> AttachmentMeta: ...
     async def get_by_id(self, attachment_id: str) -> Optional[AttachmentMeta]: ...
+    async def get_many(self, attachment_ids: Iterable[str]) -> dict[str, AttachmentMeta]: ...
 
 
 class AttachmentService:
@@ -80,7 +83,30 @@ class AttachmentService:
         key, unique_filename = self.build_storage_key(filename, content_type)
         await self.storage.upload(key, data, content_type=content_type)
         meta = await self.repo.create(content_type=content_type, key=key)
+        await self._invalidate_media(unique_filename, key)
         meta.file_name = unique_filename
         meta.size = len(data)
         return meta
 
+    async def create_from_stream(self, chunks: AsyncIterable[bytes], filename: str,
+                                 content_type: Optional[str]) -> AttachmentMeta:
+        key, unique_filename = self.build_storage_key(filename, content_type)
+        upload_stream = getattr(self.storage, "upload_stream", None)
+        if upload_stream is not None:
+            size = await upload_stream(key, chunks, content_type=content_type)
+        else:
+            # Хранилище без потоковой загрузки получает файл целиком
+            data = b"".join([chunk async for chunk in chunks])
+            await self.storage.upload(key, data, content_type=content_type)
+            size = len(data)
+        meta = await self.repo.create(content_type=content_type, key=key)
+        await self._invalidate_media(unique_filename, key)
+        meta.file_name = unique_filename
+        meta.size = size
+        return meta
+
+    @staticmethod
+    async def _invalidate_media(file_name: str, key: str) -> None:
+        """/media мог запомнить 404 по этому имени, пока вложения еще не было."""
+        from app.services.media_service import media_resolver
+        await media_resolver.invalidate(file_name=file_name, key=key)
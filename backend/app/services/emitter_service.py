@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+
+from app.broker import broker
+from app.config import settings
+from app.managers.local_cache import INVALIDATION_CHANNEL, local_cache
+from app.managers.message_manager import MessageManager
+from app.metrics.engine import engine_metrics
+from app.schemas.message import MessagePublic
+
+logger = logging.getLogger(__name__)
+
+# Исходные сообщения эмиттеров вместе с виджетом, которым они будут отправлены
+SQL_LOAD_TEMPLATES = """
+SELECT m.id, m.text, m.params, m.channel_id, m.recipient_id, m.widget_id,
+       CASE WHEN w.id IS NULL THEN NULL ELSE to_json(w.*) END AS widget
+FROM message m
+LEFT JOIN widget w ON w.id = m.widget_id
+WHERE m.id = ANY(CAST(:ids AS varchar[]))"""
+
+SQL_LOAD_BOT_CHANNELS = """
+SELECT subscriber_id, channel_id FROM subscribers_table
+WHERE subscriber_id = ANY(CAST(:ids AS varchar[]))"""
+
+# Сбросы кеша рассылки: emitter:message:<id> (пустой id — все сообщения) и emitter:bot:<id>
+INVALIDATION_PREFIX = "emitter:"
+
+
+class EmitterBroadcaster:
+    """
+    Массовая отправка сообщений эмиттеров: одна пачка из emitter.batch — один INSERT
+    копий, одна транзакция и один pipeline Redis для уведомлений и стрима ботов.
+    Исходные сообщения и каналы ботов кешируются в процессе на ttl секунд, поэтому
+    эмиттеры, срабатывающие в начале часа, не перечитывают их из базы на каждый запуск.
+    Правки сообщений, виджетов, эмиттеров и подписок бота сбрасывают кеш во всех
+    процессах через INVALIDATION_CHANNEL; без подписки на него кеш не используется.
+    """
+
+    def __init__(self, engine=None, ttl: float = 60, redis=None):
+        self._engine = engine
+        self._redis = redis
+        self.ttl = ttl
+        self._templates: dict[str, tuple[float, Optional[dict]]] = {}
+        self._bot_channels: dict[str, tuple[float, frozenset]] = {}
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.database import sessionmanager
+            return sessionmanager.engine
+        return self._engine
+
+    def set_redis(self, redis) -> None:
+        self._redis = redis
+
+    def invalidate(self, message_id: str | None = None, bot_id: str | None = None) -> None:
+        if message_id:
+            self._templates.pop(str(message_id), None)
+        if bot_id:
+            self._bot_channels.pop(str(bot_id), None)
+
+    def _on_invalidate(self, key: str) -> None:
+        kind, _, object_id = key[len(INVALIDATION_PREFIX):].partition(":")
+        if kind == "message" and not object_id:
+            self._templates.clear()
+        elif kind == "message":
+            self.invalidate(message_id=object_id)
+        elif kind == "bot":
+            self.invalidate(bot_id=object_id)
+
+    async def send(self, jobs: list[dict]) -> list[dict]:
+        """
+        Отправляет сообщения по аргументам задач эмиттеров
+        ({"message_id", "bot_id", "needs_message_processing"}). Возвращает созданные сообщения.
+        """
+        jobs = [job for job in jobs if job.get("message_id") and job.get("bot_id")]
+        if not jobs:
+            return []
+        if self._redis is not None:
+            local_cache.ensure_listener(self._redis)
+        templates = await self._load_templates({str(job["message_id"]) for job in jobs})
+        bot_channels = await self._load_bot_channels({str(job["bot_id"]) for job in jobs})
+
+        rows, widgets, needs_processing = [], {}, set()
+        for job in jobs:
+            message_id, bot_id = str(job["message_id"]), str(job["bot_id"])
+            template = templates.get(message_id)
+            if template is None:
+                logger.warning(f"Message {message_id} not found")
+                continue
+            if template["channel_id"] is None:
+                logger.warning(f"Message {message_id} has no channel")
+                continue
+            if str(template["channel_id"]) not in bot_channels.get(bot_id, ()):
+                logger.warning(f"Bot {bot_id} not in channel {template['channel_id']}")
+                continue
+            row_id = str(uuid.uuid4())
+            rows.append({
+                "id": row_id,
+                "text": template["text"],
+                "params": template["params"],
+                "channel_id": str(template["channel_id"]),
+                "recipient_id": template["recipient_id"],
+                "sender_id": bot_id,
+                "widget_id": template["widget_id"],
+            })
+            widgets[row_id] = template["widget"]
+            if job.get("needs_message_processing", True):
+                needs_processing.add(row_id)
+
+        with engine_metrics.time_call("db", "insert_many:message"):
+            new_messages = await MessageManager(self.engine).insert_many(rows)
+        for new_message in new_messages:
+            new_message["widget"] = widgets.get(str(new_message["id"]))
+
+        try:
+            await self._publish(new_messages, needs_processing)
+        except Exception:
+            # Сообщения уже сохранены: повторная отправка пачки создала бы дубли
+            logger.exception(f"Failed to publish {len(new_messages)} emitter messages")
+        return new_messages
+
+    async def _publish(self, new_messages: list[dict], needs_processing: set[str]) -> None:
+        """Уведомления каналов и записи в стрим ботов уходят одним pipeline."""
+        if not new_messages:
+            return
+        redis = await broker.connect()
+        async with redis.pipeline(transaction=False) as pipe:
+            for new_message in new_messages:
+                channel_id = str(new_message["channel_id"])
+                await broker.publish({"channel_id": channel_id, "message": MessagePublic(**new_message).dict()},
+                                     "message_queue", pipeline=pipe)
+                if str(new_message["id"]) in needs_processing:
+                    await broker.publish({"message": stream_message(new_message), "channel_id": channel_id},
+                                         stream=settings.BOT_STREAM_NAME, pipeline=pipe)
+            await pipe.execute()
+
+    async def _load_templates(self, message_ids: set[str]) -> dict[str, Optional[dict]]:
+        cached, missing = self._from_cache(self._templates, message_ids, "emitter_message")
+        if missing:
+            async with self.engine.connect() as conn:
+                result = await conn.execute(text(SQL_LOAD_TEMPLATES), {"ids": list(missing)})
+                loaded = {str(row["id"]): dict(row) for row in result.mappings().all()}
+            expires_at = time.monotonic() + self.ttl
+            for message_id in missing:
+                cached[message_id] = self._templates[message_id] = (expires_at, loaded.get(message_id))
+        return {message_id: entry[1] for message_id, entry in cached.items()}
+
+    async def _load_bot_channels(self, bot_ids: set[str]) -> dict[str, frozenset]:
+        cached, missing = self._from_cache(self._bot_channels, bot_ids, "emitter_bot_channels")
+        if missing:
+            channels: dict[str, set] = {bot_id: set() for bot_id in missing}
+            async with self.engine.connect() as conn:
+                result = await conn.execute(text(SQL_LOAD_BOT_CHANNELS), {"ids": list(missing)})
+                for row in result.mappings().all():
+                    channels[str(row["subscriber_id"])].add(str(row["channel_id"]))
+            expires_at = time.monotonic() + self.ttl
+            for bot_id, bot_channels in channels.items():
+                cached[bot_id] = self._bot_channels[bot_id] = (expires_at, frozenset(bot_channels))
+        return {bot_id: entry[1] for bot_id, entry in cached.items()}
+
+    @staticmethod
+    def _from_cache(entries: dict, keys: Iterable[str], key_class: str) -> tuple[dict, set[str]]:
+        now = time.monotonic()
+        if not local_cache.active:
+            # Сбросы от других процессов не доходят — кешу верить нельзя
+            entries.clear()
+        cached = {key: entries[key] for key in keys if key in entries and entries[key][0] > now}
+        missing = set(keys) - cached.keys()
+        engine_metrics.observe_cache(key_class, "l1", True, len(cached))
+        engine_metrics.observe_cache(key_class, "l1", False, len(missing))
+        return cached, missing
+
+
+def stream_message(message: dict) -> dict:
+    """Сообщение для стрима ботов в формате MessageModel.get_dict()."""
+    return {"message": {
+        "id": str(message["id"]),
+        "text": message.get("text"),
+        "params": message.get("params"),
+        "sender_id": str(message["sender_id"]) if message.get("sender_id") is not None else None,
+        "recipient_id": str(message["recipient_id"]) if message.get("recipient_id") is not None else None,
+        "channel_id": str(message["channel_id"]) if message.get("channel_id") is not None else None,
+        "attachments": [],
+    }}
+
+
+async def invalidate_emitter_cache(message_id: str | None = None, bot_id: str | None = None,
+                                   all_messages: bool = False) -> None:
+    """Сбрасывает исходное сообщение и каналы бота в кеше рассылки всех процессов."""
+    from app.redis_pool import cache_redis
+    keys = []
+    if all_messages or message_id:
+        keys.append(f"{INVALIDATION_PREFIX}message:{'' if all_messages else message_id}")
+    if bot_id:
+        keys.append(f"{INVALIDATION_PREFIX}bot:{bot_id}")
+    for key in keys:
+        emitter_broadcaster._on_invalidate(key)
+    if not keys:
+        return
+    try:
+        async with cache_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.publish(INVALIDATION_CHANNEL, key)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to publish emitter cache invalidation {keys}: {e}")
+
+
+emitter_broadcaster = EmitterBroadcaster(ttl=settings.EMITTER_CACHE_TTL)
+local_cache.on_invalidate(INVALIDATION_PREFIX, emitter_broadcaster._on_invalidate)
@@ -1,35 +1,154 @@
 """Сервис для работы с иконками в S3."""
-from typing import Optional
-from app.services.s3_service import upload_bytes, generate_presigned_get_url, object_exists
+import asyncio
+import json
+import logging
+import time
+from typing import Optional, Tuple, Dict
+
+from app.services.s3_service import upload_bytes
+from app.services.s3_storage_service import S3StorageService
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
+IconKey = Tuple[str, int]
+
 
 class IconService:
-    """Сервис для работы с иконками в S3."""
-    
-    def __init__(self):
+    """
+    Сервис для работы с иконками в S3.
+    URL иконок кешируются: L1 — словарь процесса, L2 (опционально) — Redis.
+    Presigned URL обновляется в фоне за refresh_before секунд до истечения,
+    так что клиенту не отдается ссылка, которая вот-вот протухнет.
+    Отсутствие иконки тоже кешируется (на missing_ttl) — вместо HEAD на каждый запрос.
+    """
+
+    REDIS_PREFIX = "icon:url:"
+
+    def __init__(self, storage: Optional[S3StorageService] = None, redis=None,
+                 refresh_before: int = 300, missing_ttl: int = 300):
         self.bucket = settings.S3_BUCKET
         self.base_path = "icons"
-    
+        self.storage = storage or S3StorageService()
+        self._redis = redis
+        self.refresh_before = refresh_before
+        self.missing_ttl = missing_ttl
+        # (s3_key, expires_in) -> {"url", "refresh_at", "expires_at"} во времени time.time()
+        self._urls: Dict[IconKey, dict] = {}
+        self._inflight: Dict[IconKey, asyncio.Task] = {}
+
+    def set_redis(self, redis) -> None:
+        self._redis = redis
+
+    @property
+    def default_icon_url(self) -> str:
+        return f"{settings.S3_PUBLIC_ENDPOINT}/{self.bucket}/icons/default.svg"
+
+    @staticmethod
+    def _now() -> float:
+        return time.time()
+
     async def get_icon_url(self, s3_key: str, expires_in: int = 3600) -> str:
         """
         Получает публичный URL иконки из S3.
-        
+
         Args:
             s3_key: S3 ключ иконки
             expires_in: Время жизни URL в секундах
-        
+
         Returns:
             Публичный URL иконки
         """
-        # Проверяем существование
-        if not await object_exists(s3_key):
-            # Возвращаем placeholder или дефолтную иконку
-            return f"{settings.S3_PUBLIC_ENDPOINT}/{self.bucket}/icons/default.svg"
-        
-        # Генерируем presigned URL
-        return await generate_presigned_get_url(s3_key, expires_in=expires_in)
-    
+        key = (s3_key, expires_in)
+        entry = self._urls.get(key)
+        now = self._now()
+        if entry is not None and entry["expires_at"] > now:
+            if entry["refresh_at"] <= now:
+                self._load(key)
+            return entry["url"]
+
+        entry = await self._redis_get(key)
+        if entry is not None and entry["expires_at"] > now:
+            self._urls[key] = entry
+            if entry["refresh_at"] <= now:
+                self._load(key)
+            return entry["url"]
+
+        # shield: отмена одного запроса каталога не отменяет загрузку для остальных
+        return (await asyncio.shield(self._load(key)))["url"]
+
+    def _load(self, key: IconKey) -> asyncio.Task:
+        """Одна загрузка URL на ключ (singleflight), в том числе фоновая."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._fetch(key))
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        return task
+
+    async def _fetch(self, key: IconKey) -> dict:
+        s3_key, expires_in = key
+        now = self._now()
+        try:
+            # Проверяем существование
+            exists = await self.storage.head(s3_key) is not None
+            if exists:
+                # Генерируем presigned URL
+                url = await self.storage.presigned_get_url(s3_key, expires_in=expires_in)
+                ttl = expires_in
+            else:
+                # Возвращаем placeholder или дефолтную иконку
+                url, ttl = self.default_icon_url, self.missing_ttl
+        except Exception as e:
+            logger.warning(f"Failed to resolve icon {s3_key}: {e}")
+            stale = self._urls.get(key)
+            if stale is not None and stale["expires_at"] > now:
+                return stale
+            url, ttl = self.default_icon_url, min(self.missing_ttl, 60)
+
+        entry = {
+            "url": url,
+            "expires_at": now + ttl,
+            "refresh_at": now + max(ttl - self.refresh_before, ttl / 2),
+        }
+        self._urls[key] = entry
+        await self._redis_set(key, entry)
+        return entry
+
+    def invalidate(self, s3_key: str) -> None:
+        for key in [key for key in self._urls if key[0] == s3_key]:
+            self._urls.pop(key, None)
+
+    async def _redis_get(self, key: IconKey) -> Optional[dict]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(f"{self.REDIS_PREFIX}{key[1]}:{key[0]}")
+        except Exception as e:
+            logger.warning(f"Icon URL cache read failed for {key[0]}: {e}")
+            return None
+        return json.loads(raw) if raw else None
+
+    async def _redis_set(self, key: IconKey, entry: dict) -> None:
+        if self._redis is None:
+            return
+        ttl = int(entry["expires_at"] - self._now())
+        if ttl <= 0:
+            return
+        try:
+            await self._redis.set(f"{self.REDIS_PREFIX}{key[1]}:{key[0]}", json.dumps(entry), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Icon URL cache write failed for {key[0]}: {e}")
+
+    async def _redis_delete(self, s3_key: str) -> None:
+        if self._redis is None:
+            return
+        try:
+            keys = [k async for k in self._redis.scan_iter(match=f"{self.REDIS_PREFIX}*:{s3_key}")]
+            if keys:
+                await self._redis.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Icon URL cache invalidation failed for {s3_key}: {e}")
+
     async def upload_icon(
         self,
         file_content: bytes,
@@ -38,32 +157,34 @@ class IconService:
     ) -> str:
         """
         Загружает иконку в S3 и возвращает ключ.
-        
+
         Args:
             file_content: Содержимое файла
             filename: Имя файла (будет добавлен base_path)
             content_type: MIME тип файла
-        
+
         Returns:
             S3 ключ загруженной иконки
         """
         s3_key = f"{self.base_path}/{filename}"
         await upload_bytes(s3_key, file_content, content_type=content_type)
+        # Вместо закешированной заглушки сразу отдаем новую иконку
+        self.invalidate(s3_key)
+        await self._redis_delete(s3_key)
         return s3_key
-    
+
     async def icon_exists(self, s3_key: str) -> bool:
         """
         Проверяет существование иконки в S3.
-        
+
         Args:
             s3_key: S3 ключ иконки
-        
+
         Returns:
             True если иконка существует
         """
-        return await object_exists(s3_key)
+        return await self.storage.head(s3_key) is not None
 
 
 # Глобальный экземпляр сервиса
-icon_service = IconService()
-
+icon_service = IconService(refresh_before=settings.ICON_URL_REFRESH_BEFORE)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.managers.local_cache import INVALIDATION_CHANNEL, local_cache
+from app.services.s3_storage_service import S3StorageService
+
+logger = logging.getLogger(__name__)
+
+# Имя файла — последний сегмент ключа; по этому выражению построен индекс ix_attachment_file_basename
+SQL_RESOLVE_KEY = """
+SELECT file FROM attachment
+WHERE regexp_replace(file, '^.*/', '') = :file_name
+LIMIT 1"""
+
+
+class MediaResolver:
+    """
+    Находит объект S3 для /media и держит его метаданные (ключ, размер, тип, ETag, Last-Modified).
+    Ключ ищется в таблице attachment по индексу имени файла, а не перебором ключей в S3.
+    L1 — LRU в памяти процесса, L2 (опционально) — Redis. Отсутствующие файлы
+    запоминаются на negative_ttl, чтобы повторные 404 не ходили в базу.
+    Новое вложение сбрасывает свои записи (invalidate) в Redis и в L1 всех процессов.
+    """
+
+    REDIS_PREFIX = "media:object:"
+
+    def __init__(self, storage: S3StorageService | None = None, engine=None, redis=None,
+                 maxsize: int = 10_000, ttl: float = 3600, negative_ttl: float = 60):
+        self.storage = storage or S3StorageService()
+        self._engine = engine
+        self._redis = redis
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict[str, tuple[float, Optional[dict]]] = OrderedDict()
+
+    def set_redis(self, redis) -> None:
+        self._redis = redis
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from app.database import sessionmanager
+            return sessionmanager.engine
+        return self._engine
+
+    async def by_name(self, file_name: str) -> Optional[dict]:
+        """Объект вложения по имени файла (старые ссылки /media/attachment/<name>)."""
+        return await self._cached(f"name:{file_name}", lambda: self._load_by_name(file_name))
+
+    async def by_key(self, key: str) -> Optional[dict]:
+        """Объект по полному ключу S3."""
+        return await self._cached(f"key:{key}", lambda: self.storage.head(key))
+
+    async def invalidate(self, file_name: str | None = None, key: str | None = None) -> None:
+        from app.redis_pool import cache_redis
+        redis_keys = [self.REDIS_PREFIX + cache_key
+                      for cache_key in (f"name:{file_name}" if file_name else None, f"key:{key}" if key else None)
+                      if cache_key]
+        for redis_key in redis_keys:
+            self._forget(redis_key)
+        if not redis_keys:
+            return
+        try:
+            async with (self._redis or cache_redis()).pipeline(transaction=False) as pipe:
+                pipe.unlink(*redis_keys)
+                for redis_key in redis_keys:
+                    pipe.publish(INVALIDATION_CHANNEL, redis_key)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Media cache invalidation failed for {redis_keys}: {e}")
+
+    def _forget(self, redis_key: str) -> None:
+        self._entries.pop(redis_key[len(self.REDIS_PREFIX):], None)
+
+    async def _load_by_name(self, file_name: str) -> Optional[dict]:
+        async with self.engine.connect() as conn:
+            key = (await conn.execute(text(SQL_RESOLVE_KEY), {"file_name": file_name})).scalar()
+        if key:
+            return await self.storage.head(str(key))
+        # Объекты, загруженные до таблицы вложений, лежат по плоскому ключу
+        return await self.storage.head(f"attachment/{file_name}")
+
+    async def _cached(self, cache_key: str, load) -> Optional[dict]:
+        if self._redis is not None:
+            local_cache.ensure_listener(self._redis)
+        entry = self._entries.get(cache_key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(cache_key)
+            return entry[1]
+
+        found, meta = await self._redis_get(cache_key)
+        if not found:
+            meta = await load()
+            await self._redis_set(cache_key, meta)
+        self._remember(cache_key, meta)
+        return meta
+
+    def _remember(self, cache_key: str, meta: Optional[dict]) -> None:
+        ttl = self.ttl if meta is not None else self.negative_ttl
+        self._entries[cache_key] = (time.monotonic() + ttl, meta)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _redis_get(self, cache_key: str) -> tuple[bool, Optional[dict]]:
+        if self._redis is None:
+            return False, None
+        try:
+            raw = await self._redis.get(self.REDIS_PREFIX + cache_key)
+        except Exception as e:
+            logger.warning(f"Media cache read failed for {cache_key}: {e}")
+            return False, None
+        if raw is None:
+            return False, None
+        return True, json.loads(raw)
+
+    async def _redis_set(self, cache_key: str, meta: Optional[dict]) -> None:
+        if self._redis is None:
+            return
+        ttl = self.ttl if meta is not None else self.negative_ttl
+        try:
+            await self._redis.set(self.REDIS_PREFIX + cache_key, json.dumps(meta), ex=int(ttl))
+        except Exception as e:
+            logger.warning(f"Media cache write failed for {cache_key}: {e}")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Диапазон из заголовка Range (один, включительно) или None — отдать объект целиком.
+    ValueError — диапазон за пределами объекта (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        # Несколько диапазонов не поддерживаем: по RFC 9110 можно ответить целиком
+        return None
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+    if not sep or not (start or end) or (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    if not start:
+        if int(end) == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - int(end), 0), size - 1
+    first, last = int(start), int(end) if end else size - 1
+    if end and last < first:
+        return None
+    if first >= size:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, size - 1)
+
+
+def is_not_modified(meta: dict, if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Условный GET: If-None-Match важнее If-Modified-Since."""
+    etag = meta.get("etag")
+    if if_none_match:
+        if not etag:
+            return False
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or etag.removeprefix("W/") in candidates
+    if if_modified_since and meta.get("last_modified"):
+        try:
+            return parsedate_to_datetime(meta["last_modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+media_resolver = MediaResolver(ttl=settings.MEDIA_KEY_CACHE_TTL)
+local_cache.on_invalidate(MediaResolver.REDIS_PREFIX, media_resolver._forget)
@@ -1,5 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncEngine  
-from app.engine.variables import variable_substitution_pydantic
+from app.engine.variables import variable_substitution_pydantic, TemplateCache
 from app.managers.message_manager import MessageManager
 from app.managers.widget_manager import WidgetManager
 from app.schemas.message import MessagePublic, MessageCreate
@@ -14,18 +14,19 @@ class MessageService:
         self.message_manager = MessageManager(engine)
         self.widget_manager = WidgetManager(engine)
 
-    async def send_message(self, session: SessionSimple, message_schema: MessagePublic, context: dict) -> dict:
+    async def send_message(self, session: SessionSimple, message_schema: MessagePublic, context: dict,
+                           templates: TemplateCache | None = None) -> dict:
 
         # TODO: Реализовать проверку доступа
         # recipient_id = message_schema.recipient_id or session.user_id
         # await check_channel_access(...)
 
-        message_copy_in: MessagePublic = await variable_substitution_pydantic(message_schema, context)
+        message_copy_in: MessagePublic = await variable_substitution_pydantic(message_schema, context, templates)
 
         if message_copy_in.widget:
             widget_data = message_copy_in.widget.model_dump()
             widget_copy_data = prepare_widget_copy_data(widget_data)
-            new_widget = await self.widget_manager.insert(widget_copy_data)
+            new_widget = await self.widget_manager.insert_rendered(widget_copy_data)
             message_copy_in.widget_id = new_widget["id"]
             message_copy_in.widget = new_widget
 
@@ -39,4 +40,4 @@ class MessageService:
         new_message["widget"] = message_copy_in.widget
         new_message_in = MessagePublic(**new_message)
         await publish_notify_message(session.channel_id, new_message_in)
-        return new_message
\ No newline at end of file
+        return new_message
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
-from typing import Optional
+import asyncio
+from contextlib import AsyncExitStack
+from datetime import datetime
+from email.utils import format_datetime
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Optional
 from aiobotocore.config import AioConfig
 import aiobotocore.session
+from botocore.exceptions import ClientError
 
 from app.config import settings
 from app.services.attachment_service import AttachmentStoragePort
@@ -11,42 +16,163 @@ from app.services.attachment_service import AttachmentStoragePort
 aiobotocore_session = aiobotocore.session.AioSession()
 
 
+class S3ClientPool:
+    """
+    Долгоживущий клиент S3 с пулом соединений.
+    Клиент привязан к event loop, в котором создан; в новом loop создается заново.
+    """
+
+    def __init__(self, endpoint_url: str, max_pool_connections: int = 50):
+        self.endpoint_url = endpoint_url
+        self.max_pool_connections = max_pool_connections
+        self._client = None
+        self._stack: Optional[AsyncExitStack] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client, self._stack, self._loop, self._lock = None, None, loop, asyncio.Lock()
+        if self._client is None:
+            async with self._lock:
+                if self._client is None:
+                    stack = AsyncExitStack()
+                    self._client = await stack.enter_async_context(aiobotocore_session.create_client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=settings.S3_REGION,
+                        config=AioConfig(
+                            signature_version="s3v4",
+                            s3={"addressing_style": "path"},
+                            max_pool_connections=self.max_pool_connections,
+                        ),
+                        aws_secret_access_key=settings.S3_SECRET_KEY,
+                        aws_access_key_id=settings.S3_ACCESS_KEY,
+                    ))
+                    self._stack = stack
+        return self._client
+
+    async def close(self) -> None:
+        stack, self._client, self._stack = self._stack, None, None
+        if stack is not None:
+            await stack.aclose()
+
+
+s3_clients = S3ClientPool(settings.S3_ENDPOINT, settings.S3_MAX_POOL_CONNECTIONS)
+# Presigned URL подписываются под адрес, доступный клиентам; сетевых запросов клиент не делает
+s3_presign_clients = S3ClientPool(settings.S3_PUBLIC_ENDPOINT or settings.S3_ENDPOINT, 1)
+
+
 class S3StorageService(AttachmentStoragePort):
+    def __init__(self, clients: S3ClientPool | None = None, presign_clients: S3ClientPool | None = None):
+        self.clients = clients or s3_clients
+        self.presign_clients = presign_clients or s3_presign_clients
+
     async def upload(self, key: str, data: bytes, content_type: Optional[str] = None) -> None:
-        async with aiobotocore_session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            region_name=settings.S3_REGION,
-            config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-        ) as s3_client:
-            params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
-            if content_type:
-                params["ContentType"] = content_type
-            await s3_client.put_object(**params)
+        s3_client = await self.clients.get()
+        params = {"Bucket": settings.S3_BUCKET, "Key": key, "Body": data}
+        if content_type:
+            params["ContentType"] = content_type
+        await s3_client.put_object(**params)
 
-    async def get_bytes(self, key: str) -> bytes:
-        async with aiobotocore_session.create_client(
-            "s3",
-            endpoint_url=settings.S3_ENDPOINT,
-            region_name=settings.S3_REGION,
-            config=AioConfig(signature_version="s3v4", s3={"addressing_style": "path"}),
-            aws_secret_access_key=settings.S3_SECRET_KEY,
-            aws_access_key_id=settings.S3_ACCESS_KEY,
-        ) as s3_client:
-            resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
-            body = resp["Body"]
-            data = await body.read()
-            try:
-                close_result = body.close()
-                if close_result is not None:
-                    try:
-                        await close_result  # type: ignore
-                    except TypeError:
-                        pass
-            except Exception:
-                pass
-            return data
+    async def upload_stream(self, key: str, chunks: AsyncIterable[bytes], content_type: Optional[str] = None,
+                            part_size: int | None = None) -> int:
+        """
+        Загружает файл по частям: в памяти лежит не больше одной части (part_size, от 5 МБ).
+        Файл меньше одной части уходит обычным put_object.
+        """
+        part_size = max(part_size or settings.S3_MULTIPART_PART_SIZE, 5 * 1024 * 1024)
+        s3_client = await self.clients.get()
+        extra = {"ContentType": content_type} if content_type else {}
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                if len(buffer) < part_size:
+                    continue
+                if upload_id is None:
+                    upload_id = (await s3_client.create_multipart_upload(
+                        Bucket=settings.S3_BUCKET, Key=key, **extra))["UploadId"]
+                parts.append(await self._upload_part(s3_client, key, upload_id, len(parts) + 1, bytes(buffer)))
+                buffer.clear()
+
+            if upload_id is None:
+                await s3_client.put_object(Bucket=settings.S3_BUCKET, Key=key, Body=bytes(buffer), **extra)
+                return size
+            if buffer:
+                parts.append(await self._upload_part(s3_client, key, upload_id, len(parts) + 1, bytes(buffer)))
+            await s3_client.complete_multipart_upload(
+                Bucket=settings.S3_BUCKET, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts})
+            return size
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    await s3_client.abort_multipart_upload(Bucket=settings.S3_BUCKET, Key=key, UploadId=upload_id)
+                except Exception:
+                    pass
+            raise
+
+    @staticmethod
+    async def _upload_part(s3_client, key: str, upload_id: str, number: int, body: bytes) -> dict:
+        resp = await s3_client.upload_part(
+            Bucket=settings.S3_BUCKET, Key=key, UploadId=upload_id, PartNumber=number, Body=body)
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+    async def head(self, key: str) -> Optional[dict]:
+        """Метаданные объекта для ответа HTTP или None, если объекта нет."""
+        s3_client = await self.clients.get()
+        try:
+            head = await s3_client.head_object(Bucket=settings.S3_BUCKET, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        last_modified = head.get("LastModified")
+        return {
+            "key": key,
+            "size": int(head.get("ContentLength") or 0),
+            "content_type": head.get("ContentType") or "application/octet-stream",
+            "etag": head.get("ETag"),
+            "last_modified": format_datetime(last_modified, usegmt=True) if isinstance(last_modified, datetime)
+            else None,
+        }
 
+    async def iter_object(self, key: str, byte_range: Optional[tuple[int, int]] = None,
+                          chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Отдает объект (или диапазон байт включительно) частями."""
+        s3_client = await self.clients.get()
+        params = {"Bucket": settings.S3_BUCKET, "Key": key}
+        if byte_range is not None:
+            params["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        resp = await s3_client.get_object(**params)
+        async with resp["Body"] as body:
+            async for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+
+    async def presigned_get_url(self, key: str, expires_in: int = 3600) -> str:
+        s3_client = await self.presign_clients.get()
+        return await s3_client.generate_presigned_url(
+            "get_object", Params={"Bucket": settings.S3_BUCKET, "Key": key}, ExpiresIn=expires_in)
+
+    async def get_bytes(self, key: str) -> bytes:
+        s3_client = await self.clients.get()
+        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+        async with resp["Body"] as body:
+            return await body.read()
 
+    async def download_to(self, key: str, fileobj: BinaryIO, chunk_size: int = 64 * 1024) -> int:
+        """Пишет объект в fileobj частями, не держа его целиком в памяти. Возвращает размер."""
+        s3_client = await self.clients.get()
+        resp = await s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+        size = 0
+        async with resp["Body"] as body:
+            async for chunk in body.iter_chunks(chunk_size):
+                fileobj.write(chunk)
+                size += len(chunk)
+        fileobj.seek(0)
+        return size
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from faststream.redis.parser.json import JSONMessageFormat
+
+from app.metrics.engine import engine_metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_KEY = b"__data__"
+
+StreamEntry = tuple[bytes | str, Any]
+
+
+def decode_stream_fields(fields: dict, message_format=JSONMessageFormat) -> Any:
+    """
+    Декодирует поля записи стрима так же, как батч-подписчик faststream:
+    сообщения брокера лежат в __data__, сырые записи (xadd) отдаются словарем строк.
+    """
+    if DATA_KEY in fields:
+        body, _ = message_format.parse(fields[DATA_KEY])
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body
+    return {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in fields.items()
+    }
+
+
+class StreamConsumer:
+    """
+    Подтверждение и повторная доставка записей consumer group:
+      - успешно обработанные записи батча подтверждаются одним XACK;
+      - упавшие остаются в PEL и забираются XAUTOCLAIM после min_idle_ms простоя;
+      - запись, доставленная больше max_deliveries раз, переносится в dead-letter стрим
+        и подтверждается, чтобы PEL не рос бесконечно.
+    """
+
+    def __init__(
+            self,
+            redis,
+            stream: str,
+            group: str,
+            consumer: str,
+            handle: Callable[[Any], Awaitable[bool]],
+            *,
+            min_idle_ms: int = 60_000,
+            reclaim_count: int = 100,
+            max_deliveries: int = 5,
+            dead_letter_stream: Optional[str] = None,
+            dead_letter_maxlen: int = 100_000,
+    ):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer
+        self.handle = handle
+        self.min_idle_ms = min_idle_ms
+        self.reclaim_count = reclaim_count
+        self.max_deliveries = max_deliveries
+        self.dead_letter_stream = dead_letter_stream or f"{stream}:dead"
+        self.dead_letter_maxlen = dead_letter_maxlen
+
+    async def process(self, entries: Iterable[StreamEntry]) -> list:
+        """Обрабатывает записи параллельно и подтверждает успешные одним XACK."""
+        entries = list(entries)
+        engine_metrics.observe_batch(self.stream, len(entries))
+        results = await asyncio.gather(*(self.handle(payload) for _, payload in entries))
+        ack_ids = [msg_id for (msg_id, _), ok in zip(entries, results) if ok]
+        await self.ack(ack_ids)
+        failed = len(entries) - len(ack_ids)
+        if failed:
+            logger.warning(f"[{self.stream}] {failed} message(s) left pending for redelivery")
+        return ack_ids
+
+    async def ack(self, ids: list) -> None:
+        if not ids:
+            return
+        try:
+            await self.redis.xack(self.stream, self.group, *ids)
+            logger.debug(f"[{self.stream}] ACKed {len(ids)} message(s)")
+        except Exception as e:
+            # Не подтвержденные записи вернутся через reclaim, обработчики должны быть к этому готовы
+            logger.error(f"[{self.stream}] XACK failed for {len(ids)} message(s): {e}")
+
+    async def reclaim(self) -> int:
+        """
+        Проходит PEL курсором XAUTOCLAIM и обрабатывает зависшие записи.
+        Возвращает число забранных записей.
+        """
+        start_id = "0-0"
+        total = 0
+        while True:
+            response = await self.redis.xautoclaim(
+                self.stream, self.group, self.consumer,
+                min_idle_time=self.min_idle_ms, start_id=start_id, count=self.reclaim_count,
+            )
+            start_id, claimed = response[0], response[1]
+            deleted = response[2] if len(response) > 2 else []
+
+            # Записи, удаленные из стрима при обрезке, больше нечего обрабатывать
+            gone = list(deleted or []) + [msg_id for msg_id, fields in claimed if msg_id and fields is None]
+            await self.ack(gone)
+
+            claimed = [(msg_id, fields) for msg_id, fields in claimed if msg_id and fields is not None]
+            if claimed:
+                total += len(claimed)
+                logger.info(f"[{self.stream}] Claimed {len(claimed)} pending message(s)")
+                deliveries = await self._delivery_counts([msg_id for msg_id, _ in claimed])
+                dead = [(msg_id, fields) for msg_id, fields in claimed
+                        if deliveries.get(msg_id, 0) > self.max_deliveries]
+                if dead:
+                    await self.dead_letter(dead, deliveries)
+                dead_ids = {msg_id for msg_id, _ in dead}
+                await self.process([(msg_id, decode_stream_fields(fields))
+                                    for msg_id, fields in claimed if msg_id not in dead_ids])
+
+            if start_id in (b"0-0", "0-0"):
+                return total
+
+    async def _delivery_counts(self, ids: list) -> dict:
+        pipe = self.redis.pipeline(transaction=False)
+        for msg_id in ids:
+            pipe.xpending_range(self.stream, self.group, min=msg_id, max=msg_id, count=1)
+        counts = {}
+        for msg_id, pending in zip(ids, await pipe.execute()):
+            counts[msg_id] = pending[0]["times_delivered"] if pending else 0
+        return counts
+
+    async def dead_letter(self, entries: list, deliveries: dict) -> None:
+        """Переносит записи в dead-letter стрим и подтверждает их в исходном атомарно."""
+        pipe = self.redis.pipeline(transaction=True)
+        for msg_id, fields in entries:
+            pipe.xadd(self.dead_letter_stream, {
+                **fields,
+                "source_stream": self.stream,
+                "source_id": msg_id,
+                "deliveries": deliveries.get(msg_id, 0),
+            }, maxlen=self.dead_letter_maxlen, approximate=True)
+        pipe.xack(self.stream, self.group, *[msg_id for msg_id, _ in entries])
+        try:
+            await pipe.execute()
+            logger.error(f"[{self.stream}] Moved {len(entries)} message(s) to {self.dead_letter_stream}")
+        except Exception as e:
+            logger.error(f"[{self.stream}] Dead-letter failed: {e}")
+
+    async def observe_backlog(self) -> None:
+        """Снимает размер PEL и отставание группы (lag, Redis 7+) в метрики."""
+        try:
+            groups = await self.redis.xinfo_groups(self.stream)
+        except Exception as e:
+            logger.warning(f"[{self.stream}] XINFO GROUPS failed: {e}")
+            return
+        for info in groups:
+            name = info.get("name")
+            if (name.decode() if isinstance(name, bytes) else name) == self.group:
+                engine_metrics.set_stream_backlog(self.stream, self.group, info.get("pending") or 0, info.get("lag"))
+                return
+
+    async def run_reclaim_loop(self, interval: float) -> None:
+        logger.info(f"[{self.stream}] Reclaim loop started, group: {self.group}, consumer: {self.consumer}")
+        while True:
+            try:
+                await self.reclaim()
+            except Exception as e:
+                logger.exception(f"[{self.stream}] Error during reclaim: {e}")
+            await self.observe_backlog()
+            await asyncio.sleep(interval)
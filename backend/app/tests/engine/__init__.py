@@ -0,0 +1,2 @@
+"""Тесты для движка обработки сообщений."""
+
@@ -0,0 +1,14 @@
+"""Конфигурация pytest для тестов движка."""
+# Тесты движка работают на фейковых Redis/DataManager и не требуют базы данных
+import pytest
+
+from app.schemas import rebuild_models
+
+rebuild_models()
+
+
+# Переопределяем фикстуру engine, чтобы не требовать базу данных для тестов движка
+@pytest.fixture(scope="session", autouse=True)
+def engine():
+    """Пустая фикстура engine для тестов движка."""
+    yield None
@@ -0,0 +1,155 @@
+"""Общие фейки Redis, engine и WebSocket для тестов движка."""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from fnmatch import fnmatchcase
+
+from fastapi import WebSocketDisconnect
+
+
+class FakePipeline:
+    """Копит команды и выполняет их на FakeRedis одним execute, как redis.asyncio.Pipeline."""
+
+    def __init__(self, redis: "FakeRedis"):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        self.redis.executed.append([(name, args) for name, args, _ in commands])
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class FakeRedis:
+    """
+    Ключи в словаре data. Публикации копятся в published, пачки команд
+    pipeline — в executed; специфичные команды (eval, стримы) добавляют наследники.
+    """
+
+    def __init__(self, data: dict | None = None):
+        self.data = {} if data is None else data
+        self.gets = 0
+        self.published = []
+        self.executed = []
+
+    async def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def unlink(self, *keys):
+        return await self.delete(*keys)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 1
+
+    async def scan_iter(self, match=None, count=None):
+        for key in list(self.data):
+            if match is None or fnmatchcase(key, match):
+                yield key
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        return self.rows[0] if self.rows else None
+
+    def scalar(self):
+        row = self.first()
+        return None if row is None else next(iter(row.values()))
+
+
+class FakeEngine:
+    """
+    AsyncEngine для сырых запросов: строки результата отдает handler(sql, params).
+    Выполненные запросы копятся в executed парами (sql, params).
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.executed = []
+
+    @property
+    def queries(self) -> list[str]:
+        return [statement for statement, _ in self.executed]
+
+    @asynccontextmanager
+    async def connect(self):
+        yield self
+
+    begin = connect
+
+    async def execute(self, statement, params=None):
+        self.executed.append((str(statement), params))
+        return FakeResult(self.handler(str(statement), params))
+
+
+class FakeWebSocket:
+    """
+    WebSocket клиента: кадры для receive_text кладутся в incoming, отправленное
+    копится в sent. blocked=True задерживает отправку до release.set(), fail=True роняет ее.
+    """
+
+    def __init__(self, token="t", blocked=False, fail=False):
+        self.query_params = {"token": token}
+        self.fail = fail
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.closed_with = None
+        self.release = asyncio.Event()
+        if not blocked:
+            self.release.set()
+
+    @property
+    def frames(self) -> list:
+        return [json.loads(text) for text in self.sent]
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self):
+        frame = await self.incoming.get()
+        if frame is WebSocketDisconnect:
+            raise WebSocketDisconnect()
+        return frame
+
+    async def send_text(self, text):
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("closed")
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        self.closed_with = code
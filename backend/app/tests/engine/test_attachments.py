@@ -0,0 +1,89 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.engine.bot_processor import ConnectionResponseHandler
+from app.services.attachment_repository_sql import SqlAttachmentRepository
+from app.services.attachment_service import AttachmentMeta
+
+
+class FakeRepo:
+    def __init__(self, metas):
+        self.metas = metas
+        self.calls = []
+
+    async def get_many(self, attachment_ids):
+        self.calls.append(list(attachment_ids))
+        return {i: self.metas[i] for i in attachment_ids if i in self.metas}
+
+
+class FakeStorage:
+    active = 0
+    peak = 0
+
+    async def download_to(self, key, fileobj, chunk_size=64 * 1024):
+        FakeStorage.active += 1
+        FakeStorage.peak = max(FakeStorage.peak, FakeStorage.active)
+        await asyncio.sleep(0.01)
+        FakeStorage.active -= 1
+        if key.endswith("broken"):
+            raise IOError("boom")
+        for part in (b"hello ", key.encode()):
+            fileobj.write(part)
+        fileobj.seek(0)
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_attachments_fetched_in_one_query_and_downloaded_concurrently():
+    repo = FakeRepo({
+        "a": AttachmentMeta(id="a", content_type="text/plain", key="attachment/a.txt"),
+        "b": AttachmentMeta(id="b", content_type=None, key="attachment/b.bin"),
+        "c": AttachmentMeta(id="c", content_type=None, key="attachment/broken"),
+    })
+    handler = ConnectionResponseHandler(None, None, None, attachment_repo=repo)
+    FakeStorage.peak = 0
+
+    with patch("app.engine.bot_processor.S3StorageService", FakeStorage):
+        files = await handler._prepare_request_files(["a", {"id": "b"}, "missing", "c"])
+
+    assert repo.calls == [["a", "b", "missing", "c"]]
+    assert FakeStorage.peak == 3
+    assert [(name, filename, content_type) for name, (filename, _, content_type) in files] == [
+        ("files", "a.txt", "text/plain"),
+        ("files", "b.bin", "application/octet-stream"),
+    ]
+    assert files[0][1][1].read() == b"hello attachment/a.txt"
+    for _, (_, fileobj, _) in files:
+        fileobj.close()
+
+
+class FailingBatchRepository(SqlAttachmentRepository):
+    """Запрос пачки падает, поштучно читается всё, кроме некорректного id."""
+
+    def __init__(self, metas):
+        super().__init__(engine=None)
+        self.metas = metas
+        self.rollbacks = 0
+
+    async def execute(self, statement, params):
+        raise ValueError("invalid input syntax")
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    async def get_by_id(self, attachment_id):
+        if attachment_id == "bad":
+            raise ValueError("invalid input syntax")
+        return self.metas.get(attachment_id)
+
+
+@pytest.mark.asyncio
+async def test_get_many_skips_only_bad_ids():
+    meta = AttachmentMeta(id="a", content_type="text/plain", key="attachment/a.txt")
+    repo = FailingBatchRepository({"a": meta})
+    repo.engine = repo
+
+    assert await repo.get_many(["a", "bad", "missing", ""]) == {"a": meta}
+    assert repo.rollbacks == 2
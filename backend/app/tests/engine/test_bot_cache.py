@@ -0,0 +1,106 @@
+"""Тесты для кеша скомпилированных ботов."""
+from uuid import uuid4
+
+import pytest
+
+from app.engine.bot_cache import CompiledBot, CompiledBotCache
+
+BOT_ID = "11111111-1111-1111-1111-111111111111"
+STEP_ID = "22222222-2222-2222-2222-222222222222"
+GROUP_ID = "33333333-3333-3333-3333-333333333333"
+
+
+def make_bot_row(step_name: str = "start") -> dict:
+    return {
+        "id": BOT_ID,
+        "cache_structure": {
+            "id": BOT_ID,
+            "name": "bot",
+            "first_step_id": STEP_ID,
+            "steps": [{
+                "id": STEP_ID,
+                "name": step_name,
+                "is_proxy": False,
+                "bot_id": BOT_ID,
+                "connection_groups": [{"id": GROUP_ID, "search_type": "message"}],
+            }],
+        },
+    }
+
+
+class FakeDataManager:
+    """Минимальная замена DataManager с версией структуры бота."""
+
+    def __init__(self):
+        self.bot = make_bot_row()
+        self.version = None
+        self.get_bot_calls = 0
+
+    async def get_bot_version(self, bot_id: str):
+        return self.version
+
+    async def ensure_bot_version(self, bot_id: str):
+        if self.version is not None:
+            return None
+        self.version = uuid4().hex
+        return self.version
+
+    async def get_bot(self, bot_id: str) -> dict:
+        self.get_bot_calls += 1
+        return self.bot
+
+    def publish(self, bot: dict):
+        self.bot = bot
+        self.version = uuid4().hex
+
+
+def test_compiled_bot_indexes():
+    """Тест индексов шагов и групп связей."""
+    compiled = CompiledBot.from_row(make_bot_row(), "v1")
+
+    assert compiled.get_step(STEP_ID).name == "start"
+    assert compiled.get_connection_group(GROUP_ID) is not None
+    assert compiled.get_step("missing") is None
+
+
+def test_compiled_bot_requires_cache_structure():
+    """Тест ошибки при отсутствии cache_structure."""
+    with pytest.raises(ValueError):
+        CompiledBot.from_row({"id": BOT_ID}, "v1")
+
+
+@pytest.mark.asyncio
+async def test_cache_reuses_compiled_bot():
+    """Тест повторного использования бота при неизменной версии."""
+    cache = CompiledBotCache()
+    data_manager = FakeDataManager()
+
+    first = await cache.get(data_manager, BOT_ID)
+    second = await cache.get(data_manager, BOT_ID)
+
+    assert first is second
+    assert data_manager.get_bot_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_recompiles_on_new_version():
+    """Тест инвалидации при повторной публикации структуры."""
+    cache = CompiledBotCache()
+    data_manager = FakeDataManager()
+
+    first = await cache.get(data_manager, BOT_ID)
+    data_manager.publish(make_bot_row(step_name="renamed"))
+    second = await cache.get(data_manager, BOT_ID)
+
+    assert first is not second
+    assert second.get_step(STEP_ID).name == "renamed"
+
+
+@pytest.mark.asyncio
+async def test_cache_returns_none_for_missing_bot():
+    """Тест отсутствующего бота."""
+    cache = CompiledBotCache()
+    data_manager = FakeDataManager()
+    data_manager.bot = {}
+
+    assert await cache.get(data_manager, BOT_ID) is None
@@ -0,0 +1,139 @@
+"""Тесты для исполнения кода шагов."""
+import json
+
+import pytest
+
+from app.engine import code_executor
+from app.engine.code_executor import CodeExecutor, ProcessCodeExecutor, compile_code, snapshot
+from app.loggers.bot import NoopBotLogger
+
+CODE = """
+async def main(context, variables):
+    await print("hello", variables["user"]["name"])
+    variables["user"]["name"] = "Bob"
+    variables["user"]["tags"].append("new")
+    return {"total": sum(context["values"]), "user": variables["user"]}
+"""
+
+
+class RecordingLogger(NoopBotLogger):
+    def __init__(self):
+        super().__init__()
+        self.printed = []
+        self.errors = []
+
+    async def print(self, *args, sep=' ', end='\n'):
+        self.printed.append(sep.join(str(arg) for arg in args))
+
+    async def error(self, message: str):
+        self.errors.append(message)
+
+
+def test_compile_code_is_cached():
+    """Тест повторного использования скомпилированного кода."""
+    assert compile_code(CODE) is compile_code(CODE)
+
+
+def test_snapshot_copies_only_on_access():
+    """Тест: изменения снимка не затрагивают исходные переменные."""
+    variables = {"user": {"name": "Ann", "tags": [{"id": 1}]}, "bot": {"counter": 1}}
+    copy = snapshot(variables)
+
+    copy["user"]["tags"][0]["id"] = 2
+    for item in copy["user"]["tags"]:
+        item["extra"] = True
+    merged = {**copy}
+    merged["bot"]["counter"] = 5
+
+    assert variables == {"user": {"name": "Ann", "tags": [{"id": 1}]}, "bot": {"counter": 1}}
+    assert json.loads(json.dumps(copy))["user"]["tags"] == [{"id": 2, "extra": True}]
+
+
+@pytest.mark.asyncio
+async def test_inline_executor_keeps_variables_intact():
+    """Тест исполнения кода в event loop без изменения исходных переменных."""
+    logger = RecordingLogger()
+    variables = {"user": {"name": "Ann", "tags": []}}
+
+    result = await CodeExecutor(logger).execute(CODE, {"values": [1, 2]}, variables)
+
+    assert result == {"total": 3, "user": {"name": "Bob", "tags": ["new"]}}
+    assert variables == {"user": {"name": "Ann", "tags": []}}
+    assert logger.printed == ["hello Ann"]
+
+
+@pytest.fixture
+def process_pool(monkeypatch):
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_WORKERS", 1)
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_CPU_LIMIT", 1)
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_TIMEOUT", 20)
+    yield
+    ProcessCodeExecutor.reset_pool()
+
+
+@pytest.mark.asyncio
+async def test_process_executor_runs_code_and_replays_print(process_pool):
+    """Тест исполнения кода в пуле процессов."""
+    logger = RecordingLogger()
+
+    result = await ProcessCodeExecutor(logger).execute(CODE, {"values": [1, 2]}, {"user": {"name": "Ann", "tags": []}})
+
+    assert result == {"total": 3, "user": {"name": "Bob", "tags": ["new"]}}
+    assert logger.printed == ["hello Ann"]
+
+
+@pytest.mark.asyncio
+async def test_process_executor_stops_endless_loop(process_pool):
+    """Тест прерывания зацикленного кода по лимиту CPU."""
+    logger = RecordingLogger()
+    code = "async def main(context, variables):\n    while True:\n        pass\n"
+
+    result = await ProcessCodeExecutor(logger).execute(code, {"values": []}, {})
+
+    assert result == {"values": []}
+    assert "CPU time limit exceeded" in logger.errors[0]
+
+
+@pytest.mark.asyncio
+async def test_process_executor_timeout_stops_only_its_job(process_pool, monkeypatch):
+    """Тест: таймаут прерывает задачу сигналом, воркер и пул продолжают работу."""
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_CPU_LIMIT", 0)
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_TIMEOUT", 0.5)
+    logger = RecordingLogger()
+    executor = ProcessCodeExecutor(logger)
+    pool = ProcessCodeExecutor.get_pool()
+
+    result = await executor.execute("async def main(context, variables):\n    while True:\n        pass\n",
+                                    {"values": []}, {})
+
+    assert result == {"values": []}
+    assert "timed out" in logger.errors[0]
+    assert ProcessCodeExecutor._pool is pool
+    assert await executor.execute(CODE, {"values": [1]}, {"user": {"name": "Ann", "tags": []}}) == \
+        {"total": 1, "user": {"name": "Bob", "tags": ["new"]}}
+
+
+@pytest.mark.asyncio
+async def test_process_executor_memory_limit_counts_from_worker_size(process_pool, monkeypatch):
+    """Тест: лимит памяти отсчитывается от размера воркера, а не от нуля."""
+    monkeypatch.setattr(code_executor.settings, "CODE_EXECUTOR_MEMORY_LIMIT_MB", 64)
+    logger = RecordingLogger()
+    code = "async def main(context, variables):\n    return len(bytes(context['size']))\n"
+
+    # Воркер сам по себе больше 64 МБ, но небольшой буфер код шага выделить может
+    assert await ProcessCodeExecutor(logger).execute(code, {"size": 16 * 1024 * 1024}, {}) == 16 * 1024 * 1024
+    result = await ProcessCodeExecutor(logger).execute(code, {"size": 512 * 1024 * 1024}, {})
+
+    assert result == {"size": 512 * 1024 * 1024}
+    assert "MemoryError" in logger.errors[0]
+
+
+def test_reset_pool_ignores_stale_pool(process_pool):
+    """Тест: повторный сброс уже замененного пула не закрывает новый."""
+    stale = ProcessCodeExecutor.get_pool()
+    ProcessCodeExecutor.reset_pool(stale)
+    current = ProcessCodeExecutor.get_pool()
+
+    ProcessCodeExecutor.reset_pool(stale)
+
+    assert ProcessCodeExecutor._pool is current
@@ -0,0 +1,90 @@
+"""Тесты для пакетной загрузки переменных и кеша DataManager."""
+import json
+
+import pytest
+
+from app.managers.data_manager import DataManager, QueryProvider
+from app.managers.local_cache import INVALIDATION_CHANNEL, LocalCache
+from app.tests.engine.fakes import FakeRedis
+
+
+def test_variables_batch_query_merges_scopes():
+    """Тест объединения запросов пространств имен в один UNION ALL."""
+    query, params = QueryProvider.get_variables_batch_query({
+        "bot": QueryProvider.get_bot_variables_query("bot-1"),
+        "session": QueryProvider.get_session_variables_query("session-1"),
+    })
+
+    assert query.count("UNION ALL") == 1
+    assert "SELECT 'bot' AS scope" in query
+    assert "SELECT 'session' AS scope" in query
+    assert params == {"bot_id": "bot-1", "session_id": "session-1"}
+
+
+def test_compose_all_variables_defaults_for_missing_rows():
+    """Тест сборки переменных при отсутствии строк в БД."""
+    all_variables = DataManager._compose_all_variables(
+        {"bot": {"data": {"counter": 1}, "id": "bot-1", "name": "Bot", "description": None},
+         "channel": {}, "session": {}, "user": {}},
+        user_id="user-1", bot_id="bot-1", channel_id="channel-1",
+    )
+
+    assert all_variables["bot"]["counter"] == 1
+    assert all_variables["bot"]["name"] == "Bot"
+    assert all_variables["channel"] == {"id": "channel-1", "name": ""}
+    assert all_variables["session"] == {}
+    assert all_variables["user"] == {"id": "user-1", "type": "user"}
+
+
+def make_data_manager(redis: FakeRedis) -> DataManager:
+    l1_cache = LocalCache()
+    # Подписку на инвалидации в тестах не поднимаем, считаем её активной
+    l1_cache.ensure_listener = lambda redis: None
+    l1_cache._listening = True
+    return DataManager(redis, engine=None, l1_cache=l1_cache)
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_serves_config_from_l1():
+    """Тест чтения редко меняющихся объектов из памяти процесса."""
+    redis = FakeRedis({"channel:c1": json.dumps({"id": "c1"})})
+    data_manager = make_data_manager(redis)
+
+    first = await data_manager.get_channel("c1")
+    first["id"] = "mutated"
+    second = await data_manager.get_channel("c1")
+
+    assert second == {"id": "c1"}
+    assert redis.gets == 1
+    assert data_manager.l1_cache.stats()["hits"] == {"channel": 1}
+
+
+@pytest.mark.asyncio
+async def test_update_cache_broadcasts_invalidation():
+    """Тест сброса L1 и рассылки инвалидации при обновлении подписчиков."""
+    redis = FakeRedis({"channel:c1:subscribers": json.dumps([{"id": "b1"}])})
+    data_manager = make_data_manager(redis)
+    await data_manager.get_channel_subscribers("c1")
+
+    await data_manager.update_channel_subscribers("c1", [{"id": "b2"}])
+
+    assert await data_manager.get_channel_subscribers("c1") == [{"id": "b2"}]
+    assert redis.published == [(INVALIDATION_CHANNEL, "channel:c1:subscribers")]
+
+
+def test_l1_skips_mutable_keys_and_stale_writes():
+    """Тест: переменные не кешируются в L1, запись после инвалидации отбрасывается."""
+    l1_cache = LocalCache(maxsize=1)
+    l1_cache._listening = True
+
+    l1_cache.set("variables:session:s1", "{}")
+    token = l1_cache.token()
+    l1_cache.invalidate("bot:b1")
+    l1_cache.set("bot:b1", "{}", token)
+    l1_cache.set("bot:b2", "{}")
+    l1_cache.set("bot:b3", "{}")
+
+    assert l1_cache.get("variables:session:s1") is None
+    assert l1_cache.get("bot:b1") is None
+    assert l1_cache.get("bot:b2") is None
+    assert l1_cache.get("bot:b3") == "{}"
@@ -0,0 +1,133 @@
+"""Тесты массовой отправки сообщений эмиттеров."""
+from uuid import uuid4
+
+import pytest
+
+from app.config import settings
+from app.managers.local_cache import INVALIDATION_CHANNEL, local_cache
+from app.services import emitter_service
+from app.services.emitter_service import SQL_LOAD_BOT_CHANNELS, SQL_LOAD_TEMPLATES, EmitterBroadcaster
+from app.tests.engine.fakes import FakeEngine, FakeRedis
+
+CHANNEL_ID, OTHER_CHANNEL_ID = str(uuid4()), str(uuid4())
+MESSAGE_ID, BOT_ID, STRANGER_ID = str(uuid4()), str(uuid4()), str(uuid4())
+
+
+def load(statement, params):
+    if statement == SQL_LOAD_TEMPLATES:
+        return [{"id": MESSAGE_ID, "text": "Доброе утро", "params": {"a": 1},
+                 "channel_id": CHANNEL_ID, "recipient_id": None, "widget_id": None, "widget": None}]
+    assert statement == SQL_LOAD_BOT_CHANNELS
+    rows = [{"subscriber_id": BOT_ID, "channel_id": CHANNEL_ID},
+            {"subscriber_id": STRANGER_ID, "channel_id": OTHER_CHANNEL_ID}]
+    return [row for row in rows if row["subscriber_id"] in params["ids"]]
+
+
+class FakeBroker:
+    def __init__(self):
+        self.redis = FakeRedis()
+        self.pipe = self.redis.pipeline()
+        self.published = []
+
+    async def connect(self):
+        return self
+
+    def pipeline(self, transaction=True):
+        return self.pipe
+
+    async def publish(self, message, channel=None, *, stream=None, pipeline=None):
+        assert pipeline is self.pipe
+        self.published.append((channel or stream, message))
+
+
+@pytest.fixture(autouse=True)
+def invalidations_active(monkeypatch):
+    monkeypatch.setattr(local_cache, "_listening", True)
+
+
+@pytest.fixture
+def fake_broker(monkeypatch):
+    broker = FakeBroker()
+    monkeypatch.setattr(emitter_service, "broker", broker)
+    return broker
+
+
+@pytest.fixture
+def inserted(monkeypatch):
+    batches = []
+
+    async def insert_many(self, rows):
+        batches.append(rows)
+        return [{**row, "sender": {"id": row["sender_id"], "type": "bot", "name": "bot"}, "recipient": None}
+                for row in reversed(rows)]
+
+    monkeypatch.setattr(emitter_service.MessageManager, "insert_many", insert_many)
+    return batches
+
+
+@pytest.mark.asyncio
+async def test_batch_is_one_insert_and_one_pipeline(fake_broker, inserted):
+    engine = FakeEngine(load)
+    broadcaster = EmitterBroadcaster(engine=engine)
+    jobs = [
+        {"message_id": MESSAGE_ID, "bot_id": BOT_ID, "needs_message_processing": True},
+        {"message_id": MESSAGE_ID, "bot_id": BOT_ID, "needs_message_processing": False},
+        # Бот не состоит в канале сообщения
+        {"message_id": MESSAGE_ID, "bot_id": STRANGER_ID, "needs_message_processing": True},
+    ]
+
+    new_messages = await broadcaster.send(jobs)
+
+    assert len(new_messages) == 2
+    assert len(inserted) == 1 and len(inserted[0]) == 2
+    assert {row["sender_id"] for row in inserted[0]} == {BOT_ID}
+    assert len(fake_broker.redis.executed) == 1
+
+    targets = [target for target, _ in fake_broker.published]
+    assert targets.count("message_queue") == 2
+    assert targets.count(settings.BOT_STREAM_NAME) == 1
+    # В стрим ботов уходит копия, которой требуется обработка, в формате MessageModel.get_dict()
+    processed_id = inserted[0][0]["id"]
+    stream_payload = next(message for target, message in fake_broker.published if target == settings.BOT_STREAM_NAME)
+    assert stream_payload["channel_id"] == CHANNEL_ID
+    assert stream_payload["message"]["message"]["id"] == processed_id
+    assert stream_payload["message"]["message"]["attachments"] == []
+
+    # Повторный запуск берет сообщение и каналы ботов из кеша
+    await broadcaster.send(jobs[:1])
+    assert len(engine.executed) == 2
+
+    # Сброс, присланный другим процессом через канал инвалидаций
+    broadcaster._on_invalidate(f"emitter:message:{MESSAGE_ID}")
+    await broadcaster.send(jobs[:1])
+    assert engine.queries[2:] == [SQL_LOAD_TEMPLATES]
+
+    broadcaster._on_invalidate(f"emitter:bot:{BOT_ID}")
+    broadcaster._on_invalidate("emitter:message:")
+    await broadcaster.send(jobs[:1])
+    assert engine.queries[3:] == [SQL_LOAD_TEMPLATES, SQL_LOAD_BOT_CHANNELS]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_published_and_cache_off_without_listener(fake_broker, inserted, monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr("app.redis_pool.cache_redis", lambda: redis)
+    await emitter_service.invalidate_emitter_cache(message_id=MESSAGE_ID, bot_id=BOT_ID)
+    assert redis.published == [(INVALIDATION_CHANNEL, f"emitter:message:{MESSAGE_ID}"),
+                               (INVALIDATION_CHANNEL, f"emitter:bot:{BOT_ID}")]
+
+    monkeypatch.setattr(local_cache, "_listening", False)
+    engine = FakeEngine(load)
+    broadcaster = EmitterBroadcaster(engine=engine)
+    job = {"message_id": MESSAGE_ID, "bot_id": BOT_ID}
+    await broadcaster.send([job])
+    await broadcaster.send([job])
+    assert len(engine.executed) == 4
+
+
+@pytest.mark.asyncio
+async def test_nothing_to_send(fake_broker, inserted):
+    broadcaster = EmitterBroadcaster(engine=FakeEngine(load))
+    assert await broadcaster.send([{"message_id": None, "bot_id": BOT_ID}]) == []
+    assert inserted == []
+    assert fake_broker.published == []
@@ -0,0 +1,95 @@
+"""Тесты для параллельной обработки сообщения ботами-подписчиками."""
+import asyncio
+
+import pytest
+
+from app.engine import bot_processor
+
+
+class FakeBotCache:
+    async def get(self, data_manager, bot_id):
+        return bot_id
+
+
+def make_processor(behaviour: dict, started: list, active: list):
+    active_peak = []
+
+    class FakeProcessor:
+        def __init__(self, sender_id, bot, channel, message, data_manager):
+            self.bot_id = bot
+
+        async def run(self):
+            started.append(self.bot_id)
+            active.append(self.bot_id)
+            active_peak.append(len(active))
+            try:
+                action = behaviour.get(self.bot_id)
+                if action == "fail":
+                    raise RuntimeError("boom")
+                await asyncio.sleep(1 if action == "hang" else 0.01)
+            finally:
+                active.remove(self.bot_id)
+
+    FakeProcessor.active_peak = active_peak
+    return FakeProcessor
+
+
+@pytest.fixture
+def fake_run(monkeypatch):
+    def setup(behaviour=None, concurrency=2, timeout=0.1):
+        started, active = [], []
+        processor = make_processor(behaviour or {}, started, active)
+        monkeypatch.setattr(bot_processor, "compiled_bot_cache", FakeBotCache())
+        monkeypatch.setattr(bot_processor, "MessageProcessor", processor)
+        monkeypatch.setattr(bot_processor.settings, "BOT_FANOUT_CONCURRENCY", concurrency)
+        monkeypatch.setattr(bot_processor.settings, "BOT_RUN_TIMEOUT", timeout)
+        return started, processor.active_peak
+    return setup
+
+
+@pytest.mark.asyncio
+async def test_subscribers_run_with_concurrency_limit(fake_run):
+    """Тест ограничения числа одновременно работающих ботов."""
+    started, peak = fake_run(concurrency=2)
+
+    await bot_processor._run_subscribers(None, ["a", "b", "c", "d"], "user", {}, {"message": {}})
+
+    assert sorted(started) == ["a", "b", "c", "d"]
+    assert max(peak) == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_and_hanging_bots_are_isolated(fake_run):
+    """Тест изоляции ошибки и таймаута одного бота от остальных."""
+    started, _ = fake_run({"a": "fail", "b": "hang"}, concurrency=3, timeout=0.05)
+
+    await bot_processor._run_subscribers(None, ["a", "b", "c"], "user", {}, {"message": {}})
+
+    assert sorted(started) == ["a", "b", "c"]
+    assert await bot_processor._run_bot(None, "a", "user", {}, {}) is False
+    assert await bot_processor._run_bot(None, "b", "user", {}, {}) is False
+    assert await bot_processor._run_bot(None, "c", "user", {}, {}) is True
+
+
+@pytest.mark.asyncio
+async def test_default_bot_failure_is_raised(fake_run, monkeypatch):
+    """Тест: сбой и таймаут бота по умолчанию и адресата не подтверждают запись стрима."""
+    started, _ = fake_run({"default": "fail", "recipient": "hang"}, timeout=0.05)
+
+    class FakeDataManager:
+        def __init__(self, redis, engine):
+            pass
+
+        async def get_channel(self, channel_id):
+            return {"id": channel_id, "default_bot_id": "default"}
+
+        async def get_channel_subscribers(self, channel_id):
+            return [{"id": "subscriber"}]
+
+    monkeypatch.setattr(bot_processor, "DataManager", FakeDataManager)
+
+    with pytest.raises(RuntimeError):
+        await bot_processor.check_message({"message": {"sender_id": "user"}}, "channel")
+    with pytest.raises(asyncio.TimeoutError):
+        await bot_processor.check_message({"message": {"sender_id": "user", "recipient_id": "recipient"}}, "channel")
+    assert started == ["default", "recipient"]
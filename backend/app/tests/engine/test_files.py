@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from app.engine.files import CSVFileCreator, ExcelFileCreator, JSONFileCreator, iterate_in_thread
+from app.services.attachment_service import AttachmentMeta, AttachmentService
+from app.services.media_service import media_resolver
+from app.services.s3_storage_service import S3StorageService
+
+ROWS = [{"name": f"user {i}", "note": "a" if i == 1 else "", "n": i} for i in range(3)]
+
+
+def test_csv_stream_matches_create_and_keeps_format():
+    creator = CSVFileCreator()
+    body = b"".join(creator.stream(ROWS))
+    assert body == creator.create(ROWS).getvalue()
+    assert body.decode().splitlines() == ["name,note,n", "user 0,,0", "user 1,a,1", "user 2,,2"]
+    assert creator.create([{"a": None, "b": "x"}]).getvalue() == b"a,b\nNone,x\n"
+
+
+def test_json_stream_is_chunked():
+    rows = [{"text": "ы" * 100}] * 2000
+    chunks = list(JSONFileCreator().stream(rows))
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == rows
+
+
+def test_excel_write_only_roundtrip():
+    ws = load_workbook(io.BytesIO(b"".join(ExcelFileCreator().stream(ROWS)))).active
+    assert [list(row) for row in ws.iter_rows(values_only=True)][:2] == [["name", "note", "n"], ["user 0", None, 0]]
+
+
+class FakeS3:
+    def __init__(self):
+        self.calls = []
+
+    async def put_object(self, **kwargs):
+        self.calls.append(("put", len(kwargs["Body"])))
+
+    async def create_multipart_upload(self, **kwargs):
+        self.calls.append(("create", kwargs.get("ContentType")))
+        return {"UploadId": "u1"}
+
+    async def upload_part(self, **kwargs):
+        self.calls.append(("part", kwargs["PartNumber"], len(kwargs["Body"])))
+        return {"ETag": f"e{kwargs['PartNumber']}"}
+
+    async def complete_multipart_upload(self, **kwargs):
+        self.calls.append(("complete", kwargs["MultipartUpload"]["Parts"]))
+
+
+class FakePool:
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self):
+        return self.client
+
+
+async def chunks(count, size=1024 * 1024):
+    for _ in range(count):
+        yield b"x" * size
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_uses_multipart_for_large_files():
+    s3 = FakeS3()
+    storage = S3StorageService(FakePool(s3))
+
+    assert await storage.upload_stream("k", chunks(12), "text/csv", part_size=5 * 1024 * 1024) == 12 * 1024 * 1024
+    assert s3.calls == [
+        ("create", "text/csv"),
+        ("part", 1, 5 * 1024 * 1024),
+        ("part", 2, 5 * 1024 * 1024),
+        ("part", 3, 2 * 1024 * 1024),
+        ("complete", [{"ETag": "e1", "PartNumber": 1}, {"ETag": "e2", "PartNumber": 2},
+                      {"ETag": "e3", "PartNumber": 3}]),
+    ]
+
+    s3.calls.clear()
+    await storage.upload_stream("k", chunks(2), part_size=5 * 1024 * 1024)
+    assert s3.calls == [("put", 2 * 1024 * 1024)]
+
+
+class BytesOnlyStorage:
+    def __init__(self):
+        self.data = {}
+
+    async def upload(self, key, data, content_type=None):
+        self.data[key] = data
+
+
+class FakeRepo:
+    async def create(self, content_type, key, message_id=None):
+        return AttachmentMeta(id="1", content_type=content_type, key=key)
+
+
+@pytest.mark.asyncio
+async def test_create_from_stream_falls_back_to_upload(monkeypatch):
+    storage = BytesOnlyStorage()
+    service = AttachmentService(storage, FakeRepo())
+    invalidated = []
+
+    async def invalidate(file_name=None, key=None):
+        invalidated.append((file_name, key))
+
+    monkeypatch.setattr(media_resolver, "invalidate", invalidate)
+
+    meta = await service.create_from_stream(iterate_in_thread(CSVFileCreator().stream(ROWS)), "dump.csv", "text/csv")
+
+    assert meta.size == len(storage.data[meta.key])
+    assert storage.data[meta.key].startswith(b"name,note,n\n")
+    # Ссылка /media на новое вложение не должна отдавать 404 из кеша
+    assert invalidated == [(meta.file_name, meta.key)]
@@ -0,0 +1,100 @@
+import httpx
+import pytest
+
+from app.engine.request import HttpClientRegistry, ResponseTooLarge
+
+
+class MockRegistry(HttpClientRegistry):
+    def __init__(self, handler, **kwargs):
+        super().__init__(retry_backoff=0, **kwargs)
+        self.handler = handler
+        self.built = 0
+
+    def _build(self, proxy, verify):
+        self.built += 1
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+@pytest.mark.asyncio
+async def test_client_reused_per_settings():
+    registry = MockRegistry(lambda request: httpx.Response(200, json={}))
+
+    assert registry.get() is registry.get()
+    assert registry.get("http://proxy:3128") is not registry.get()
+    assert registry.built == 2
+
+    await registry.aclose()
+    assert registry.get() is not None
+    assert registry.built == 3
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_idempotent_request_retried_on_503():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503 if len(calls) < 3 else 200, json={"ok": True})
+
+    registry = MockRegistry(handler, retries=2)
+    response = await registry.request("GET", "http://api.test/items")
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert len(calls) == 3
+
+    calls.clear()
+    response = await registry.request("POST", "http://api.test/items", json={})
+    assert response.status_code == 503
+    assert len(calls) == 1
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_retry_after_capped():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path == "/slow":
+            return httpx.Response(429, headers={"Retry-After": "3600"})
+        return httpx.Response(429 if len(calls) == 1 else 200, headers={"Retry-After": "0"})
+
+    registry = MockRegistry(handler, retries=2, retry_after_max=1)
+    assert (await registry.request("GET", "http://api.test/fast")).status_code == 200
+    assert len(calls) == 2
+
+    calls.clear()
+    response = await registry.request("GET", "http://api.test/slow")
+    assert response.status_code == 429
+    assert len(calls) == 1
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_connect_error_retried_for_any_method():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={})
+
+    registry = MockRegistry(handler, retries=1)
+    response = await registry.request("POST", "http://api.test/items", json={})
+    assert response.status_code == 200
+    assert len(calls) == 2
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_response_body_capped():
+    registry = MockRegistry(lambda request: httpx.Response(200, content=b"x" * 100), max_response_bytes=50)
+
+    with pytest.raises(ResponseTooLarge):
+        await registry.request("GET", "http://api.test/big")
+
+    response = await registry.request("GET", "http://api.test/big", max_bytes=0)
+    assert len(response.content) == 100
+    await registry.aclose()
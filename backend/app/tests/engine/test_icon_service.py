@@ -0,0 +1,117 @@
+"""Тесты кеша presigned URL иконок и ETag каталога."""
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.services.icon_service import IconService
+from app.utils.etag import EtagCache, etag_matches, etag_response, make_etag
+
+
+class FakeStorage:
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.heads = 0
+        self.presigns = 0
+
+    async def head(self, key):
+        self.heads += 1
+        await asyncio.sleep(0)
+        return {"key": key} if key in self.keys else None
+
+    async def presigned_get_url(self, key, expires_in=3600):
+        self.presigns += 1
+        return f"https://s3.example/{key}?v={self.presigns}"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(IconService, "_now", staticmethod(clock))
+    return clock
+
+
+@pytest.mark.asyncio
+async def test_icon_url_cached_and_singleflight(clock):
+    storage = FakeStorage({"icons/a.svg"})
+    service = IconService(storage=storage)
+
+    urls = await asyncio.gather(*(service.get_icon_url("icons/a.svg") for _ in range(10)))
+    assert set(urls) == {"https://s3.example/icons/a.svg?v=1"}
+    assert await service.get_icon_url("icons/a.svg") == urls[0]
+    assert (storage.heads, storage.presigns) == (1, 1)
+
+    # Отсутствующая иконка — заглушка, тоже из кеша
+    assert await service.get_icon_url("icons/none.svg") == service.default_icon_url
+    assert await service.get_icon_url("icons/none.svg") == service.default_icon_url
+    assert storage.heads == 2
+
+
+@pytest.mark.asyncio
+async def test_icon_url_refreshed_before_expiry(clock):
+    storage = FakeStorage({"icons/a.svg"})
+    service = IconService(storage=storage, refresh_before=300)
+    first = await service.get_icon_url("icons/a.svg")
+
+    # В окне обновления отдаем старый URL и обновляем в фоне
+    clock.now += 3600 - 200
+    assert await service.get_icon_url("icons/a.svg") == first
+    await asyncio.sleep(0.01)
+    assert await service.get_icon_url("icons/a.svg") == "https://s3.example/icons/a.svg?v=2"
+
+    # Загрузка новой иконки сбрасывает кеш
+    service.invalidate("icons/a.svg")
+    assert await service.get_icon_url("icons/a.svg") == "https://s3.example/icons/a.svg?v=3"
+
+
+class Catalog(BaseModel):
+    items: list[str]
+
+
+def test_etag_cache_and_not_modified():
+    builds = []
+    cache = EtagCache(ttl=60)
+
+    async def build():
+        builds.append(1)
+        return Catalog(items=["a", "b"])
+
+    app = FastAPI()
+
+    @app.get("/catalog")
+    async def catalog(request: Request):
+        body, etag = await cache.get("all", build)
+        return etag_response(request, body, etag)
+
+    client = TestClient(app)
+    response = client.get("/catalog")
+    assert response.status_code == 200
+    assert response.json() == {"items": ["a", "b"]}
+    etag = response.headers["etag"]
+
+    response = client.get("/catalog", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert len(builds) == 1
+
+    assert etag_matches(f'W/{etag}, "other"', etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_etag_changes_with_reissued_icon_url():
+    def body(signature):
+        url = f"https://s3.test/bucket/icons/a.png?X-Amz-Expires=3600&X-Amz-Signature={signature}"
+        return Catalog(items=[url]).model_dump_json().encode()
+
+    # Клиент с закешированным каталогом должен получить новые ссылки, а не 304 со старыми
+    assert make_etag(body("aaa")) != make_etag(body("bbb"))
@@ -0,0 +1,149 @@
+"""Тесты отдачи /media: поиск ключа по индексу, кеш, Range и условный GET."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.routes import media
+from app.managers.local_cache import INVALIDATION_CHANNEL
+from app.services.media_service import SQL_RESOLVE_KEY, MediaResolver, is_not_modified, parse_range
+from app.tests.engine.fakes import FakeEngine, FakeRedis
+
+BODY = bytes(range(256)) * 4
+META = {"key": "attachment/2025/09/17/abc.bin", "size": len(BODY), "content_type": "application/octet-stream",
+        "etag": '"e1"', "last_modified": "Wed, 17 Sep 2025 10:00:00 GMT"}
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    # Несколько диапазонов и мусор — отдаем целиком
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    assert parse_range("bytes=a-b", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_is_not_modified():
+    assert is_not_modified(META, '"e1"', None)
+    assert is_not_modified(META, 'W/"e1", "e2"', None)
+    assert not is_not_modified(META, '"e2"', "Thu, 18 Sep 2025 10:00:00 GMT")
+    assert is_not_modified(META, None, "Thu, 18 Sep 2025 10:00:00 GMT")
+    assert not is_not_modified(META, None, "Tue, 16 Sep 2025 10:00:00 GMT")
+
+
+class KeyIndex(FakeEngine):
+    """Индекс attachment: имя файла -> ключ объекта."""
+
+    def __init__(self, keys):
+        super().__init__(self.resolve_key)
+        self.keys = keys
+
+    def resolve_key(self, statement, params):
+        assert statement == SQL_RESOLVE_KEY
+        key = self.keys.get(params["file_name"])
+        return [] if key is None else [{"key": key}]
+
+
+class FakeStorage:
+    def __init__(self, objects):
+        self.objects = objects
+        self.heads = []
+
+    async def head(self, key):
+        self.heads.append(key)
+        return {**META, "key": key, "size": len(self.objects[key])} if key in self.objects else None
+
+    async def iter_object(self, key, byte_range=None, chunk_size=64 * 1024):
+        data = self.objects[key]
+        if byte_range is not None:
+            data = data[byte_range[0]:byte_range[1] + 1]
+        for i in range(0, len(data), 100):
+            yield data[i:i + 100]
+
+
+@pytest.mark.asyncio
+async def test_resolver_uses_index_and_caches():
+    engine = KeyIndex({"abc.bin": META["key"]})
+    storage = FakeStorage({META["key"]: BODY, "attachment/legacy.bin": b"x"})
+    resolver = MediaResolver(storage, engine=engine)
+
+    assert (await resolver.by_name("abc.bin"))["key"] == META["key"]
+    assert (await resolver.by_name("abc.bin"))["key"] == META["key"]
+    assert (await resolver.by_name("legacy.bin"))["key"] == "attachment/legacy.bin"
+    assert await resolver.by_name("missing.bin") is None
+    assert await resolver.by_name("missing.bin") is None
+
+    # Один запрос и один HEAD на имя, включая отсутствующее
+    assert len(engine.executed) == 3
+    assert storage.heads == [META["key"], "attachment/legacy.bin", "attachment/missing.bin"]
+
+
+@pytest.mark.asyncio
+async def test_new_attachment_clears_cached_404():
+    engine = KeyIndex({})
+    storage = FakeStorage({})
+    redis = FakeRedis()
+    resolver = MediaResolver(storage, engine=engine, redis=redis)
+    assert await resolver.by_name("new.bin") is None
+
+    engine.keys["new.bin"] = META["key"]
+    storage.objects[META["key"]] = BODY
+    await resolver.invalidate(file_name="new.bin", key=META["key"])
+
+    assert redis.published == [(INVALIDATION_CHANNEL, "media:object:name:new.bin"),
+                               (INVALIDATION_CHANNEL, "media:object:key:" + META["key"])]
+    assert not redis.data
+    assert (await resolver.by_name("new.bin"))["key"] == META["key"]
+
+    # Другой процесс сбрасывает L1 по сообщению канала инвалидаций
+    resolver._forget("media:object:name:new.bin")
+    assert "name:new.bin" not in resolver._entries
+
+
+@pytest.fixture
+def client(monkeypatch):
+    resolver = MediaResolver(FakeStorage({META["key"]: BODY}), engine=KeyIndex({"abc.bin": META["key"]}))
+    monkeypatch.setattr(media, "media_resolver", resolver)
+    app = FastAPI()
+    app.include_router(media.router, prefix="/media")
+    return TestClient(app)
+
+
+def test_full_and_range_responses(client):
+    response = client.get("/media/attachment/abc.bin")
+    assert response.status_code == 200
+    assert response.content == BODY
+    assert response.headers["etag"] == '"e1"'
+    assert response.headers["accept-ranges"] == "bytes"
+
+    response = client.get("/media/attachment/abc.bin", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == BODY[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(BODY)}"
+
+    response = client.get("/media/attachment/abc.bin", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+
+    # If-Range другой версии — целиком
+    response = client.get("/media/attachment/abc.bin", headers={"Range": "bytes=0-0", "If-Range": '"old"'})
+    assert response.status_code == 200
+
+
+def test_conditional_get_and_redirect(client, monkeypatch):
+    response = client.get(f"/media/{META['key']}", headers={"If-None-Match": '"e1"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    async def presign(key, expires_in=3600):
+        return f"https://s3.example/{key}?sig=1"
+
+    import app.services.s3_service as s3_service
+    monkeypatch.setattr(s3_service, "generate_presigned_get_url", presign)
+    monkeypatch.setattr(media.settings, "MEDIA_PRESIGNED_REDIRECT", True)
+    response = client.get("/media/attachment/abc.bin", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == f"https://s3.example/{META['key']}?sig=1"
@@ -0,0 +1,39 @@
+"""Тесты пакетной вставки сообщений с профилями отправителя и получателя."""
+import json
+
+import pytest
+
+from app.managers.message_manager import MessageManager, SQL_INSERT_MANY_WITH_JOIN
+from app.tests.engine.fakes import FakeEngine
+
+
+def insert_many(statement, params):
+    rows = json.loads(params["rows"])
+    return [{**row, "sender": {"id": row["sender_id"], "type": "bot", "name": "Bot"},
+             "recipient": {"id": row["recipient_id"], "type": "anonymous_user"}} for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_insert_many_single_statement():
+    engine = FakeEngine(insert_many)
+    rows = await MessageManager(engine).insert_many([
+        {"text": "hi", "params": {"a": 1}, "sender_id": "bot", "recipient_id": "u1"},
+        {"text": "hi", "params": {"a": 1}, "sender_id": "bot", "recipient_id": "u2"},
+    ])
+
+    assert len(engine.executed) == 1
+    statement, params = engine.executed[0]
+    assert statement == SQL_INSERT_MANY_WITH_JOIN
+    assert "UNION" not in statement
+    payload = json.loads(params["rows"])
+    # params уходят объектом, а не строкой JSON
+    assert payload[0]["params"] == {"a": 1}
+    assert payload[0]["id"] != payload[1]["id"]
+    assert [row["recipient_id"] for row in rows] == ["u1", "u2"]
+
+
+@pytest.mark.asyncio
+async def test_insert_many_empty():
+    engine = FakeEngine(insert_many)
+    assert await MessageManager(engine).insert_many([]) == []
+    assert engine.executed == []
@@ -0,0 +1,108 @@
+"""Тесты метрик Prometheus на пути обработки сообщений."""
+import asyncio
+import json
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.managers.data_manager import DataManager
+from app.managers.local_cache import LocalCache
+from app.managers.websocket import WebSocketManagerBase
+from app.metrics.engine import engine_metrics
+from app.stream_consumer import StreamConsumer
+from app.tests.engine.fakes import FakeRedis, FakeWebSocket
+
+
+def sample(metric, **labels):
+    return REGISTRY.get_sample_value(metric, labels) or 0
+
+
+class MetricsTestManager(WebSocketManagerBase):
+    pass
+
+
+@pytest.mark.asyncio
+async def test_notify_records_broadcast_stats():
+    manager = MetricsTestManager()
+    labels = {"manager": "MetricsTestManager"}
+    await manager.add_connection("e1", "ok", FakeWebSocket())
+    await manager.add_connection("e1", "dead", FakeWebSocket(fail=True))
+    assert sample("websocket_active_connections", **labels) == 2
+
+    await manager.notify("e1", "hello")
+    # Отправка идет из задач-писателей соединений
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert sample("websocket_messages_sent_total", **labels) == 2
+    assert sample("websocket_messages_failed_total", **labels) == 1
+    assert sample("websocket_broadcast_duration_seconds_count", **labels) == 1
+    # Упавшее соединение удалено и больше не считается активным
+    assert sample("websocket_active_connections", **labels) == 1
+    await manager.remove_connection("e1", "ok")
+
+
+class FakeStreamRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.acked = []
+
+    async def xack(self, stream, group, *ids):
+        self.acked.extend(ids)
+
+    async def xinfo_groups(self, stream):
+        return [{"name": b"other", "pending": 100, "lag": 100},
+                {"name": b"metrics-group", "pending": 3, "lag": 7}]
+
+
+@pytest.mark.asyncio
+async def test_stream_consumer_records_batch_and_backlog():
+    async def handle(payload):
+        return True
+
+    consumer = StreamConsumer(FakeStreamRedis(), "metrics-stream", "metrics-group", "c1", handle)
+    before = sample("batch_size_sum", kind="metrics-stream")
+
+    await consumer.process([(b"1-0", {}), (b"2-0", {}), (b"3-0", {})])
+    await consumer.observe_backlog()
+
+    assert sample("batch_size_sum", kind="metrics-stream") - before == 3
+    assert sample("stream_group_pending", stream="metrics-stream", group="metrics-group") == 3
+    assert sample("stream_group_lag", stream="metrics-stream", group="metrics-group") == 7
+
+
+@pytest.mark.asyncio
+async def test_data_manager_records_cache_results_per_key_class():
+    l1_cache = LocalCache()
+    l1_cache.ensure_listener = lambda redis: None
+    l1_cache._listening = True
+    data_manager = DataManager(FakeRedis({"channel:c1": json.dumps({"id": "c1"})}), engine=None, l1_cache=l1_cache)
+    before = {
+        (layer, result): sample("cache_requests_total", key_class="channel", layer=layer, result=result)
+        for layer in ("l1", "redis") for result in ("hit", "miss")
+    }
+
+    await data_manager.get_channel("c1")
+    await data_manager.get_channel("c1")
+
+    after = {key: sample("cache_requests_total", key_class="channel", layer=key[0], result=key[1]) for key in before}
+    assert {key: after[key] - before[key] for key in before} == {
+        ("l1", "hit"): 1, ("l1", "miss"): 1, ("redis", "hit"): 1, ("redis", "miss"): 0,
+    }
+    assert sample("backend_call_duration_seconds_count", backend="redis", operation="get", status="ok") >= 1
+    assert data_manager._key_class("variables:session:s1") == "variables:session"
+
+
+@pytest.mark.asyncio
+async def test_acquire_records_semaphore_wait():
+    semaphore = asyncio.Semaphore(1)
+    before = sample("semaphore_wait_seconds_count", name="test")
+
+    async def hold():
+        async with engine_metrics.acquire(semaphore, "test"):
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(hold(), hold())
+
+    assert sample("semaphore_wait_seconds_count", name="test") - before == 2
+    assert sample("semaphore_wait_seconds_sum", name="test") >= 0.01
@@ -0,0 +1,94 @@
+"""Тесты для последовательной обработки сообщений одной сессии."""
+import asyncio
+
+import pytest
+
+from app.engine.ordering import _RENEW_SCRIPT, KeyedScheduler, session_key
+from app.tests.engine.fakes import FakeRedis
+
+
+def make_message(sender_id, channel_id="channel-1", recipient_id=None):
+    return {"channel_id": channel_id,
+            "message": {"message": {"sender_id": sender_id, "recipient_id": recipient_id}}}
+
+
+def test_session_key():
+    """Тест ключа упорядочивания по каналу и отправителю."""
+    assert session_key(make_message("user-1")) == "channel-1:user-1"
+    # Личное сообщение боту меняет ту же сессию, что и сообщение в канал
+    assert session_key(make_message("user-1", recipient_id="bot-1")) == "channel-1:user-1"
+    assert session_key(make_message("user-2")) != session_key(make_message("user-1"))
+    assert session_key({"channel_id": "init", "message": "init"}) is None
+
+
+class LockRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.renewals = []
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.data.get(key) != token:
+            return 0
+        if script == _RENEW_SCRIPT:
+            self.renewals.append((key, args[0]))
+        else:
+            del self.data[key]
+        return 1
+
+
+async def run_batch(scheduler, keys, log):
+    async def work(index, key):
+        async with scheduler.hold(key):
+            log.append(("start", key, index))
+            await asyncio.sleep(0.01)
+            log.append(("end", key, index))
+
+    await asyncio.gather(*(work(index, key) for index, key in enumerate(keys)))
+
+
+@pytest.mark.asyncio
+async def test_same_key_serialized_in_order():
+    """Тест очередности внутри ключа и параллельности между ключами."""
+    scheduler = KeyedScheduler()
+    log = []
+
+    await run_batch(scheduler, ["a", "b", "a", "a", "b"], log)
+
+    a_events = [event for event in log if event[1] == "a"]
+    assert a_events == [("start", "a", 0), ("end", "a", 0), ("start", "a", 2), ("end", "a", 2),
+                        ("start", "a", 3), ("end", "a", 3)]
+    assert log[:2] == [("start", "a", 0), ("start", "b", 1)]
+    assert not scheduler._locks
+
+
+@pytest.mark.asyncio
+async def test_remote_lock_serializes_replicas():
+    """Тест блокировки одного ключа между двумя репликами через Redis."""
+    redis = LockRedis()
+    replicas = [KeyedScheduler(redis, poll_interval=0.001), KeyedScheduler(redis, poll_interval=0.001)]
+    log = []
+
+    async def work(scheduler, index):
+        async with scheduler.hold("a"):
+            log.append(("start", index))
+            await asyncio.sleep(0.01)
+            log.append(("end", index))
+
+    await asyncio.gather(work(replicas[0], 0), work(replicas[1], 1))
+
+    assert [event[0] for event in log] == ["start", "end", "start", "end"]
+    assert not redis.data
+
+
+@pytest.mark.asyncio
+async def test_remote_lock_renewed_while_held():
+    """Тест продления блокировки, пока обработка дольше lock_ttl."""
+    redis = LockRedis()
+    scheduler = KeyedScheduler(redis, lock_ttl=0.03)
+
+    async with scheduler.hold("a"):
+        await asyncio.sleep(0.05)
+        assert redis.data["ordering:a"]
+
+    assert redis.renewals and set(redis.renewals) == {("ordering:a", 30)}
+    assert not redis.data
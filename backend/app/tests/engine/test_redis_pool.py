@@ -0,0 +1,56 @@
+"""Тесты общих пулов Redis и pipeline-инвалидации."""
+import pytest
+from redis.asyncio import BlockingConnectionPool
+
+from app.managers.data_manager import DataManager
+from app.managers.local_cache import INVALIDATION_CHANNEL, LocalCache
+from app.redis_pool import RedisPoolRegistry, delete_keys, delete_patterns
+from app.tests.engine.fakes import FakeRedis
+
+
+@pytest.mark.asyncio
+async def test_registry_reuses_client_per_redis():
+    registry = RedisPoolRegistry({"broker": "redis://broker:6379/0", "cache": "redis://cache:6389/0"},
+                                 max_connections=7)
+    cache = registry.get("cache")
+    assert registry.get("cache") is cache
+    assert registry.get("broker") is not cache
+
+    pool = cache.connection_pool
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == 7
+    assert pool.connection_kwargs["host"] == "cache"
+
+    # После close клиент остается тем же и переподключится при следующем запросе
+    await registry.close()
+    assert registry.get("cache") is cache
+
+
+@pytest.mark.asyncio
+async def test_delete_keys_single_round_trip():
+    redis = FakeRedis({f"k{i}": "v" for i in range(5)})
+    assert await delete_keys(redis, ["k0", "k1", "k1", "k2", "missing"], batch_size=2) == 3
+    assert len(redis.executed) == 1
+    assert redis.executed[0] == [("unlink", ("k0", "k1")), ("unlink", ("k2", "missing"))]
+
+    assert await delete_patterns(redis, ["k*"]) == 2
+    assert redis.data == {}
+    assert await delete_keys(redis, []) == 0
+
+
+@pytest.mark.asyncio
+async def test_data_manager_invalidate_keys_pipelined():
+    redis = FakeRedis({"variables:bot:b1": "{}", "channel:c1": "{}"})
+    l1_cache = LocalCache()
+    l1_cache.ensure_listener = lambda redis: None
+    data_manager = DataManager(redis, engine=None, l1_cache=l1_cache)
+
+    await data_manager.invalidate_keys(["variables:bot:b1", "channel:c1"])
+
+    assert redis.data == {}
+    assert len(redis.executed) == 1
+    commands = redis.executed[0]
+    assert commands[0] == ("unlink", ("variables:bot:b1", "channel:c1"))
+    # Сброс L1 рассылается только для ключей, которые живут в памяти процесса
+    assert ("publish", (INVALIDATION_CHANNEL, "channel:c1")) in commands
+    assert ("publish", (INVALIDATION_CHANNEL, "variables:bot:b1")) not in commands
@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.engine.response_cache import ResponseCache
+from app.tests.engine.fakes import FakeRedis
+
+
+def make_fetch(responses, calls, delay=0):
+    async def fetch(extra_headers):
+        calls.append(extra_headers)
+        await asyncio.sleep(delay)
+        status, headers, body = responses[min(len(calls), len(responses)) - 1]
+        return httpx.Response(status, headers=headers, content=body,
+                              request=httpx.Request("GET", "http://api.test/weather"))
+    return fetch
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_call():
+    cache = ResponseCache()
+    calls = []
+    fetch = make_fetch([(200, {}, b'{"t": 1}')], calls, delay=0.01)
+    key = cache.make_key("GET", "http://api.test/weather", {"q": "Moscow"}, "creds-1")
+
+    responses = await asyncio.gather(*(cache.get_or_fetch(key, 60, fetch) for _ in range(5)))
+
+    assert len(calls) == 1
+    assert all(r.json() == {"t": 1} for r in responses)
+    assert (await cache.get_or_fetch(key, 60, fetch)).json() == {"t": 1}
+    assert len(calls) == 1
+
+
+def test_key_depends_on_params_and_scope():
+    key = ResponseCache.make_key("GET", "http://api.test", {"q": "a"}, "creds-1")
+    assert key == ResponseCache.make_key("get", "http://api.test", {"q": "a"}, "creds-1")
+    assert key != ResponseCache.make_key("GET", "http://api.test", {"q": "b"}, "creds-1")
+    assert key != ResponseCache.make_key("GET", "http://api.test", {"q": "a"}, "creds-2")
+
+
+@pytest.mark.asyncio
+async def test_no_store_and_errors_not_cached():
+    cache = ResponseCache()
+    calls = []
+    fetch = make_fetch([(200, {"Cache-Control": "no-store"}, b"{}"), (500, {}, b"{}")], calls)
+
+    await cache.get_or_fetch("k", 60, fetch)
+    assert (await cache.get_or_fetch("k", 60, fetch)).status_code == 500
+    await cache.get_or_fetch("k", 60, fetch)
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_revalidated_with_etag():
+    cache = ResponseCache()
+    calls = []
+    fetch = make_fetch([(200, {"ETag": '"v1"', "Cache-Control": "max-age=0"}, b'{"t": 1}'),
+                        (304, {"Cache-Control": "max-age=60"}, b"")], calls)
+
+    await cache.get_or_fetch("k", 60, fetch)
+    response = await cache.get_or_fetch("k", 60, fetch)
+
+    assert calls == [{}, {"If-None-Match": '"v1"'}]
+    assert response.status_code == 200
+    assert response.json() == {"t": 1}
+    await cache.get_or_fetch("k", 60, fetch)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_shared_between_processes():
+    redis = FakeRedis()
+    calls = []
+    fetch = make_fetch([(200, {}, b'{"t": 1}')], calls)
+
+    await ResponseCache(redis=redis).get_or_fetch("k", 60, fetch)
+    response = await ResponseCache(redis=redis).get_or_fetch("k", 60, fetch)
+
+    assert len(calls) == 1
+    assert response.json() == {"t": 1}
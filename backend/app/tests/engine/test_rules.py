@@ -0,0 +1,64 @@
+"""Тесты для компиляции правил связей."""
+import pytest
+
+from app.engine.variables import compile_rule_value, replace_variables_universal
+from app.jqqb import RuleGroup, compile_rules
+
+CONTEXT = {
+    "user": {"name": "Ann", "age": "30", "limit": 18},
+    "message": {"text": "hello world"},
+    "items": [{"sku": "a"}, {"sku": "b"}],
+}
+
+
+def make_rule(field, operator, value, type_="string"):
+    return {"id": field, "field": field, "type": type_, "input": "text", "operator": operator, "value": value}
+
+
+RULE_SETS = [
+    {"condition": "AND", "rules": [make_rule("message.text", "begins_with", "hello")]},
+    {"condition": "AND", "rules": [
+        make_rule("user.age", "greater", "{$user.limit$}", "integer"),
+        make_rule("user.name", "equal", "Ann"),
+    ]},
+    {"condition": "OR", "rules": [
+        make_rule("user.name", "equal", "Bob"),
+        {"condition": "AND", "rules": [make_rule("items.sku", "equal", "b")]},
+    ]},
+    {"condition": "AND", "rules": [make_rule("user.age", "between", ["10", "{$user.limit$}"], "integer")]},
+    {"condition": "OR", "rules": [make_rule("{$message.field$}", "is_null", None)]},
+]
+
+
+@pytest.mark.parametrize("rule_set", RULE_SETS)
+@pytest.mark.asyncio
+async def test_compiled_rules_match_rule_group(rule_set):
+    """Тест совпадения предиката с подстановкой переменных и RuleGroup."""
+    context = dict(CONTEXT, message={"text": "hello world", "field": "user.missing"})
+    rendered = await replace_variables_universal(rule_set, context)
+
+    predicate = compile_rules(rule_set, compile_rule_value)
+
+    assert predicate(context) == RuleGroup(rendered).evaluate(context)
+
+
+def test_compiled_rules_resolve_variables_lazily():
+    """Тест подстановки переменных в момент проверки, а не компиляции."""
+    predicate = compile_rules(
+        {"condition": "AND", "rules": [make_rule("user.age", "greater", "{$user.limit$}", "integer")]},
+        compile_rule_value,
+    )
+
+    assert predicate(CONTEXT) is True
+    assert predicate(dict(CONTEXT, user={"age": "30", "limit": 40})) is False
+
+
+def test_compiled_rules_keep_short_circuit_for_invalid_rule():
+    """Тест ошибки некорректного правила только при его проверке."""
+    predicate = compile_rules('{"condition": "OR", "rules": ['
+                              '{"id": "x", "field": "user.name", "type": "string", "input": "text",'
+                              ' "operator": "equal", "value": "Ann"}, {"field": "broken"}]}')
+
+    assert predicate(CONTEXT) is True
+    with pytest.raises(KeyError):
+        predicate({"user": {"name": "Bob"}})
@@ -0,0 +1,159 @@
+"""Тесты выбора лидера планировщика и сверки задач эмиттеров с базой."""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+from apscheduler.triggers.cron import CronTrigger
+
+import app.scheduler as scheduler_module
+from app.engine.leader import _HOLD_SCRIPT, LeaderElection
+from app.engine.ordering import _RELEASE_SCRIPT
+from app.tests.engine.fakes import FakeRedis
+
+
+class LeaderRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.fail = False
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.fail:
+            raise ConnectionError("redis is down")
+        current = self.data.get(key)
+        if script == _HOLD_SCRIPT:
+            if current in (None, token):
+                self.data[key] = token
+                return 1
+            return 0
+        assert script == _RELEASE_SCRIPT
+        if current == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_single_leader_and_failover():
+    redis = LeaderRedis()
+    events = []
+
+    def callbacks(name):
+        async def elected():
+            events.append((name, "elected"))
+
+        async def revoked():
+            events.append((name, "revoked"))
+        return elected, revoked
+
+    first = LeaderElection(redis, "test", renew_interval=0.01)
+    second = LeaderElection(redis, "test", renew_interval=0.01)
+    first_task = asyncio.create_task(first.run(*callbacks("first")))
+    await asyncio.sleep(0.03)
+    second_task = asyncio.create_task(second.run(*callbacks("second")))
+    await asyncio.sleep(0.03)
+    assert (first.is_leader, second.is_leader) == (True, False)
+
+    # Остановка лидера освобождает ключ, его занимает вторая реплика
+    first_task.cancel()
+    await asyncio.gather(first_task, return_exceptions=True)
+    await asyncio.sleep(0.03)
+    assert second.is_leader
+
+    # Redis недоступен — лидерство снимается, не дожидаясь истечения ключа
+    redis.fail = True
+    await asyncio.sleep(0.03)
+    assert not second.is_leader
+    second_task.cancel()
+    await asyncio.gather(second_task, return_exceptions=True)
+
+    assert events == [("first", "elected"), ("first", "revoked"), ("second", "elected"), ("second", "revoked")]
+
+
+class FakeSession:
+    async def commit(self):
+        pass
+
+    async def refresh(self, obj):
+        pass
+
+
+def make_emitter(minute="*/5", job_id=None, **kwargs):
+    return SimpleNamespace(
+        id=uuid4(), name="emitter", is_active=True, job_id=job_id, needs_message_processing=True,
+        message_id=uuid4(), message=SimpleNamespace(id=uuid4()), bot_id=uuid4(),
+        cron_id=uuid4(), cron=SimpleNamespace(get_cron_trigger=lambda: CronTrigger(minute=minute)),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+async def emitter_scheduler(monkeypatch):
+    emitters = []
+
+    @asynccontextmanager
+    async def session():
+        yield FakeSession()
+
+    async def read_emitters(session):
+        return emitters
+
+    monkeypatch.setattr(scheduler_module.sessionmanager, "session", session)
+    monkeypatch.setattr(scheduler_module.crud_emitter, "read_emitters", read_emitters)
+    scheduler = scheduler_module.EmitterScheduler(jobstores={"default": MemoryJobStore()})
+    scheduler.emitters = emitters
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_on_election(emitter_scheduler):
+    scheduler = emitter_scheduler
+    await scheduler.start_scheduler(paused=True)
+    assert scheduler.state == STATE_PAUSED
+
+    kept, added = make_emitter(), make_emitter(minute="0")
+    scheduler.emitters.extend([kept, added])
+    await scheduler.add_emitter(FakeSession(), kept)
+    scheduler.add_job(scheduler_module.publish_emitter_message_batch, "interval", args=[{}], minutes=1, id="stale")
+    next_run_time = scheduler.get_job(kept.job_id).next_run_time
+
+    await scheduler.on_elected()
+
+    assert scheduler.state == STATE_RUNNING
+    assert {job.id for job in scheduler.get_jobs()} == {kept.job_id, added.job_id}
+    # Неизмененная задача не перепланируется
+    assert scheduler.get_job(kept.job_id).next_run_time == next_run_time
+
+    await scheduler.on_revoked()
+    assert scheduler.state == STATE_PAUSED
+
+
+@pytest.mark.asyncio
+async def test_update_and_delete_events(emitter_scheduler, monkeypatch):
+    scheduler = emitter_scheduler
+    await scheduler.start_scheduler(paused=True)
+    emitter = make_emitter()
+    await scheduler.update_emitter(FakeSession(), emitter)
+    assert scheduler.get_job(emitter.job_id) is not None
+
+    emitter.cron = SimpleNamespace(get_cron_trigger=lambda: CronTrigger(minute="30"))
+    await scheduler.update_emitter(FakeSession(), emitter)
+    assert str(scheduler.get_job(emitter.job_id).trigger) == str(CronTrigger(minute="30"))
+
+    emitter.is_active = False
+    await scheduler.update_emitter(FakeSession(), emitter)
+    assert scheduler.get_job(emitter.job_id).next_run_time is None
+
+    deleted = []
+
+    async def delete_emitter(session, emitter_id):
+        deleted.append(emitter_id)
+
+    monkeypatch.setattr(scheduler_module.crud_emitter, "delete_emitter", delete_emitter)
+    await scheduler.delete_emitter(FakeSession(), emitter)
+    assert scheduler.get_jobs() == []
+    assert deleted == [emitter.id]
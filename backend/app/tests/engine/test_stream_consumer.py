@@ -0,0 +1,84 @@
+"""Тесты для подтверждения и повторной доставки записей стрима."""
+import json
+
+import pytest
+
+from app.stream_consumer import StreamConsumer, decode_stream_fields
+from app.tests.engine.fakes import FakeRedis
+
+
+class StreamRedis(FakeRedis):
+    """Минимальная consumer group: PEL с числом доставок."""
+
+    def __init__(self, entries: dict, deliveries: dict):
+        super().__init__()
+        self.entries = entries
+        self.deliveries = deliveries
+        self.acked = []
+        self.xack_calls = 0
+        self.dead = []
+
+    async def xack(self, stream, group, *ids):
+        self.xack_calls += 1
+        self.acked.extend(ids)
+        for msg_id in ids:
+            self.deliveries.pop(msg_id, None)
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=None):
+        for msg_id in self.deliveries:
+            self.deliveries[msg_id] += 1
+        return [b"0-0", [(msg_id, self.entries.get(msg_id)) for msg_id in self.deliveries], []]
+
+    async def xpending_range(self, stream, group, min, max, count):
+        return [{"message_id": min, "times_delivered": self.deliveries[min]}] if min in self.deliveries else []
+
+    async def xadd(self, stream, fields, maxlen=None, approximate=True):
+        self.dead.append((stream, fields))
+
+
+def make_consumer(redis, handled):
+    async def handle(payload):
+        handled.append(payload)
+        return payload.get("ok", False)
+
+    return StreamConsumer(redis, "user_messages", "user_group", "consumer-1", handle, max_deliveries=2)
+
+
+@pytest.mark.asyncio
+async def test_process_acks_only_successful_entries_in_one_call():
+    """Тест одного XACK на батч только для успешных записей."""
+    redis = StreamRedis({}, {b"1-0": 1, b"2-0": 1, b"3-0": 1})
+    consumer = make_consumer(redis, [])
+
+    await consumer.process([(b"1-0", {"ok": True}), (b"2-0", {"ok": False}), (b"3-0", {"ok": True})])
+
+    assert redis.acked == [b"1-0", b"3-0"]
+    assert redis.xack_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_reclaim_retries_and_dead_letters_after_max_deliveries():
+    """Тест повторной обработки и переноса в dead-letter стрим."""
+    fields = {b"__data__": json.dumps({"data": json.dumps({"ok": False}), "headers": {}}).encode()}
+    redis = StreamRedis({b"1-0": fields, b"2-0": {b"message": b"raw", b"ok": b""}}, {b"1-0": 1, b"2-0": 1})
+    handled = []
+    consumer = make_consumer(redis, handled)
+
+    await consumer.reclaim()
+    assert handled == [{"ok": False}, {"message": "raw", "ok": ""}]
+    assert not redis.dead
+
+    await consumer.reclaim()
+    assert len(handled) == 2
+    assert [stream for stream, _ in redis.dead] == ["user_messages:dead", "user_messages:dead"]
+    assert redis.dead[0][1]["source_id"] == b"1-0"
+    assert not redis.deliveries
+
+
+def test_decode_stream_fields():
+    """Тест декодирования записи брокера и сырой записи xadd."""
+    body = {"channel_id": "c", "message": {"text": "hi"}}
+    fields = {b"__data__": json.dumps({"data": json.dumps(body), "headers": {}}).encode()}
+
+    assert decode_stream_fields(fields) == body
+    assert decode_stream_fields({b"channel_id": b"init"}) == {"channel_id": "init"}
@@ -0,0 +1,132 @@
+"""Тесты для общего кеша access-токенов."""
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.auth.cache import TokenCache
+from app.auth.types import AccessToken
+from app.managers.local_cache import LocalCache
+from app.tests.engine.fakes import FakeRedis
+
+KEY = {"bot_id": "bot-1", "provider": "google", "profile": "default", "strategy": "oauth"}
+
+
+class Exchange:
+    """Счетчик обменов токена."""
+
+    def __init__(self, lifetime: float = 3600, delay: float = 0):
+        self.calls = 0
+        self.lifetime = lifetime
+        self.delay = delay
+
+    async def __call__(self) -> AccessToken:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return AccessToken(access_token=f"token-{self.calls}", expires_at=time.time() + self.lifetime)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_exchange():
+    """Тест объединения параллельных промахов по одному ключу."""
+    cache = TokenCache()
+    exchange = Exchange(delay=0.01)
+
+    tokens = await asyncio.gather(*(cache.get_or_fetch(**KEY, fetch=exchange) for _ in range(5)))
+
+    assert exchange.calls == 1
+    assert {token.access_token for token in tokens} == {"token-1"}
+    assert (await cache.get_or_fetch(**KEY, fetch=exchange)).access_token == "token-1"
+
+
+@pytest.mark.asyncio
+async def test_credentials_are_part_of_key():
+    """Тест раздельных токенов для разных учетных записей одного провайдера."""
+    cache = TokenCache()
+    exchange = Exchange()
+
+    first = await cache.get_or_fetch(**KEY, credentials_id="cred-1", fetch=exchange)
+    second = await cache.get_or_fetch(**KEY, credentials_id="cred-2", fetch=exchange)
+
+    assert first.access_token != second.access_token
+
+
+@pytest.mark.asyncio
+async def test_token_refreshed_in_background_before_expiry():
+    """Тест фонового обновления токена, который скоро истечет."""
+    cache = TokenCache(refresh_before=300)
+    exchange = Exchange(lifetime=120)
+
+    first = await cache.get_or_fetch(**KEY, fetch=exchange)
+    second = await cache.get_or_fetch(**KEY, fetch=exchange)
+    await asyncio.sleep(0.01)
+
+    assert second is first
+    assert exchange.calls == 2
+    assert cache.get(**KEY).access_token == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_redis_tier_shared_between_caches(monkeypatch):
+    """Тест использования токена, полученного другой репликой."""
+    monkeypatch.setattr("app.utils.secret_box.encrypt_dict_to_blob", json.dumps)
+    monkeypatch.setattr("app.utils.secret_box.decrypt_blob_to_dict", json.loads)
+    redis = FakeRedis()
+    exchange = Exchange()
+
+    await TokenCache(redis=redis).get_or_fetch(**KEY, fetch=exchange)
+    token = await TokenCache(redis=redis).get_or_fetch(**KEY, fetch=exchange)
+
+    assert exchange.calls == 1
+    assert token.access_token == "token-1"
+
+
+@pytest.mark.asyncio
+async def test_static_token_kept_for_static_ttl(monkeypatch):
+    """Тест ограниченного срока хранения токена без expires_at."""
+    cache = TokenCache(static_ttl=60)
+    calls = []
+
+    async def exchange():
+        calls.append(1)
+        return AccessToken(access_token=f"static-{len(calls)}", expires_at=None)
+
+    await cache.get_or_fetch(**KEY, fetch=exchange)
+    assert (await cache.get_or_fetch(**KEY, fetch=exchange)).access_token == "static-1"
+
+    now = time.time()
+    monkeypatch.setattr(TokenCache, "_now", staticmethod(lambda: now + 61))
+    assert (await cache.get_or_fetch(**KEY, fetch=exchange)).access_token == "static-2"
+
+
+@pytest.mark.asyncio
+async def test_invalidation_message_drops_credential_tokens():
+    """Тест сброса токенов кредов по сообщению канала инвалидаций."""
+    cache = TokenCache()
+    local = LocalCache()
+    local.on_invalidate(TokenCache.REDIS_PREFIX, cache._on_invalidate)
+    exchange = Exchange()
+    other = {**KEY, "provider": "yandex_id"}
+    await cache.get_or_fetch(**KEY, fetch=exchange)
+    await cache.get_or_fetch(**other, fetch=exchange)
+
+    local._notify(TokenCache.invalidation_key(KEY["bot_id"], KEY["provider"], KEY["strategy"]))
+
+    assert cache.get(**KEY) is None
+    assert cache.get(**other) is not None
+
+
+@pytest.mark.asyncio
+async def test_exchange_in_flight_during_invalidation_is_not_cached():
+    """Тест: токен, полученный по старым кредам, не попадает в кеш."""
+    cache = TokenCache()
+    exchange = Exchange(delay=0.02)
+    task = asyncio.create_task(cache.get_or_fetch(**KEY, fetch=exchange))
+    await asyncio.sleep(0)
+
+    cache.invalidate(KEY["bot_id"], KEY["provider"])
+
+    assert (await task).access_token == "token-1"
+    assert cache.get(**KEY) is None
+    assert TokenCache.redis_pattern("bot-1", "google") == "auth:token:bot-1:google:*"
@@ -0,0 +1,87 @@
+"""Тесты для подстановки и сохранения переменных."""
+import pytest
+
+from app.engine.variables import (
+    TemplateCache,
+    VariablesChanges,
+    compile_template,
+    replace_variables_universal,
+    update_variables_dict,
+)
+
+
+@pytest.mark.asyncio
+async def test_update_variables_dict_marks_changed_keys():
+    """Тест отметки изменённых ключей при сохранении переменных."""
+    changes = VariablesChanges()
+    all_variables = {"bot": {"id": "bot-1", "counter": 1}, "user": {"id": "user-1"}, "session": {}}
+
+    updated = await update_variables_dict(
+        all_variables, None, {"answer.text": "session.last.answer"},
+        {"answer": {"text": "hello"}}, changes,
+    )
+
+    assert updated["session"] == {"last": {"answer": "hello"}}
+    assert changes.namespaces == ["session"]
+    assert changes.patches(updated) == {"session": {"last": {"answer": "hello"}}}
+
+
+def test_changes_ignore_unknown_namespaces():
+    """Тест игнорирования пространств имен, которые не сохраняются в БД."""
+    changes = VariablesChanges()
+    changes.mark_dict({"template": {"x": 1}, "user": {"name": "Ann"}})
+
+    assert changes.namespaces == ["user"]
+    assert changes.patches({"user": {"id": "user-1", "name": "Ann"}}) == {"user": {"name": "Ann"}}
+
+
+def test_changes_whole_namespace():
+    """Тест отметки пространства имен целиком."""
+    changes = VariablesChanges()
+    changes.mark("channel", "topic")
+    changes.mark("channel")
+
+    assert changes.patches({"channel": {"topic": "a", "mode": "b"}}) == {"channel": {"topic": "a", "mode": "b"}}
+    changes.clear()
+    assert not changes
+
+
+CONTEXT = {
+    "user": {"name": "Ann", "age": 30, "tags": ["a", "b"]},
+    "bot": {"flag": True, "empty": None},
+}
+
+
+@pytest.mark.parametrize("data", [
+    "Hello, {$user.name$}!",
+    "{$user.age$}",
+    "{$user.tags$}",
+    "{$bot.flag$}",
+    "{$bot.empty$}",
+    "{$user.missing$} and {$user.name$}",
+    "no variables",
+    {"{$user.name$}": {"age": "{$user.age$}", "list": ["{$user.tags$}", 1, None]}},
+    ["plain", {"nested": "{$user.name$} is {$user.age$}"}, 3.5],
+])
+@pytest.mark.asyncio
+async def test_compiled_template_matches_universal_replace(data):
+    """Тест совпадения рендера скомпилированного шаблона и прямой подстановки."""
+    assert compile_template(data).render(CONTEXT) == await replace_variables_universal(data, CONTEXT)
+
+
+def test_template_cache_compiles_once():
+    """Тест повторного использования скомпилированного шаблона владельца."""
+    cache = TemplateCache()
+    owner = object()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"text": "{$user.name$}"}
+
+    first = cache.get(owner, "message", build)
+    second = cache.get(owner, "message", build)
+
+    assert first is second
+    assert len(calls) == 1
+    assert first.render(CONTEXT) == {"text": "Ann"}
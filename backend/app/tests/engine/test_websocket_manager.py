@@ -0,0 +1,104 @@
+"""Тесты неблокирующей рассылки WebSocket-менеджера."""
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from app.managers.websocket import WebSocketManagerBase
+from app.managers.websocket.connection import DISCONNECT, DROP_OLDEST
+from app.tests.engine.fakes import FakeWebSocket
+
+
+class CountingMessage(BaseModel):
+    text: str
+    dumps: int = 0
+
+    def model_dump_json(self, **kwargs):
+        CountingMessage.calls += 1
+        return super().model_dump_json(**kwargs)
+
+
+CountingMessage.calls = 0
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_others():
+    manager = WebSocketManagerBase(queue_size=10)
+    slow = FakeWebSocket(blocked=True)
+    fast = FakeWebSocket()
+    await manager.add_connection("c1", "slow", slow)
+    await manager.add_connection("c1", "fast", fast)
+    other = FakeWebSocket()
+    await manager.add_connection("c2", "other", other)
+
+    await asyncio.wait_for(manager.notify("c1", "one"), timeout=0.1)
+    await asyncio.wait_for(manager.notify("c2", "two"), timeout=0.1)
+    await settle()
+
+    assert fast.sent == ["one"]
+    assert other.sent == ["two"]
+    assert slow.sent == []
+    slow.release.set()
+    await settle()
+    assert slow.sent == ["one"]
+
+    for entity_id, key in (("c1", "slow"), ("c1", "fast"), ("c2", "other")):
+        await manager.remove_connection(entity_id, key)
+    assert manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_message_serialized_once_per_broadcast():
+    manager = WebSocketManagerBase()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for i, websocket in enumerate(sockets):
+        await manager.add_connection("c1", str(i), websocket)
+    CountingMessage.calls = 0
+
+    await manager.notify("c1", CountingMessage(text="hi"))
+    await settle()
+
+    assert CountingMessage.calls == 1
+    assert all(websocket.sent == ['{"text":"hi","dumps":0}'] for websocket in sockets)
+    for i in range(3):
+        await manager.remove_connection("c1", str(i))
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_latest_messages():
+    manager = WebSocketManagerBase(queue_size=2, slow_consumer_policy=DROP_OLDEST)
+    websocket = FakeWebSocket(blocked=True)
+    await manager.add_connection("c1", "u", websocket)
+    await settle()
+
+    await manager.notify("c1", "1")
+    await settle()
+    # Первое сообщение уже у писателя, в очереди помещаются два
+    for text in ("2", "3", "4"):
+        await manager.notify("c1", text)
+    websocket.release.set()
+    await settle()
+
+    assert websocket.sent == ["1", "3", "4"]
+    assert manager.active_connections["c1"]["u"].dropped == 1
+    await manager.remove_connection("c1", "u")
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_closes_slow_consumer():
+    manager = WebSocketManagerBase(queue_size=1, slow_consumer_policy=DISCONNECT)
+    websocket = FakeWebSocket(blocked=True)
+    await manager.add_connection("c1", "u", websocket)
+    await settle()
+
+    for text in ("1", "2", "3"):
+        await manager.notify("c1", text)
+    await settle()
+
+    assert websocket.closed_with == 1013
+    assert "c1" not in manager.active_connections
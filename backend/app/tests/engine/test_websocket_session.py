@@ -0,0 +1,130 @@
+"""Тесты WebSocket-сессии: heartbeat, простой и подписки по кадрам клиента."""
+import asyncio
+import json
+
+import pytest
+from fastapi import WebSocketDisconnect, WebSocketException
+
+from app.api.routes import sockets
+from app.api.routes.sockets import WebSocketSession, websocket_handler
+from app.config import settings
+from app.managers.websocket import BotWebSocketManager, ChannelWebSocketManager
+from app.tests.engine.fakes import FakeWebSocket
+
+
+@pytest.fixture
+def managers(monkeypatch):
+    channel_manager, bot_manager = ChannelWebSocketManager(), BotWebSocketManager()
+    monkeypatch.setattr(sockets, "websocket_managers", {"channel": channel_manager, "bot": bot_manager})
+
+    async def authorize(entity_type, entity_id, token):
+        if entity_id == "forbidden":
+            raise WebSocketException(code=1008, reason="Нет доступа к каналу")
+        return {"user": {"id": "u"}, "entity": {"id": entity_id}}
+
+    monkeypatch.setattr(sockets, "authorize_subscription", authorize)
+    return channel_manager, bot_manager
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_subscribe_frames_multiplex_entities(managers):
+    channel_manager, bot_manager = managers
+    websocket = FakeWebSocket()
+    auth_data = {"user": {"id": "u", "connection_uuid": "conn"}, "entity": {"id": "c1"}}
+    handler = asyncio.create_task(websocket_handler(websocket, auth_data, channel_manager))
+    await settle()
+
+    for frame in ({"type": "subscribe", "entity_type": "bot", "entity_id": "b1"},
+                  {"type": "subscribe", "entity_type": "channel", "entity_id": "forbidden"},
+                  {"type": "ping"}):
+        websocket.incoming.put_nowait(json.dumps(frame))
+    await settle()
+    await channel_manager.notify("c1", {"text": "from channel"})
+    await bot_manager.notify("b1", {"text": "from bot"})
+    await settle()
+
+    assert {"type": "subscribed", "entity_type": "bot", "entity_id": "b1"} in websocket.frames
+    assert any(frame.get("reason") == "Нет доступа к каналу" for frame in websocket.frames)
+    assert {"type": "pong"} in websocket.frames
+    assert {"text": "from channel"} in websocket.frames and {"text": "from bot"} in websocket.frames
+    # Обе подписки идут через одну очередь соединения
+    assert channel_manager.active_connections["c1"]["conn"] is bot_manager.active_connections["b1"]["conn"]
+
+    websocket.incoming.put_nowait(json.dumps({"type": "unsubscribe", "entity_type": "bot", "entity_id": "b1"}))
+    await settle()
+    assert "b1" not in bot_manager.active_connections
+
+    websocket.incoming.put_nowait(WebSocketDisconnect)
+    await asyncio.wait_for(handler, timeout=1)
+    assert channel_manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_idle_connection_pinged_then_closed(managers, monkeypatch):
+    channel_manager, _ = managers
+    monkeypatch.setattr(settings, "WS_PING_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.05)
+    websocket = FakeWebSocket()
+    websocket.query_params["heartbeat"] = "1"
+    session = WebSocketSession(websocket, "conn", "t")
+    session.connection = channel_manager.open_connection(websocket)
+    await session.subscribe("channel", "c1")
+
+    await asyncio.wait_for(session.receive_loop(), timeout=1)
+    await session.close()
+
+    assert {"type": "ping"} in websocket.frames
+    assert websocket.closed_with == 1001
+    assert channel_manager.active_connections == {}
+
+
+@pytest.mark.asyncio
+async def test_listen_only_client_not_pinged_or_closed(managers, monkeypatch):
+    channel_manager, _ = managers
+    monkeypatch.setattr(settings, "WS_PING_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.05)
+    websocket = FakeWebSocket()
+    session = WebSocketSession(websocket, "conn", "t")
+    session.connection = channel_manager.open_connection(websocket)
+    await session.subscribe("channel", "c1")
+    loop_task = asyncio.create_task(session.receive_loop())
+
+    await asyncio.sleep(0.1)
+    await channel_manager.notify("c1", {"text": "hi"})
+    await settle()
+
+    # Клиент старого протокола только слушает: в потоке нет ping, соединение живо
+    assert not loop_task.done()
+    assert websocket.frames == [{"text": "hi"}]
+    assert websocket.closed_with is None
+
+    websocket.incoming.put_nowait(WebSocketDisconnect)
+    with pytest.raises(WebSocketDisconnect):
+        await loop_task
+    await session.close()
+
+
+@pytest.mark.asyncio
+async def test_client_frames_keep_connection_alive(managers, monkeypatch):
+    channel_manager, _ = managers
+    monkeypatch.setattr(settings, "WS_PING_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT", 0.05)
+    websocket = FakeWebSocket()
+    session = WebSocketSession(websocket, "conn", "t")
+    session.connection = channel_manager.open_connection(websocket)
+    loop_task = asyncio.create_task(session.receive_loop())
+
+    for _ in range(8):
+        websocket.incoming.put_nowait(json.dumps({"type": "pong"}))
+        await asyncio.sleep(0.02)
+    assert not loop_task.done()
+
+    websocket.incoming.put_nowait(WebSocketDisconnect)
+    with pytest.raises(WebSocketDisconnect):
+        await loop_task
+    await session.close()
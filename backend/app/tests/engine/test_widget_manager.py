@@ -0,0 +1,101 @@
+"""Тесты хранения готовых виджетов по хешу содержимого."""
+import pytest
+
+from app.managers import widget_manager
+from app.managers.local_cache import local_cache
+from app.managers.widget_manager import SQL_INSERT_RENDERED, WidgetManager, widget_content_hash
+from app.tests.engine.fakes import FakeEngine, FakeRedis
+from app.utils.widget import prepare_widget_copy_data
+
+TEMPLATE = {"id": "tpl", "name": "Card", "description": "", "body": "<b>{$user.name$}</b>", "css": "", "js": "",
+            "owner_id": None, "is_render": False, "parent_widget_id": None}
+
+
+class WidgetTable(FakeEngine):
+    """Таблица widget с уникальным content_hash."""
+
+    def __init__(self):
+        super().__init__(self.insert_rendered)
+        self.rows = {}
+
+    def insert_rendered(self, statement, params):
+        assert statement == SQL_INSERT_RENDERED
+        return [self.rows.setdefault(params["content_hash"], {**params, "is_render": True})]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(monkeypatch):
+    monkeypatch.setattr(local_cache, "_listening", True)
+    WidgetManager._rendered.clear()
+    yield
+    WidgetManager._rendered.clear()
+
+
+def render(body):
+    return prepare_widget_copy_data({**TEMPLATE, "body": body})
+
+
+def test_hash_depends_on_content_only():
+    assert widget_content_hash(render("a")) == widget_content_hash({**render("a"), "created_at": "x"})
+    assert widget_content_hash(render("a")) != widget_content_hash(render("b"))
+
+
+@pytest.mark.asyncio
+async def test_identical_render_shares_row():
+    engine = WidgetTable()
+    manager = WidgetManager(engine)
+
+    first = await manager.insert_rendered(render("<b>Ann</b>"))
+    second = await manager.insert_rendered(render("<b>Ann</b>"))
+    other = await manager.insert_rendered(render("<b>Bob</b>"))
+
+    assert first["id"] == second["id"]
+    assert other["id"] != first["id"]
+    assert first["parent_widget_id"] == "tpl"
+    assert len(engine.rows) == 2
+    # Повтор из кеша процесса не ходит в базу
+    assert len(engine.executed) == 2
+
+
+@pytest.mark.asyncio
+async def test_existing_row_reused_across_processes():
+    engine = WidgetTable()
+    first = await WidgetManager(engine).insert_rendered(render("<b>Ann</b>"))
+    WidgetManager._rendered.clear()
+
+    second = await WidgetManager(engine).insert_rendered(render("<b>Ann</b>"))
+
+    assert second["id"] == first["id"]
+    assert len(engine.rows) == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_row_evicted_in_all_processes(monkeypatch):
+    engine = WidgetTable()
+    redis = FakeRedis()
+    monkeypatch.setattr("app.redis_pool.cache_redis", lambda: redis)
+    data = render("<b>Ann</b>")
+    content_hash = widget_content_hash(data)
+    await WidgetManager(engine).insert_rendered(data)
+
+    await widget_manager.forget_rendered_widget(content_hash)
+
+    assert content_hash not in WidgetManager._rendered
+    assert redis.published == [(widget_manager.INVALIDATION_CHANNEL, "widget:rendered:" + content_hash)]
+
+    # Сброс от другого процесса приходит через подписку LocalCache
+    await WidgetManager(engine).insert_rendered(data)
+    local_cache._notify("widget:rendered:" + content_hash)
+    assert content_hash not in WidgetManager._rendered
+
+
+@pytest.mark.asyncio
+async def test_cache_unused_without_invalidation_listener(monkeypatch):
+    monkeypatch.setattr(local_cache, "_listening", False)
+    engine = WidgetTable()
+
+    await WidgetManager(engine).insert_rendered(render("<b>Ann</b>"))
+    await WidgetManager(engine).insert_rendered(render("<b>Ann</b>"))
+
+    assert len(engine.executed) == 2
+    assert not WidgetManager._rendered
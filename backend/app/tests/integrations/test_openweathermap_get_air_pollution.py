@@ -75,9 +75,8 @@ async def test_air_pollution_execute_success(air_pollution_integration, credenti
         ]
     }
     
-    with patch('app.integrations.openweathermap.get_air_pollution.httpx') as mock_httpx:
+    with patch('app.integrations.openweathermap.get_air_pollution.http_clients') as mock_http_clients:
         # Мокаем geocoding для названия города
-        mock_client = AsyncMock()
         mock_geocode_response = MagicMock()
         mock_geocode_response.status_code = 200
         mock_geocode_response.json.return_value = [
@@ -90,10 +89,7 @@ async def test_air_pollution_execute_success(air_pollution_integration, credenti
         mock_air_response.headers.get.return_value = "application/json"
         
         # Первый вызов - geocoding, второй - air pollution
-        mock_client.get = AsyncMock(side_effect=[mock_geocode_response, mock_air_response])
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(side_effect=[mock_geocode_response, mock_air_response])
         
         result = await air_pollution_integration.execute(
             config={
@@ -109,7 +105,7 @@ async def test_air_pollution_execute_success(air_pollution_integration, credenti
         assert len(result["response"]["result"]["list"]) == 1
         assert result["response"]["result"]["list"][0]["main"]["aqi"] == 2
         # Проверяем, что было 2 вызова: geocoding и air pollution
-        assert mock_client.get.call_count == 2
+        assert mock_http_clients.request.call_count == 2
 
 
 @pytest.mark.asyncio
@@ -120,16 +116,12 @@ async def test_air_pollution_execute_with_coordinates(air_pollution_integration,
         "list": [{"dt": 1609459200, "main": {"aqi": 2}, "components": {}}]
     }
     
-    with patch('app.integrations.openweathermap.get_air_pollution.httpx') as mock_httpx:
-        mock_client = AsyncMock()
+    with patch('app.integrations.openweathermap.get_air_pollution.http_clients') as mock_http_clients:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = mock_response_data
         mock_response.headers.get.return_value = "application/json"
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(return_value=mock_response)
         
         result = await air_pollution_integration.execute(
             config={
@@ -142,9 +134,9 @@ async def test_air_pollution_execute_with_coordinates(air_pollution_integration,
         
         assert result["response"]["ok"] is True
         # С координатами должен быть только один вызов (без geocoding)
-        assert mock_client.get.call_count == 1
-        call_args = mock_client.get.call_args
-        assert "air_pollution" in call_args[0][0]
+        assert mock_http_clients.request.call_count == 1
+        call_args = mock_http_clients.request.call_args
+        assert "air_pollution" in call_args[0][1]
 
 
 @pytest.mark.asyncio
@@ -167,16 +159,12 @@ async def test_air_pollution_execute_no_credentials(air_pollution_integration, l
 @pytest.mark.asyncio
 async def test_air_pollution_execute_api_error(air_pollution_integration, credentials_resolver, logger, bot_id):
     """Тест обработки ошибки API."""
-    with patch('app.integrations.openweathermap.get_air_pollution.httpx') as mock_httpx:
-        mock_client = AsyncMock()
+    with patch('app.integrations.openweathermap.get_air_pollution.http_clients') as mock_http_clients:
         mock_response = MagicMock()
         mock_response.status_code = 401
         mock_response.json.return_value = {"message": "Invalid API key"}
         mock_response.headers.get.return_value = "application/json"
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(return_value=mock_response)
         
         result = await air_pollution_integration.execute(
             config={
@@ -76,16 +76,12 @@ async def test_daily_forecast_execute_success(daily_forecast_integration, creden
         ]
     }
     
-    with patch('app.integrations.openweathermap.get_daily_forecast.httpx') as mock_httpx:
-        mock_client = AsyncMock()
+    with patch('app.integrations.openweathermap.get_daily_forecast.http_clients') as mock_http_clients:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = mock_response_data
         mock_response.headers.get.return_value = "application/json"
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(return_value=mock_response)
         
         result = await daily_forecast_integration.execute(
             config={
@@ -102,7 +98,7 @@ async def test_daily_forecast_execute_success(daily_forecast_integration, creden
         assert result["response"]["ok"] is True
         assert result["response"]["result"]["city"]["name"] == "Moscow"
         assert result["response"]["result"]["cnt"] == 7
-        mock_client.get.assert_called_once()
+        mock_http_clients.request.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -116,16 +112,12 @@ async def test_daily_forecast_execute_with_city_name(daily_forecast_integration,
         "list": []
     }
     
-    with patch('app.integrations.openweathermap.get_daily_forecast.httpx') as mock_httpx:
-        mock_client = AsyncMock()
+    with patch('app.integrations.openweathermap.get_daily_forecast.http_clients') as mock_http_clients:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = mock_response_data
         mock_response.headers.get.return_value = "application/json"
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(return_value=mock_response)
         
         result = await daily_forecast_integration.execute(
             config={
@@ -139,6 +131,6 @@ async def test_daily_forecast_execute_with_city_name(daily_forecast_integration,
         
         assert result["response"]["ok"] is True
         # Проверяем, что был вызван правильный endpoint
-        call_args = mock_client.get.call_args
-        assert "forecast/daily" in call_args[0][0]
+        call_args = mock_http_clients.request.call_args
+        assert "forecast/daily" in call_args[0][1]
 
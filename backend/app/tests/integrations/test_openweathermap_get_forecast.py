@@ -74,16 +74,12 @@ async def test_forecast_execute_success(forecast_integration, credentials_resolv
         ]
     }
     
-    with patch('app.integrations.openweathermap.get_forecast.httpx') as mock_httpx:
-        mock_client = AsyncMock()
+    with patch('app.integrations.openweathermap.get_forecast.http_clients') as mock_http_clients:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = mock_response_data
         mock_response.headers.get.return_value = "application/json"
-        mock_client.get = AsyncMock(return_value=mock_response)
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_httpx.AsyncClient.return_value = mock_client
+        mock_http_clients.request = AsyncMock(return_value=mock_response)
         
         result = await forecast_integration.execute(
             config={
@@ -99,7 +95,7 @@ async def test_forecast_execute_success(forecast_integration, credentials_resolv
         assert result["response"]["ok"] is True
         assert result["response"]["result"]["city"]["name"] == "Moscow"
         assert result["response"]["result"]["cnt"] == 40
-        mock_client.get.assert_called_once()
+        mock_http_clients.request.assert_called_once()
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,149 @@
+"""
+Сырые SQL-запросы движка на настоящем Postgres (фикстура engine из conftest.py).
+Тесты в tests/engine проверяют ту же логику на фейковом engine и сам SQL не исполняют.
+"""
+import asyncio
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+import app.crud.channel as crud_channel
+import app.crud.widget as crud_widget
+from app.managers.local_cache import local_cache
+from app.managers.message_manager import MessageManager
+from app.managers.widget_manager import WidgetManager
+from app.models.bot import BotModel
+from app.models.channel import ChannelModel
+from app.models.widget import WidgetModel
+from app.services.attachment_repository_sql import SqlAttachmentRepository
+from app.services.emitter_service import EmitterBroadcaster
+from app.services.media_service import MediaResolver
+from app.tests.utils import create_random_user, random_lower_string
+from app.utils.widget import prepare_widget_copy_data
+
+
+@pytest.fixture
+async def bot_in_channel(engine: AsyncEngine):
+    """Бот, подписанный на канал; данные закоммичены, их видят соединения менеджеров."""
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        user = await create_random_user(session)
+        bot = BotModel(name=random_lower_string(), owner_id=user.id)
+        channel = ChannelModel(name=random_lower_string(), owner_id=user.id, subscribers=[bot])
+        template = WidgetModel(name="Card", description="", body="<b>{$user.name$}</b>", css="", js="",
+                               owner_id=user.id)
+        session.add_all([bot, channel, template])
+        await session.commit()
+        return bot, channel, template
+
+
+@pytest.mark.asyncio
+async def test_insert_many_returns_rows_with_profiles(engine, bot_in_channel):
+    bot, channel, _ = bot_in_channel
+    rows = [{"text": f"message {i}", "params": {"n": i, "tags": ["a"]}, "channel_id": str(channel.id),
+             "sender_id": str(bot.id)} for i in range(3)]
+
+    inserted = await MessageManager(engine).insert_many(rows)
+
+    assert sorted(row["text"] for row in inserted) == ["message 0", "message 1", "message 2"]
+    assert {row["params"]["n"] for row in inserted} == {0, 1, 2}
+    assert all(row["sender"] == {"id": str(bot.id), "type": "bot", "name": bot.name} for row in inserted)
+    assert all(row["recipient"] == {} for row in inserted)
+
+
+@pytest.mark.asyncio
+async def test_attachments_get_many_skips_missing(engine):
+    repo = SqlAttachmentRepository(engine)
+    created = await repo.create(content_type="application/octet-stream", key=f"attachment/{random_lower_string()}.bin")
+
+    metas = await repo.get_many([str(created.id), str(uuid4())])
+
+    assert list(metas) == [str(created.id)]
+    assert metas[str(created.id)].key == created.key
+
+
+@pytest.mark.asyncio
+async def test_insert_rendered_shares_row_and_survives_conflict(engine, bot_in_channel):
+    _, _, template = bot_in_channel
+    body = f"<b>{random_lower_string()}</b>"
+
+    def render():
+        data = {column.name: getattr(template, column.name) for column in WidgetModel.__table__.columns}
+        return prepare_widget_copy_data({**data, "body": body})
+
+    # Кеш процесса выключен (нет подписки на инвалидации): оба вызова идут в базу,
+    # параллельный — через ON CONFLICT и повторный SELECT
+    first, second = await asyncio.gather(WidgetManager(engine).insert_rendered(render()),
+                                         WidgetManager(engine).insert_rendered(render()))
+    again = await WidgetManager(engine).insert_rendered(render())
+
+    assert first["id"] == second["id"] == again["id"]
+    assert first["is_render"] is True
+    assert str(first["parent_widget_id"]) == str(template.id)
+
+
+class HeadOnlyStorage:
+    async def head(self, key):
+        return {"key": key, "size": 1}
+
+
+@pytest.mark.asyncio
+async def test_media_resolves_key_by_file_name(engine):
+    file_name = f"{random_lower_string()}.bin"
+    await SqlAttachmentRepository(engine).create(content_type="application/octet-stream",
+                                                 key=f"attachment/2026/10/18/{file_name}")
+    resolver = MediaResolver(HeadOnlyStorage(), engine=engine)
+
+    assert (await resolver.by_name(file_name))["key"] == f"attachment/2026/10/18/{file_name}"
+    # Без записи в attachment — плоский ключ старых загрузок
+    assert (await resolver.by_name("legacy.bin"))["key"] == "attachment/legacy.bin"
+
+
+@pytest.mark.asyncio
+async def test_delete_channel_keeps_render_shared_with_other_channel(engine, bot_in_channel, monkeypatch):
+    _, channel, template = bot_in_channel
+    monkeypatch.setattr(local_cache, "_listening", True)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        other = ChannelModel(name=random_lower_string(), owner_id=channel.owner_id)
+        session.add(other)
+        await session.commit()
+    data = {column.name: getattr(template, column.name) for column in WidgetModel.__table__.columns}
+    widget = await WidgetManager(engine).insert_rendered(prepare_widget_copy_data({**data, "body": "<b>Ann</b>"}))
+    await MessageManager(engine).insert_many([
+        {"text": "hi", "params": {}, "channel_id": str(channel_id), "widget_id": str(widget["id"])}
+        for channel_id in (channel.id, other.id)
+    ])
+
+    # Рендер используется сообщением другого канала — строка остается и в кеше
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        assert await crud_channel.delete_channel(session, channel.id) == []
+        await session.commit()
+        assert await session.get(WidgetModel, widget["id"]) is not None
+    assert widget["content_hash"] in WidgetManager._rendered
+
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        content_hashes = await crud_channel.delete_channel(session, other.id)
+        await session.commit()
+        assert content_hashes == [widget["content_hash"]]
+        assert await session.get(WidgetModel, widget["id"]) is None
+    await crud_widget.forget_widgets(*content_hashes)
+    assert widget["content_hash"] not in WidgetManager._rendered
+
+
+@pytest.mark.asyncio
+async def test_emitter_templates_and_bot_channels(engine, bot_in_channel):
+    bot, channel, template = bot_in_channel
+    [message] = await MessageManager(engine).insert_many([
+        {"text": "Доброе утро", "params": {"a": 1}, "channel_id": str(channel.id), "widget_id": str(template.id)},
+    ])
+    missing_id = str(uuid4())
+    broadcaster = EmitterBroadcaster(engine=engine)
+
+    templates = await broadcaster._load_templates({str(message["id"]), missing_id})
+    bot_channels = await broadcaster._load_bot_channels({str(bot.id), missing_id})
+
+    assert templates[missing_id] is None
+    loaded = templates[str(message["id"])]
+    assert (loaded["text"], loaded["params"], str(loaded["channel_id"])) == ("Доброе утро", {"a": 1}, str(channel.id))
+    assert loaded["widget"]["id"] == str(template.id)
+    assert bot_channels == {str(bot.id): frozenset({str(channel.id)}), missing_id: frozenset()}
@@ -300,9 +300,8 @@ async def export_bot_structure(session: AsyncSession, bot: BotModel) -> dict:
     return json.loads(bot_schema.model_dump_json(exclude={"owner", "owner_id"}))
 
 from app.managers.data_manager import DataManager
-from redis.asyncio import Redis
-from app.config import settings
 from app.database import sessionmanager
+from app.redis_pool import cache_redis
 
 
 async def cache_structure_bot(session: AsyncSession, bot: BotModel) -> dict:
@@ -310,13 +309,10 @@ async def cache_structure_bot(session: AsyncSession, bot: BotModel) -> dict:
     bot.cache_structure = export_json
     await session.commit()
 
-    redis = Redis.from_url(settings.CACHE_REDIS_URL)
-
-    data_manager = DataManager(redis, sessionmanager.engine)
+    data_manager = DataManager(cache_redis(), sessionmanager.engine)
     await data_manager.update_bot(str(bot.id), export_json)
 
 
 async def update_cache_variables_bot(bot: BotModel):
-    redis = Redis.from_url(settings.CACHE_REDIS_URL)
-    data_manager = DataManager(redis, sessionmanager.engine)
+    data_manager = DataManager(cache_redis(), sessionmanager.engine)
     await data_manager.update_bot_variables(str(bot.id), bot.variables.data)
\ No newline at end of file
@@ -0,0 +1,58 @@
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def etag_response(request: Request, body: bytes, etag: str) -> Response:
+    """JSON-ответ с ETag; клиент с тем же If-None-Match получает 304 без тела."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class EtagCache:
+    """
+    Сериализованные JSON-ответы в памяти процесса вместе с ETag.
+    Параллельные промахи по одному ключу ждут одну сборку ответа.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[Hashable, tuple[float, bytes, str]] = {}
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+
+    async def get(self, key: Hashable, build: Callable[[], Awaitable[BaseModel | Any]]) -> tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1], entry[2]
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._build(key, build))
+            task.add_done_callback(lambda t: self._inflight.pop(key, None) if self._inflight.get(key) is t else None)
+        return await asyncio.shield(task)
+
+    async def _build(self, key: Hashable, build) -> tuple[bytes, str]:
+        data = await build()
+        body = data.model_dump_json().encode() if isinstance(data, BaseModel) else data
+        etag = make_etag(body)
+        self._entries[key] = (time.monotonic() + self.ttl, body, etag)
+        return body, etag
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -6,14 +6,13 @@ import app.crud.channel as crud_channel
 import app.engine.bot as bot_engine
 import app.crud.session as crud_session
 from app.managers.data_manager import DataManager
-from redis.asyncio import Redis
-from app.config import settings
 from app.database import sessionmanager
+from app.redis_pool import cache_redis
 
 
 async def update_subscribers_cache(channel):
     subscribers_ids = [{"id": sub.id} for sub in channel.subscribers if sub.is_bot()]
-    data_manager = DataManager(Redis.from_url(settings.CACHE_REDIS_URL), sessionmanager.engine)
+    data_manager = DataManager(cache_redis(), sessionmanager.engine)
     await data_manager.update_channel_subscribers(channel.id, subscribers_ids)
 
 
@@ -31,6 +30,7 @@ async def subscribe_to_channel(session: AsyncSession, channel_id: UUID | str, su
             await bot_engine.start_work_for_subscriber(session, channel, subscriber.id)
 
         await session.commit()
+        await invalidate_bot_channels(subscriber)
 
 
 async def unsubscribe_from_channel(session: AsyncSession, channel_id: UUID | str, subscriber_id: UUID | str):
@@ -46,3 +46,11 @@ async def unsubscribe_from_channel(session: AsyncSession, channel_id: UUID | str
             await session.delete(session_obj)
         await session.commit()
         await session.refresh(channel)
+        await invalidate_bot_channels(subscriber)
+
+
+async def invalidate_bot_channels(subscriber):
+    """Каналы бота кешируются рассылкой эмиттеров."""
+    from app.services.emitter_service import invalidate_emitter_cache
+    if subscriber.is_bot():
+        await invalidate_emitter_cache(bot_id=str(subscriber.id))